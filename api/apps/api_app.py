@@ -452,7 +452,7 @@ def upload():
             doc["parser_id"] = ParserType.AUDIO.value
         if re.search(r"\.(ppt|pptx|pages)$", filename):
             doc["parser_id"] = ParserType.PRESENTATION.value
-        if re.search(r"\.(eml)$", filename):
+        if re.search(r"\.(eml|mbox|mbx)$", filename):
             doc["parser_id"] = ParserType.EMAIL.value
 
         doc_result = DocumentService.insert(doc)
@@ -521,6 +521,6 @@ class FileService(CommonService):
             return ParserType.AUDIO.value
         if re.search(r"\.(ppt|pptx|pages)$", filename):
             return ParserType.PRESENTATION.value
-        if re.search(r"\.(eml)$", filename):
+        if re.search(r"\.(eml|mbox|mbx)$", filename):
             return ParserType.EMAIL.value
         return default
\ No newline at end of file
@@ -14,6 +14,9 @@
 #  limitations under the License.
 #
 import logging
+import os
+import threading
+import time
 
 from langfuse import Langfuse
 
@@ -296,6 +299,21 @@ class LLMBundle:
 
         return txt
 
+    def describe_batch(self, images, prompts=None):
+        if self.langfuse:
+            generation = self.trace.generation(name="describe_batch", metadata={"model": self.llm_name, "images": len(images)})
+
+        res = self.mdl.describe_batch(images, prompts)
+        txts = [txt for txt, _ in res]
+        used_tokens = sum(tk for _, tk in res)
+        if not TenantLLMService.increase_usage(self.tenant_id, self.llm_type, used_tokens):
+            logging.error("LLMBundle.describe_batch can't update token usage for {}/IMAGE2TEXT used_tokens: {}".format(self.tenant_id, used_tokens))
+
+        if self.langfuse:
+            generation.end(output={"output": txts}, usage_details={"total_tokens": used_tokens})
+
+        return txts
+
     def transcription(self, audio):
         if self.langfuse:
             generation = self.trace.generation(name="transcription", metadata={"model": self.llm_name})
@@ -381,3 +399,52 @@ class LLMBundle:
         if total_tokens > 0:
             if not TenantLLMService.increase_usage(self.tenant_id, self.llm_type, txt, self.llm_name):
                 logging.error("LLMBundle.chat_streamly can't update token usage for {}/CHAT llm_name: {}, content: {}".format(self.tenant_id, self.llm_name, txt))
+
+
+# Seconds a ParserContext is reused for, after which model changes of the tenant are picked up.
+PARSER_CONTEXT_TTL = int(os.environ.get("PARSER_CONTEXT_TTL", 60))
+
+
+class ParserContext:
+    """
+    Models of a tenant shared by the parser calls of the tasks, so that each call does not look up
+    the model configuration and check the langfuse keys again. Failed lookups are kept as well, by
+    their message only: each call raises a new LookupError rather than the first exception, whose
+    traceback would grow with every re-raise.
+    """
+
+    def __init__(self, tenant_id):
+        self.tenant_id = tenant_id
+        self.created = time.time()
+        self._bundles = {}
+        self._lock = threading.Lock()
+
+    def llm_bundle(self, llm_type, llm_name=None, lang="Chinese"):
+        key = (llm_type, llm_name, lang)
+        with self._lock:
+            if key not in self._bundles:
+                try:
+                    self._bundles[key] = LLMBundle(self.tenant_id, llm_type, llm_name=llm_name, lang=lang)
+                except Exception as e:
+                    logging.exception(f"Can't load the {llm_type} model {llm_name} of tenant {self.tenant_id}")
+                    self._bundles[key] = f"{type(e).__name__}: {e}"
+            bundle = self._bundles[key]
+        if isinstance(bundle, str):
+            raise LookupError(bundle)
+        return bundle
+
+
+_parser_contexts = {}
+_parser_contexts_lock = threading.Lock()
+
+
+def parser_context(tenant_id):
+    """The ParserContext of the tenant, renewed every PARSER_CONTEXT_TTL seconds."""
+    now = time.time()
+    with _parser_contexts_lock:
+        ctx = _parser_contexts.get(tenant_id)
+        if ctx is None or now - ctx.created > PARSER_CONTEXT_TTL:
+            for k in [k for k, c in _parser_contexts.items() if now - c.created > PARSER_CONTEXT_TTL]:
+                del _parser_contexts[k]
+            ctx = _parser_contexts[tenant_id] = ParserContext(tenant_id)
+        return ctx
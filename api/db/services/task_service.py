@@ -289,6 +289,18 @@ class TaskService(CommonService):
                 ).execute()
 
 
+def table_row_number(name, binary):
+    """Row count of a spreadsheet, computed once per file content and kept in Redis for re-parses."""
+    k = "table_row_number:" + xxhash.xxh64(binary).hexdigest()
+    rn = REDIS_CONN.get(k)
+    if rn is not None:
+        return int(rn)
+    rn = RAGFlowExcelParser.row_number(name, binary)
+    if rn is not None:
+        REDIS_CONN.set(k, str(rn), 7 * 24 * 3600)
+    return rn
+
+
 def queue_tasks(doc: dict, bucket: str, name: str, priority: int):
     """Create and queue document processing tasks.
     
@@ -336,7 +348,7 @@ def queue_tasks(doc: dict, bucket: str, name: str, priority: int):
 
     elif doc["parser_id"] == "table":
         file_bin = STORAGE_IMPL.get(bucket, name)
-        rn = RAGFlowExcelParser.row_number(doc["name"], file_bin)
+        rn = table_row_number(doc["name"], file_bin)
         for i in range(0, rn, 3000):
             task = new_task()
             task["from_page"] = i
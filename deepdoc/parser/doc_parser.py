@@ -0,0 +1,309 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Text of legacy Word 97-2003 (.doc) files, read in-process.
+
+A .doc file is an OLE2 compound file holding a `WordDocument` stream, whose header (FIB) points to
+the piece table of the text in the `0Table` or `1Table` stream. Paragraph properties (PAPX) tell
+table cells and row ends apart. Only the main document text is extracted: headers, footnotes,
+comments and embedded objects are skipped. Encrypted and pre-Word 97 files raise ValueError.
+"""
+import bisect
+import struct
+from html import escape
+
+MAXREGSECT = 0xFFFFFFFA
+
+sprmPFInTable = 0x2416
+sprmPFTtp = 0x2417
+sprmTDefTable = 0xD608
+
+# Characters without text of their own: field marks are handled separately.
+SPECIAL_CHARS = {
+    "\x0b": "\n",  # line break
+    "\x1e": "-",  # non-breaking hyphen
+    "\x1f": "",  # optional hyphen
+    "\xa0": " ",
+}
+
+
+class OleFile:
+    """Minimal reader of the streams stored at the top level of an OLE2 compound file."""
+
+    def __init__(self, data):
+        if data[:8] != b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1":
+            raise ValueError("Not an OLE2 compound file")
+        self.data = data
+        self.sector_size = 1 << struct.unpack_from("<H", data, 0x1E)[0]
+        self.mini_sector_size = 1 << struct.unpack_from("<H", data, 0x20)[0]
+        n_fat, first_dir = struct.unpack_from("<II", data, 0x2C)
+        self.mini_cutoff, first_minifat, n_minifat, first_difat, n_difat = struct.unpack_from("<IIIII", data, 0x38)
+
+        difat = list(struct.unpack_from("<109I", data, 0x4C))
+        sect, per_sector = first_difat, self.sector_size // 4 - 1
+        for _ in range(n_difat):
+            if sect > MAXREGSECT:
+                break
+            entries = struct.unpack_from(f"<{per_sector + 1}I", self._sector(sect))
+            difat.extend(entries[:-1])
+            sect = entries[-1]
+        fat_sectors = [s for s in difat[:n_fat] if s <= MAXREGSECT]
+        self.fat = []
+        for s in fat_sectors:
+            self.fat.extend(struct.unpack_from(f"<{self.sector_size // 4}I", self._sector(s)))
+
+        dirs = self._chain(first_dir, self.fat, self._sector)
+        self.entries = [dirs[i:i + 128] for i in range(0, len(dirs) - 127, 128)]
+        root = self._entry(0)
+        self.minifat = []
+        if n_minifat and first_minifat <= MAXREGSECT:
+            buf = self._chain(first_minifat, self.fat, self._sector)
+            self.minifat = list(struct.unpack_from(f"<{len(buf) // 4}I", buf))
+        self.mini_stream = self._chain(root["start"], self.fat, self._sector)[:root["size"]]
+
+        self.streams = {}
+        stack, seen = [root["child"]], set()
+        while stack:
+            i = stack.pop()
+            if i > MAXREGSECT or i >= len(self.entries) or i in seen:
+                continue
+            seen.add(i)
+            e = self._entry(i)
+            if e["type"] == 2:
+                self.streams[e["name"]] = e
+            stack.extend([e["left"], e["right"]])
+
+    def _sector(self, i):
+        off = (i + 1) * self.sector_size
+        return self.data[off:off + self.sector_size]
+
+    def _mini_sector(self, i):
+        off = i * self.mini_sector_size
+        return self.mini_stream[off:off + self.mini_sector_size]
+
+    def _chain(self, start, fat, read):
+        parts, seen = [], set()
+        while start <= MAXREGSECT and start not in seen:
+            seen.add(start)
+            parts.append(read(start))
+            if start >= len(fat):
+                break
+            start = fat[start]
+        return b"".join(parts)
+
+    def _entry(self, i):
+        e = self.entries[i]
+        name_len = struct.unpack_from("<H", e, 64)[0]
+        left, right, child = struct.unpack_from("<III", e, 68)
+        start, size = struct.unpack_from("<II", e, 116)
+        return {"name": e[:max(0, name_len - 2)].decode("utf-16-le", errors="ignore"), "type": e[66],
+                "left": left, "right": right, "child": child, "start": start, "size": size}
+
+    def exists(self, name):
+        return name in self.streams
+
+    def read(self, name):
+        e = self.streams[name]
+        if e["size"] < self.mini_cutoff:
+            return self._chain(e["start"], self.minifat, self._mini_sector)[:e["size"]]
+        return self._chain(e["start"], self.fat, self._sector)[:e["size"]]
+
+
+def _sprms(grpprl):
+    i = 0
+    while i + 2 <= len(grpprl):
+        sprm = struct.unpack_from("<H", grpprl, i)[0]
+        i += 2
+        spra = sprm >> 13
+        if spra in (0, 1):
+            size = 1
+        elif spra in (2, 4, 5):
+            size = 2
+        elif spra == 3:
+            size = 4
+        elif spra == 7:
+            size = 3
+        elif sprm == sprmTDefTable and i + 2 <= len(grpprl):
+            size = struct.unpack_from("<H", grpprl, i)[0] + 1
+        elif i < len(grpprl):
+            size = grpprl[i] + 1
+        else:
+            return
+        yield sprm, grpprl[i:i + size]
+        i += size
+
+
+class RAGFlowDocParser:
+
+    @staticmethod
+    def _pieces(word, table, ccp_text):
+        """Yield (text, first cp, fc of the first char, bytes per char) of the main document."""
+        fc_clx, lcb_clx = struct.unpack_from("<II", word, 0x01A2)
+        clx = table[fc_clx:fc_clx + lcb_clx]
+        i = 0
+        while i < len(clx) and clx[i] == 0x01:
+            i += 3 + struct.unpack_from("<H", clx, i + 1)[0]
+        if i >= len(clx) or clx[i] != 0x02:
+            raise ValueError("No piece table")
+        lcb = struct.unpack_from("<I", clx, i + 1)[0]
+        plc = clx[i + 5:i + 5 + lcb]
+        n = (len(plc) - 4) // 12
+        cps = struct.unpack_from(f"<{n + 1}I", plc)
+        for k in range(n):
+            cp_start, cp_end = cps[k], min(cps[k + 1], ccp_text)
+            if cp_start >= cp_end:
+                continue
+            fc = struct.unpack_from("<I", plc, 4 * (n + 1) + 8 * k + 2)[0]
+            if fc & 0x40000000:
+                fc = (fc & ~0x40000000) // 2
+                yield word[fc:fc + cp_end - cp_start].decode("cp1252", errors="replace"), cp_start, fc, 1
+            else:
+                yield word[fc:fc + 2 * (cp_end - cp_start)].decode("utf-16-le", errors="replace"), cp_start, fc, 2
+
+    @staticmethod
+    def _table_runs(word, table):
+        """Sorted [(fc start, fc end, in table, row end)] of the paragraph property runs."""
+        fc_plc, lcb_plc = struct.unpack_from("<II", word, 0x0102)
+        n = (lcb_plc - 4) // 8
+        if n <= 0:
+            return []
+        pns = struct.unpack_from(f"<{n}I", table, fc_plc + 4 * (n + 1))
+        runs = []
+        for pn in pns:
+            fkp = word[(pn & 0x3FFFFF) * 512:(pn & 0x3FFFFF) * 512 + 512]
+            if len(fkp) < 512:
+                continue
+            crun = fkp[511]
+            fcs = struct.unpack_from(f"<{crun + 1}I", fkp)
+            for r in range(crun):
+                b_off = fkp[4 * (crun + 1) + 13 * r] * 2
+                in_table = ttp = False
+                if b_off:
+                    cb = fkp[b_off]
+                    if cb:
+                        papx = fkp[b_off + 1:b_off + 2 * cb]
+                    else:
+                        papx = fkp[b_off + 2:b_off + 2 + 2 * fkp[b_off + 1]]
+                    for sprm, operand in _sprms(papx[2:]):
+                        if sprm == sprmPFInTable:
+                            in_table = operand[:1] == b"\x01"
+                        elif sprm == sprmPFTtp:
+                            ttp = operand[:1] == b"\x01"
+                runs.append((fcs[r], fcs[r + 1], in_table, ttp))
+        runs.sort()
+        return runs
+
+    def _blocks(self, binary):
+        """Yield ("p", text) for paragraphs and ("t", rows) for tables, in document order."""
+        ole = OleFile(binary)
+        if not ole.exists("WordDocument"):
+            raise ValueError("No WordDocument stream")
+        word = ole.read("WordDocument")
+        ident, nfib, _, _, _, flags = struct.unpack_from("<HHHHHH", word, 0)
+        if ident != 0xA5EC or nfib < 0x00C1:
+            raise ValueError("Not a Word 97-2003 document")
+        if flags & 0x0100:
+            raise ValueError("Encrypted document")
+        table_name = "1Table" if flags & 0x0200 else "0Table"
+        if not ole.exists(table_name):
+            raise ValueError(f"No {table_name} stream")
+        table = ole.read(table_name)
+        ccp_text = struct.unpack_from("<I", word, 76)[0]
+
+        runs = self._table_runs(word, table)
+        run_starts = [r[0] for r in runs]
+
+        def paragraph_props(fc):
+            i = bisect.bisect_right(run_starts, fc) - 1
+            if i >= 0 and fc < runs[i][1]:
+                return runs[i][2], runs[i][3]
+            return None, False
+
+        text, fields = [], []
+        cells, rows = [], []
+        for piece, _, fc, width in self._pieces(word, table, ccp_text):
+            for k, ch in enumerate(piece):
+                if ch == "\x13":
+                    fields.append(False)
+                    continue
+                if ch == "\x14":
+                    if fields:
+                        fields[-1] = True
+                    continue
+                if ch == "\x15":
+                    if fields:
+                        fields.pop()
+                    continue
+                if fields and not all(fields):
+                    continue
+                if ch not in "\r\x07\x0c":
+                    if ch in SPECIAL_CHARS:
+                        text.append(SPECIAL_CHARS[ch])
+                    elif ch == "\t" or ch >= " ":
+                        text.append(ch)
+                    continue
+
+                in_table, ttp = paragraph_props(fc + k * width)
+                para = "".join(text).strip()
+                text = []
+                if ch == "\x07" and ttp:
+                    rows.append(cells)
+                    cells = []
+                elif ch == "\x07":
+                    cells.append(para)
+                elif in_table:
+                    # a paragraph inside a cell, the cell mark ends it
+                    text = [para, "\n"] if para else []
+                else:
+                    if cells:
+                        rows.append(cells)
+                        cells = []
+                    if rows:
+                        yield "t", rows
+                        rows = []
+                    if para:
+                        yield "p", para
+        if cells:
+            rows.append(cells)
+        if rows:
+            yield "t", rows
+        para = "".join(text).strip()
+        if para:
+            yield "p", para
+
+    @staticmethod
+    def _html_table(rows):
+        html = "<table>"
+        for row in rows:
+            html += "<tr>" + "".join(f"<td>{escape(c)}</td>" for c in row) + "</tr>"
+        return html + "</table>"
+
+    def __call__(self, fnm, binary=None):
+        """
+        Returns (sections, tables): the paragraphs of the document and its tables as HTML.
+        """
+        if binary is None:
+            with open(fnm, "rb") as f:
+                binary = f.read()
+        elif hasattr(binary, "read"):
+            binary = binary.read()
+        sections, tables = [], []
+        for kind, block in self._blocks(binary):
+            if kind == "p":
+                sections.append(block)
+            else:
+                tables.append(self._html_table(block))
+        return sections, tables
@@ -24,7 +24,7 @@ from rag.nlp import find_codec
 class RAGFlowExcelParser:
 
     @staticmethod
-    def _load_excel_to_workbook(file_like_object):
+    def _load_excel_to_workbook(file_like_object, read_only=False):
         if isinstance(file_like_object, bytes):
             file_like_object = BytesIO(file_like_object)
 
@@ -45,7 +45,7 @@ class RAGFlowExcelParser:
                 raise Exception(f"****wxy: Failed to parse CSV and convert to Excel Workbook: {e_csv}")
 
         try:
-            return load_workbook(file_like_object,data_only= True)
+            return load_workbook(file_like_object, data_only=True, read_only=read_only)
         except Exception as e:
             logging.info(f"****wxy: openpyxl load error: {e}, try pandas instead")
             try:
@@ -55,6 +55,27 @@ class RAGFlowExcelParser:
             except Exception as e_pandas:
                 raise Exception(f"****wxy: pandas.read_excel error: {e_pandas}, original openpyxl error: {e}")
 
+    @staticmethod
+    def _reset_dimensions(ws):
+        """
+        Read-only sheets bound every iter_rows() by the dimension recorded in the file, which some
+        writers leave at A1: such a sheet would read as its first cell only. Forget that dimension
+        so the sheet is streamed to its actual end. Call it before reading the sheet.
+        """
+        if hasattr(ws, "reset_dimensions") and (ws.max_row is None or ws.max_row <= 1):
+            ws.reset_dimensions()
+
+    @staticmethod
+    def _sheet_rows(ws):
+        """
+        Number of rows of `ws`, taken from its recorded dimension when that can be trusted and
+        counted by streaming the sheet otherwise.
+        """
+        RAGFlowExcelParser._reset_dimensions(ws)
+        if ws.max_row is not None and ws.max_row > 1:
+            return ws.max_row
+        return sum(1 for _ in ws.iter_rows(values_only=True))
+
     @staticmethod
     def _dataframe_to_workbook(df):
         wb = Workbook()
@@ -132,15 +153,18 @@ class RAGFlowExcelParser:
     @staticmethod
     def row_number(fnm, binary):
         if fnm.split(".")[-1].lower().find("xls") >= 0:
-            wb = RAGFlowExcelParser._load_excel_to_workbook(BytesIO(binary))
+            wb = RAGFlowExcelParser._load_excel_to_workbook(BytesIO(binary), read_only=True)
             total = 0
             for sheetname in wb.sheetnames:
-                ws = wb[sheetname]
-                total += len(list(ws.rows))
+                total += RAGFlowExcelParser._sheet_rows(wb[sheetname])
+            wb.close()
             return total
 
         if fnm.split(".")[-1].lower() in ["csv", "txt"]:
             encoding = find_codec(binary)
+            if "\n".encode(encoding) == b"\n":
+                # No multi-byte character of these codecs contains the newline byte.
+                return binary.count(b"\n") + 1
             txt = binary.decode(encoding, errors="ignore")
             return len(txt.split("\n"))
 
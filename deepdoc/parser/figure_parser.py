@@ -13,13 +13,40 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
 
-
+import xxhash
 from PIL import Image
 
 from rag.app.picture import vision_llm_chunk as picture_vision_llm_chunk
 from rag.prompts import vision_llm_figure_describe_prompt
 
+# Figures of one tenant being described by its vision model at the same time, across all parses of the process.
+MAX_CONCURRENT_FIGURE_DESCRIPTIONS = int(os.environ.get("MAX_CONCURRENT_FIGURE_DESCRIPTIONS", 4))
+# Seconds a figure may spend in the vision model before the parse goes on without its description.
+FIGURE_DESCRIPTION_TIMEOUT = int(os.environ.get("FIGURE_DESCRIPTION_TIMEOUT", 180))
+
+_tenant_limiters = {}
+_tenant_limiters_lock = threading.Lock()
+
+
+def _tenant_limiter(tenant_id):
+    with _tenant_limiters_lock:
+        if tenant_id not in _tenant_limiters:
+            _tenant_limiters[tenant_id] = threading.BoundedSemaphore(MAX_CONCURRENT_FIGURE_DESCRIPTIONS)
+        return _tenant_limiters[tenant_id]
+
+
+def _figure_digest(img):
+    hasher = xxhash.xxh64()
+    hasher.update(f"{img.mode}{img.size}".encode("utf-8"))
+    hasher.update(img.tobytes())
+    return hasher.hexdigest()
+
 
 def vision_figure_parser_figure_data_wraper(figures_data_without_positions):
     return [(
@@ -31,6 +58,7 @@ def vision_figure_parser_figure_data_wraper(figures_data_without_positions):
 class VisionFigureParser:
     def __init__(self, vision_model, figures_data, *args, **kwargs):
         self.vision_model = vision_model
+        self.tenant_id = kwargs.get("tenant_id")
         self._extract_figures_info(figures_data)
         assert len(self.figures) == len(self.descriptions)
         assert not self.positions or (len(self.figures) == len(self.positions))
@@ -70,21 +98,98 @@ class VisionFigureParser:
 
         return self.assembled
 
+    def _describe(self, callback):
+        """
+        Describe the figures concurrently, each distinct image once. Returns the descriptions in
+        figure order, with "" for the figures that failed or timed out.
+
+        A figure waits at most FIGURE_DESCRIPTION_TIMEOUT seconds for one of the tenant's permits and
+        as long again in the vision model. A call that overruns is abandoned: its permit is handed back
+        at once so that a hung vision model cannot starve the tenant's later figures.
+        """
+        keys = [_figure_digest(img) for img in self.figures]
+        unique = {}
+        for k, img in zip(keys, self.figures):
+            unique.setdefault(k, img)
+
+        limiter = _tenant_limiter(self.tenant_id)
+        # Guards the hand-back of a permit, which is either done by its call or, once abandoned, by this loop.
+        permit_lock = threading.Lock()
+        abandoned = set()
+
+        def describe(fut, img):
+            try:
+                fut.set_result(picture_vision_llm_chunk(
+                    binary=img,
+                    vision_model=self.vision_model,
+                    prompt=vision_llm_figure_describe_prompt(),
+                    callback=callback,
+                ))
+            except Exception as e:
+                fut.set_exception(e)
+            finally:
+                with permit_lock:
+                    if fut not in abandoned:
+                        limiter.release()
+
+        def skip(what):
+            logging.warning(f"Figure description {what} after {FIGURE_DESCRIPTION_TIMEOUT}s")
+            callback(None, f"A figure description {what} after {FIGURE_DESCRIPTION_TIMEOUT}s, skipped.")
+
+        poll = min(1, FIGURE_DESCRIPTION_TIMEOUT / 10)
+        todo = list(unique.items())
+        running = {}
+        results = {}
+        waiting_since = time.time()
+        try:
+            while todo or running:
+                if running:
+                    done, _ = wait(running, timeout=0 if todo else poll, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        k, _ = running.pop(fut)
+                        results[k] = fut.result()
+                now = time.time()
+                for fut, (k, started) in list(running.items()):
+                    if now - started <= FIGURE_DESCRIPTION_TIMEOUT:
+                        continue
+                    with permit_lock:
+                        if fut.done():
+                            continue
+                        abandoned.add(fut)
+                        limiter.release()
+                    running.pop(fut)
+                    skip("timed out")
+
+                if not todo:
+                    continue
+                if limiter.acquire(timeout=poll):
+                    k, img = todo.pop(0)
+                    fut = Future()
+                    running[fut] = (k, time.time())
+                    threading.Thread(target=describe, args=(fut, img), daemon=True).start()
+                    waiting_since = time.time()
+                elif now - waiting_since > FIGURE_DESCRIPTION_TIMEOUT:
+                    todo.pop(0)
+                    waiting_since = time.time()
+                    skip("waited for the vision model")
+        finally:
+            with permit_lock:
+                for fut in running:
+                    if not fut.done():
+                        abandoned.add(fut)
+                        limiter.release()
+
+        if len(unique) < len(keys):
+            logging.info(f"Described {len(unique)} distinct figures out of {len(keys)}")
+        return [results.get(k, "") for k in keys]
+
     def __call__(self, **kwargs):
         callback = kwargs.get("callback", lambda prog, msg: None)
 
-        for idx, img_binary in enumerate(self.figures or []):
-            figure_num = idx  # 0-based
-
-            txt = picture_vision_llm_chunk(
-                binary=img_binary,
-                vision_model=self.vision_model,
-                prompt=vision_llm_figure_describe_prompt(),
-                callback=callback,
-            )
-
-            if txt:
-                self.descriptions[figure_num] = txt + "\n".join(self.descriptions[figure_num])
+        if self.figures:
+            for figure_num, txt in enumerate(self._describe(callback)):
+                if txt:
+                    self.descriptions[figure_num] = txt + "\n".join(self.descriptions[figure_num])
 
         self._assemble()
 
@@ -15,7 +15,12 @@
 #  limitations under the License.
 #
 
-from rag.nlp import find_codec
+import math
+import re
+from html import escape
+from html.parser import HTMLParser
+
+from rag.nlp import find_codec, num_tokens_from_string
 import readability
 import html_text
 import chardet
@@ -27,16 +32,178 @@ def get_encoding(file):
         return tmp['encoding']
 
 
+SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg", "math", "iframe", "object", "canvas",
+                "nav", "footer", "button", "select", "textarea"}
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+BLOCK_TAGS = HEADING_TAGS | {"p", "div", "section", "article", "main", "header", "aside", "ul", "ol", "li",
+                             "dl", "dt", "dd", "blockquote", "pre", "br", "hr", "figure", "figcaption",
+                             "address", "details", "summary", "form", "fieldset", "center"}
+TABLE_TAGS = {"table", "caption", "thead", "tbody", "tfoot", "tr", "th", "td"}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+class _BlockScanner(HTMLParser):
+    """
+    Tokenizes an HTML document once into its text blocks and its outermost tables, in document
+    order. Each block comes with its token count; tables are rebuilt as bare HTML.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = []
+        self.blocks = []  # (text, tokens, is heading)
+        self.tables = []
+        self._text = []
+        self._heading = False
+        self._skip = None  # [tag, depth] of the element being skipped
+        self._in_title = False
+        self._pre = 0
+        self._table = None  # parts of the outermost table being read
+        self._table_depth = 0
+
+    def _flush(self):
+        txt = "".join(self._text)
+        self._text = []
+        if self._pre:
+            txt = txt.strip("\r\n")
+        else:
+            txt = re.sub(r"\s+", " ", txt).strip()
+        if txt.strip():
+            self.blocks.append((txt, num_tokens_from_string(txt), self._heading))
+        self._heading = False
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip:
+            if tag == self._skip[0]:
+                self._skip[1] += 1
+            return
+        if tag in SKIPPED_TAGS:
+            self._skip = [tag, 1]
+            return
+        if tag == "title":
+            self._in_title = True
+            return
+        if self._table is not None:
+            if tag == "table":
+                self._table_depth += 1
+            if tag in TABLE_TAGS:
+                spans = "".join(f" {k}='{escape(v or '')}'" for k, v in attrs if k in ("colspan", "rowspan"))
+                self._table.append(f"<{tag}{spans}>")
+            elif tag in BLOCK_TAGS:
+                self._table.append(" ")
+            return
+        if tag == "table":
+            self._flush()
+            self._table, self._table_depth = ["<table>"], 1
+            return
+        if tag in BLOCK_TAGS:
+            self._flush()
+            self._heading = tag in HEADING_TAGS
+        if tag == "pre":
+            self._pre += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self._skip:
+            if tag == self._skip[0]:
+                self._skip[1] -= 1
+                if not self._skip[1]:
+                    self._skip = None
+            return
+        if tag == "title":
+            self._in_title = False
+            return
+        if self._table is not None:
+            if tag in TABLE_TAGS:
+                self._table.append(f"</{tag}>")
+            elif tag in BLOCK_TAGS:
+                self._table.append(" ")
+            if tag == "table":
+                self._table_depth -= 1
+                if not self._table_depth:
+                    self.tables.append(re.sub(r"\s+", " ", "".join(self._table)))
+                    self._table = None
+            return
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag == "pre" and self._pre:
+            self._pre -= 1
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        if self._in_title:
+            self.title.append(data)
+        elif self._table is not None:
+            self._table.append(escape(data, quote=False))
+        else:
+            self._text.append(data)
+
+    def close(self):
+        super().close()
+        if self._table is not None:
+            self._table.append("</table>" * self._table_depth)
+            self.tables.append(re.sub(r"\s+", " ", "".join(self._table)))
+            self._table = None
+        self._flush()
+
+
 class RAGFlowHtmlParser:
     def __call__(self, fnm, binary=None):
-        txt = ""
+        return self.parser_txt(self._read(fnm, binary))
+
+    @staticmethod
+    def _read(fnm, binary=None):
         if binary:
             encoding = find_codec(binary)
-            txt = binary.decode(encoding, errors="ignore")
-        else:
-            with open(fnm, "r",encoding=get_encoding(fnm)) as f:
-                txt = f.read()
-        return self.parser_txt(txt)
+            return binary.decode(encoding, errors="ignore")
+        with open(fnm, "r", encoding=get_encoding(fnm)) as f:
+            return f.read()
+
+    def sections(self, fnm, binary=None, chunk_token_num=128):
+        """
+        Returns (sections, tables) of the document in a single pass over its markup: the text under
+        a heading is kept with it up to about a chunk, blocks bigger than 3 chunks are cut into
+        pieces, and the outermost tables are returned apart as HTML.
+        """
+        return self.parser_sections(self._read(fnm, binary), chunk_token_num)
+
+    @classmethod
+    def parser_sections(cls, txt, chunk_token_num=128):
+        if not isinstance(txt, str):
+            raise TypeError("txt type should be str!")
+        scanner = _BlockScanner()
+        scanner.feed(txt)
+        scanner.close()
+
+        sections = []
+        title = re.sub(r"\s+", " ", "".join(scanner.title)).strip()
+        if title:
+            sections.append(title)
+        heading, heading_tks = [], 0
+        for sec, tnum, is_heading in scanner.blocks:
+            if heading and not is_heading and tnum <= 3 * chunk_token_num and heading_tks < chunk_token_num:
+                heading.append(sec)
+                heading_tks += tnum
+                continue
+            if heading:
+                sections.append("\n".join(heading))
+                heading, heading_tks = [], 0
+            if tnum > 3 * chunk_token_num:
+                n = max(2, math.ceil(tnum / (3 * chunk_token_num)))
+                step = math.ceil(len(sec) / n)
+                sections.extend([sec[i:i + step] for i in range(0, len(sec), step)])
+            elif is_heading:
+                heading, heading_tks = [sec], tnum
+            else:
+                sections.append(sec)
+        if heading:
+            sections.append("\n".join(heading))
+        return sections, scanner.tables
 
     @classmethod
     def parser_txt(cls, txt):
@@ -19,10 +19,25 @@
 # from https://github.com/langchain-ai/langchain/blob/master/libs/text-splitters/langchain_text_splitters/json.py
 
 import json
+import re
+from json.decoder import scanstring
 from typing import Any
 
 from rag.nlp import find_codec
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
 class RAGFlowJsonParser:
+    """
+    Splits JSON into chunks of at most max_chunk_size serialized characters that keep the path of
+    every value. The document is walked as text: values that fit in the current chunk are decoded
+    on their own, bigger containers are descended into, so the whole document is never held as
+    Python objects and sizes are summed up instead of re-serializing subtrees.
+
+    JSON Lines (and any sequence of concatenated JSON values) is read as a list of its records.
+    """
+
     def __init__(
         self, max_chunk_size: int = 2000, min_chunk_size: int | None = None
     ):
@@ -33,26 +48,17 @@ class RAGFlowJsonParser:
             if min_chunk_size is not None
             else max(max_chunk_size - 200, 50)
         )
+        self.decoder = json.JSONDecoder()
+        self.encoder = json.JSONEncoder(ensure_ascii=False)
 
     def __call__(self, binary):
         encoding = find_codec(binary)
-        txt = binary.decode(encoding, errors="ignore")
-        json_data = json.loads(txt)
-        chunks = self.split_json(json_data, True)   
-        sections = [json.dumps(line, ensure_ascii=False) for line in chunks if line]
-        return sections
-
-    @staticmethod
-    def _json_size(data: dict) -> int:
-        """Calculate the size of the serialized JSON object."""
-        return len(json.dumps(data, ensure_ascii=False))
+        txt = binary.decode(encoding, errors="ignore").lstrip("﻿")
+        return [json.dumps(chunk, ensure_ascii=False) for chunk in self._split_text(txt, True) if chunk]
 
-    @staticmethod
-    def _set_nested_dict(d: dict, path: list[str], value: Any) -> None:
-        """Set a value in a nested dictionary based on the given path."""
-        for key in path[:-1]:
-            d = d.setdefault(key, {})
-        d[path[-1]] = value
+    def _json_size(self, data: Any) -> int:
+        """Calculate the size of the serialized JSON object."""
+        return len(self.encoder.encode(data))
 
     def _list_to_dict_preprocessing(self, data: Any) -> Any:
         if isinstance(data, dict):
@@ -67,39 +73,151 @@ class RAGFlowJsonParser:
         else:
             # Base case: the item is neither a dict nor a list, so return it unchanged
             return data
-        
-    def _json_split(
-        self,
-        data,
-        current_path: list[str] | None,
-        chunks: list[dict] | None,
-    ) -> list[dict]:
+
+    def _ws(self, i: int) -> int:
+        return WHITESPACE.match(self.txt, i).end()
+
+    def _is_container(self, i: int) -> bool:
+        return self.txt.startswith("{", i) or (self.convert_lists and self.txt.startswith("[", i))
+
+    def _entry(self, i: int, kind: str, n: int) -> tuple[str | None, int]:
         """
-        Split json into maximum size dictionaries while preserving structure.
+        Key and value position of the next entry of a container ("{", "[", or "lines" for a
+        sequence of top-level values), i being past its opener or its previous entry.
+        Returns (None, end of the container) when there are no more entries.
         """
-        current_path = current_path or []
-        chunks = chunks or [{}]
-        if isinstance(data, dict):
-            for key, value in data.items():
-                new_path = current_path + [key]
-                chunk_size = self._json_size(chunks[-1])
-                size = self._json_size({key: value})
-                remaining = self.max_chunk_size - chunk_size
-
-                if size < remaining:
-                    # Add item to current chunk
-                    self._set_nested_dict(chunks[-1], new_path, value)
-                else:
-                    if chunk_size >= self.min_chunk_size:
-                        # Chunk is big enough, start a new chunk
-                        chunks.append({})
-
-                    # Iterate
-                    self._json_split(value, new_path, chunks)
+        txt = self.txt
+        i = self._ws(i)
+        if kind == "lines":
+            return (str(n), i) if i < len(txt) else (None, i)
+        if n and txt.startswith(",", i):
+            i = self._ws(i + 1)
+        if i >= len(txt):
+            raise json.JSONDecodeError(f"Unterminated {'object' if kind == '{' else 'array'}", txt, i)
+        if txt[i] in "}]":
+            return None, i + 1
+        if kind == "[":
+            return str(n), i
+        if txt[i] != '"':
+            raise json.JSONDecodeError("Expecting property name enclosed in double quotes", txt, i)
+        key, i = scanstring(txt, i + 1)
+        i = self._ws(i)
+        if not txt.startswith(":", i):
+            raise json.JSONDecodeError("Expecting ':' delimiter", txt, i)
+        return key, self._ws(i + 1)
+
+    def _probe(self, i: int, budget: int) -> tuple[Any, int, int] | None:
+        """
+        (value, serialized size, end) of the value at i, lists being converted to index-keyed
+        dictionaries. Returns None as soon as a container reaches `budget` characters; a scalar is
+        always returned.
+        """
+        if not self._is_container(i):
+            value, end = self.decoder.raw_decode(self.txt, i)
+            return value, self._json_size(value), end
+        if budget <= 2:
+            return None
+        # Small containers usually end within a window of the text: decode them at once.
+        try:
+            value, end = self.decoder.raw_decode(self.txt[i:i + 2 * budget + 64])
+            if self.convert_lists:
+                value = self._list_to_dict_preprocessing(value)
+            size = self._json_size(value)
+            return (value, size, i + end) if size < budget else None
+        except json.JSONDecodeError:
+            pass
+        kind = self.txt[i]
+        value, size, n = {}, 2, 0
+        i += 1
+        while True:
+            key, i = self._entry(i, kind, n)
+            if key is None:
+                return value, size, i
+            entry = (2 if n else 0) + self._json_size(key) + 2
+            child = self._probe(i, budget - size - entry)
+            if child is None or size + entry + child[1] >= budget:
+                return None
+            value[key], i = child[0], child[2]
+            size += entry + child[1]
+            n += 1
+
+    def _add(self, path: list[str], value: Any, size: int) -> None:
+        """Set `value` of serialized `size` at `path` in the current chunk and account for it."""
+        d = self.chunk
+        for key in path[:-1]:
+            if key not in d:
+                self.chunk_size += (2 if d else 0) + self._json_size(key) + 4
+                d[key] = {}
+            d = d[key]
+        if path[-1] not in d:
+            self.chunk_size += (2 if d else 0) + self._json_size(path[-1]) + 2 + size
+        d[path[-1]] = value
+
+    def _new_chunk(self):
+        chunk = self.chunk
+        self.chunk, self.chunk_size = {}, 2
+        return chunk
+
+    def _json_split(self, i: int, kind: str, path: list[str]):
+        """
+        Walk the entries of the container at i, putting each into the current chunk whole if it
+        fits, and descending into it otherwise. Yields the chunks that get full and returns the
+        end of the container.
+        """
+        n = 0
+        while True:
+            key, i = self._entry(i, kind, n)
+            if key is None:
+                return i
+            n += 1
+            new_path = path + [key]
+            # size({key: value}) < max_chunk_size - size(chunk)
+            budget = self.max_chunk_size - self.chunk_size - self._json_size(key) - 4
+            probed = self._probe(i, budget)
+            if probed is not None and probed[1] < budget:
+                # Add item to current chunk
+                self._add(new_path, probed[0], probed[1])
+                i = probed[2]
+                continue
+
+            if self.chunk_size >= self.min_chunk_size:
+                # Chunk is big enough, start a new chunk
+                yield self._new_chunk()
+
+            if probed is None:
+                i = yield from self._json_split(i + 1, self.txt[i], new_path)
+            else:
+                # handle single item
+                self._add(new_path, probed[0], probed[1])
+                i = probed[2]
+
+    def _is_json_lines(self, i: int) -> bool:
+        """Whether the text starting at i holds more than one value, the first one on its own line."""
+        txt = self.txt
+        nl = txt.find("\n", i)
+        if nl < 0 or self._ws(nl) == len(txt):
+            return False
+        line = txt[i:nl]
+        try:
+            _, end = self.decoder.raw_decode(line)
+        except json.JSONDecodeError:
+            return False
+        return not line[end:].strip()
+
+    def _split_text(self, txt: str, convert_lists: bool):
+        self.txt, self.convert_lists = txt, convert_lists
+        self.chunk, self.chunk_size = {}, 2
+        i = self._ws(0)
+        if i >= len(txt):
+            pass
+        elif self._is_json_lines(i):
+            yield from self._json_split(i, "lines", [])
+        elif self._is_container(i):
+            yield from self._json_split(i + 1, txt[i], [])
         else:
-            # handle single item
-            self._set_nested_dict(chunks[-1], current_path, data)
-        return chunks
+            yield self.decoder.raw_decode(txt, i)[0]
+        yield self._new_chunk()
+        self.txt = None
 
     def split_json(
         self,
@@ -107,16 +225,7 @@ class RAGFlowJsonParser:
         convert_lists: bool = False,
     ) -> list[dict]:
         """Splits JSON into a list of JSON chunks"""
-
-        if convert_lists:
-            preprocessed_data = self._list_to_dict_preprocessing(json_data)
-            chunks = self._json_split(preprocessed_data, None, None)
-        else:
-            chunks = self._json_split(json_data, None, None)
-
-        # Remove the last chunk if it's empty
-        if not chunks[-1]:
-            chunks.pop()
+        chunks = [chunk for chunk in self._split_text(json.dumps(json_data, ensure_ascii=False), convert_lists) if chunk]
         return chunks
 
     def split_text(
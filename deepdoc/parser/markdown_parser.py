@@ -17,61 +17,84 @@
 
 import re
 
+DELIMITER_CHARS = set("|-: \t")
+HTML_TABLE_START = re.compile(r"[ \t]*(?:<html[^>]*>\s*)?(?:<body[^>]*>\s*)?<table\b", re.IGNORECASE)
+HTML_TABLE_TAIL = re.compile(r"(?:\s*</body>)?(?:\s*</html>)?[ \t\r]*(?:\n|$)", re.IGNORECASE)
+
+
+def _is_delimiter_row(line, bordered):
+    """`|---|:---:|` or `--- | ---`: the row separating a table header from its body."""
+    if bordered and not line.startswith("|"):
+        return False
+    s = line.strip()
+    return "-" in s and "|" in s and set(s) <= DELIMITER_CHARS
+
+
+def _is_border_row(line):
+    return line.startswith("|") and line.count("|") >= 3
+
+
+def _is_borderless_row(line):
+    return line[:1].strip() != "" and "|" in line
+
+
 class RAGFlowMarkdownParser:
     def __init__(self, chunk_token_num=128):
         self.chunk_token_num = int(chunk_token_num)
 
-    def extract_tables_and_remainder(self, markdown_text):
-        tables = []
-        remainder = markdown_text
-        if "|" in markdown_text: # for optimize performance
-            # Standard Markdown table
-            border_table_pattern = re.compile(
-                r'''
-                (?:\n|^)                     
-                (?:\|.*?\|.*?\|.*?\n)        
-                (?:\|(?:\s*[:-]+[-| :]*\s*)\|.*?\n) 
-                (?:\|.*?\|.*?\|.*?\n)+
-            ''', re.VERBOSE)
-            border_tables = border_table_pattern.findall(markdown_text)
-            tables.extend(border_tables)
-            remainder = border_table_pattern.sub('', remainder)
+    def iter_blocks(self, markdown_text):
+        """
+        Walk the text once, line by line, yielding ("table", table) for Markdown and HTML tables
+        and ("text", line) for every other line, in document order.
+        """
+        lines = markdown_text.split("\n")
+        lower = markdown_text.lower()
+        if "<table" not in lower:
+            lower = None
+        offsets = []
+        pos = 0
+        for line in lines:
+            offsets.append(pos)
+            pos += len(line) + 1
 
-            # Borderless Markdown table
-            no_border_table_pattern = re.compile(
-                r'''
-                (?:\n|^)                 
-                (?:\S.*?\|.*?\n)
-                (?:(?:\s*[:-]+[-| :]*\s*).*?\n)
-                (?:\S.*?\|.*?\n)+
-                ''', re.VERBOSE)
-            no_border_tables = no_border_table_pattern.findall(remainder)
-            tables.extend(no_border_tables)
-            remainder = no_border_table_pattern.sub('', remainder)
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            for is_row, bordered in ((_is_border_row, True), (_is_borderless_row, False)):
+                if i + 2 < len(lines) and is_row(line) and _is_delimiter_row(lines[i + 1], bordered) and is_row(lines[i + 2]):
+                    j = i + 3
+                    while j < len(lines) and is_row(lines[j]):
+                        j += 1
+                    yield "table", "\n".join(lines[i:j]) + "\n"
+                    i = j
+                    break
+            else:
+                end = self._html_table_end(markdown_text, lower, offsets[i]) if lower and HTML_TABLE_START.match(markdown_text, offsets[i]) else None
+                if end is None:
+                    yield "text", line
+                    i += 1
+                    continue
+                yield "table", markdown_text[offsets[i]:end].strip()
+                while i < len(lines) and offsets[i] < end:
+                    i += 1
 
-        if "<table>" in remainder.lower(): # for optimize performance
-            #HTML table extraction - handle possible html/body wrapper tags
-            html_table_pattern = re.compile(
-            r'''
-            (?:\n|^)
-            \s*
-            (?:
-                # case1: <html><body><table>...</table></body></html>
-                (?:<html[^>]*>\s*<body[^>]*>\s*<table[^>]*>.*?</table>\s*</body>\s*</html>)
-                |
-                # case2: <body><table>...</table></body>
-                (?:<body[^>]*>\s*<table[^>]*>.*?</table>\s*</body>)
-                |
-                # case3: only<table>...</table>
-                (?:<table[^>]*>.*?</table>)
-            )
-            \s*
-            (?=\n|$)
-            ''',
-            re.VERBOSE | re.DOTALL | re.IGNORECASE
-            )
-            html_tables = html_table_pattern.findall(remainder)
-            tables.extend(html_tables)
-            remainder = html_table_pattern.sub('', remainder)
+    @staticmethod
+    def _html_table_end(text, lower, start):
+        """End of the HTML table whose markup starts the line at `start`, or None."""
+        close = lower.find("</table>", start)
+        while close >= 0:
+            tail = HTML_TABLE_TAIL.match(text, close + len("</table>"))
+            if tail:
+                return tail.end()
+            close = lower.find("</table>", close + 1)
+        return None
 
-        return remainder, tables
+    def extract_tables_and_remainder(self, markdown_text):
+        tables = []
+        remainder = []
+        for kind, block in self.iter_blocks(markdown_text):
+            if kind == "table":
+                tables.append(block)
+            else:
+                remainder.append(block)
+        return "\n".join(remainder), tables
@@ -15,11 +15,14 @@
 #
 
 import logging
+import math
 import os
+import pickle
 import random
 import re
 import sys
 import threading
+import unicodedata
 from copy import deepcopy
 from io import BytesIO
 from timeit import default_timer as timer
@@ -28,23 +31,112 @@ import numpy as np
 import pdfplumber
 import trio
 import xgboost as xgb
+import xxhash
 from huggingface_hub import snapshot_download
 from PIL import Image
 from pypdf import PdfReader as pdf2_read
 
 from api import settings
 from api.utils.file_utils import get_project_base_directory
-from deepdoc.vision import OCR, LayoutRecognizer, Recognizer, TableStructureRecognizer
-from rag.app.picture import vision_llm_chunk as picture_vision_llm_chunk
+from deepdoc.vision import OCR, BoxIndex, LayoutRecognizer, Recognizer, TableStructureRecognizer
+from rag.app.picture import vision_llm_chunks as picture_vision_llm_chunks
 from rag.nlp import rag_tokenizer
 from rag.prompts import vision_llm_describe_prompt
 from rag.settings import PARALLEL_DEVICES
 
+# Threads running OCR models at the same time when OCR is not spread over PARALLEL_DEVICES.
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+# Text lines recognized in one call, gathered from as many detected pages as needed.
+OCR_REC_BATCH_SIZE = int(os.environ.get("OCR_REC_BATCH_SIZE", 256))
+# Pages rendered ahead of OCR detection, which bounds the page bitmaps alive at the same time.
+OCR_LOOKAHEAD_PAGES = int(os.environ.get("OCR_LOOKAHEAD_PAGES", 2 * OCR_WORKERS))
+# Pages whose text layer looks complete are read from it instead of being OCRed.
+TEXT_LAYER_FAST_PATH = int(os.environ.get("TEXT_LAYER_FAST_PATH", 1)) > 0
+# Pages without any text found are rendered again at a finer zoom only when at most this share of
+# their pixels is ink, i.e. darker than OCR_INK_LEVEL.
+OCR_ZOOM_RETRY_MAX_INK = float(os.environ.get("OCR_ZOOM_RETRY_MAX_INK", 0.02))
+OCR_INK_LEVEL = 200
+TEXT_LAYER_MIN_CHARS = 20
+TEXT_LAYER_MAX_BAD_CHARS = 0.02
+TEXT_LAYER_MAX_IMAGE_COVERAGE = 0.5
+# Results of the OCR, layout and table stages are kept in the object storage, keyed by the file
+# content, page range and parser, so that parsing a file again, e.g. after changing the chunking
+# settings, replays them instead of running the models. Off by default: the entries are not removed
+# with the documents they were made from.
+PARSE_CACHE = int(os.environ.get("PARSE_CACHE", 0)) > 0
+PARSE_CACHE_BUCKET = "deepdoc-parse-cache"
+# Bump it whenever the models or the stages change what they produce.
+PARSE_CACHE_VERSION = 1
+PARSE_CACHE_STAGES = ["ocr", "layout", "table"]
+PARSE_CACHE_STATE = ["boxes", "mean_height", "mean_width", "page_cum_height", "page_layout", "garbages",
+                     "is_english", "outlines", "total_page", "tb_cpns"]
+
 LOCK_KEY_pdfplumber = "global_shared_lock_pdfplumber"
 if LOCK_KEY_pdfplumber not in sys.modules:
     sys.modules[LOCK_KEY_pdfplumber] = threading.Lock()
 
 
+# Models of the parsers, loaded once per process and shared by all of them: running them does not
+# change them, so parsers can be created per document at no cost.
+_shared_models = {}
+_shared_models_lock = threading.Lock()
+
+
+def _shared_model(key, load):
+    with _shared_models_lock:
+        if key not in _shared_models:
+            _shared_models[key] = load()
+        return _shared_models[key]
+
+
+def _load_updown_cnt_mdl():
+    updown_cnt_mdl = xgb.Booster()
+    if not settings.LIGHTEN:
+        try:
+            import torch.cuda
+            if torch.cuda.is_available():
+                updown_cnt_mdl.set_param({"device": "cuda"})
+        except Exception:
+            logging.exception("RAGFlowPdfParser __init__")
+    try:
+        model_dir = os.path.join(
+            get_project_base_directory(),
+            "rag/res/deepdoc")
+        updown_cnt_mdl.load_model(os.path.join(
+            model_dir, "updown_concat_xgb.model"))
+    except Exception:
+        model_dir = snapshot_download(
+            repo_id="InfiniFlow/text_concat_xgb_v1.0",
+            local_dir=os.path.join(get_project_base_directory(), "rag/res/deepdoc"),
+            local_dir_use_symlinks=False)
+        updown_cnt_mdl.load_model(os.path.join(
+            model_dir, "updown_concat_xgb.model"))
+    return updown_cnt_mdl
+
+
+class _EncodedPage:
+    """
+    A page image kept as JPEG once the layout and table stages no longer need its pixels, and
+    decoded again by crop(). The pages of a document share `decoded`, which holds the last page
+    decoded, as chunks are cropped in reading order.
+    """
+
+    def __init__(self, img, decoded):
+        self.size = img.size
+        buf = BytesIO()
+        img.convert("RGB").save(buf, format="JPEG", quality=95)
+        self.data = buf.getvalue()
+        self.decoded = decoded
+
+    def image(self):
+        if self.decoded[0] is not self:
+            self.decoded[:] = [self, Image.open(BytesIO(self.data)).convert("RGB")]
+        return self.decoded[1]
+
+    def crop(self, box):
+        return self.image().crop(box)
+
+
 class RAGFlowPdfParser:
     def __init__(self, **kwargs):
         """
@@ -59,40 +151,22 @@ class RAGFlowPdfParser:
 
         """
 
-        self.ocr = OCR()
+        self.ocr = _shared_model("ocr", OCR)
         self.parallel_limiter = None
         if PARALLEL_DEVICES is not None and PARALLEL_DEVICES > 1:
             self.parallel_limiter = [trio.CapacityLimiter(1) for _ in range(PARALLEL_DEVICES)]
+        self.ocr_limiter = trio.CapacityLimiter(OCR_WORKERS)
 
         if hasattr(self, "model_speciess"):
-            self.layouter = LayoutRecognizer("layout." + self.model_speciess)
+            self.layouter = _shared_model("layout." + self.model_speciess, lambda: LayoutRecognizer("layout." + self.model_speciess))
         else:
-            self.layouter = LayoutRecognizer("layout")
-        self.tbl_det = TableStructureRecognizer()
-
-        self.updown_cnt_mdl = xgb.Booster()
-        if not settings.LIGHTEN:
-            try:
-                import torch.cuda
-                if torch.cuda.is_available():
-                    self.updown_cnt_mdl.set_param({"device": "cuda"})
-            except Exception:
-                logging.exception("RAGFlowPdfParser __init__")
-        try:
-            model_dir = os.path.join(
-                get_project_base_directory(),
-                "rag/res/deepdoc")
-            self.updown_cnt_mdl.load_model(os.path.join(
-                model_dir, "updown_concat_xgb.model"))
-        except Exception:
-            model_dir = snapshot_download(
-                repo_id="InfiniFlow/text_concat_xgb_v1.0",
-                local_dir=os.path.join(get_project_base_directory(), "rag/res/deepdoc"),
-                local_dir_use_symlinks=False)
-            self.updown_cnt_mdl.load_model(os.path.join(
-                model_dir, "updown_concat_xgb.model"))
+            self.layouter = _shared_model("layout", lambda: LayoutRecognizer("layout"))
+        self.tbl_det = _shared_model("tsr", TableStructureRecognizer)
+        self.updown_cnt_mdl = _shared_model("updown_concat_xgb", _load_updown_cnt_mdl)
 
         self.page_from = 0
+        self._parse_cache_key = None
+        self._parse_cache_stage = None
 
     def __char_width(self, c):
         return (c["x1"] - c["x0"]) // max(len(c["text"]), 1)
@@ -203,6 +277,8 @@ class RAGFlowPdfParser:
         return True
 
     def _table_transformer_job(self, ZM):
+        if self._parse_cache_hit("table"):
+            return
         logging.debug("Table processing...")
         imgs, pos = [], []
         tbcnt = [0]
@@ -226,6 +302,7 @@ class RAGFlowPdfParser:
 
         assert len(self.page_images) == len(tbcnt) - 1
         if not imgs:
+            self._save_parse_cache("table")
             return
         recos = self.tbl_det(imgs)
         tbcnt = np.cumsum(tbcnt)
@@ -261,17 +338,18 @@ class RAGFlowPdfParser:
         clmns = sorted([r for r in self.tb_cpns if re.match(
             r"table column$", r["label"])], key=lambda x: (x["pn"], x["layoutno"], x["x0"]))
         clmns = Recognizer.layouts_cleanup(self.boxes, clmns, 5, 0.5)
+        rows_index, headers_index, spans_index = BoxIndex(rows), BoxIndex(headers), BoxIndex(spans)
         for b in self.boxes:
             if b.get("layout_type", "") != "table":
                 continue
-            ii = Recognizer.find_overlapped_with_threashold(b, rows, thr=0.3)
+            ii = Recognizer.find_overlapped_with_threashold(b, rows, thr=0.3, index=rows_index)
             if ii is not None:
                 b["R"] = ii
                 b["R_top"] = rows[ii]["top"]
                 b["R_bott"] = rows[ii]["bottom"]
 
             ii = Recognizer.find_overlapped_with_threashold(
-                b, headers, thr=0.3)
+                b, headers, thr=0.3, index=headers_index)
             if ii is not None:
                 b["H_top"] = headers[ii]["top"]
                 b["H_bott"] = headers[ii]["bottom"]
@@ -285,36 +363,41 @@ class RAGFlowPdfParser:
                 b["C_left"] = clmns[ii]["x0"]
                 b["C_right"] = clmns[ii]["x1"]
 
-            ii = Recognizer.find_overlapped_with_threashold(b, spans, thr=0.3)
+            ii = Recognizer.find_overlapped_with_threashold(b, spans, thr=0.3, index=spans_index)
             if ii is not None:
                 b["H_top"] = spans[ii]["top"]
                 b["H_bott"] = spans[ii]["bottom"]
                 b["H_left"] = spans[ii]["x0"]
                 b["H_right"] = spans[ii]["x1"]
                 b["SP"] = ii
+        self._save_parse_cache("table")
 
-    def __ocr(self, pagenum, img, chars, ZM=3, device_id: int | None = None):
+    def __ocr_detect(self, pagenum, img, chars, ZM=3, device_id: int | None = None):
+        """
+        Detects the text lines of a page and fills them with the chars of the text layer.
+        Returns the boxes of the page and those still to be recognized, with their crop in "box_image".
+        """
         start = timer()
         bxs = self.ocr.detect(np.array(img), device_id)
         logging.info(f"__ocr detecting boxes of a image cost ({timer() - start}s)")
 
         start = timer()
         if not bxs:
-            self.boxes.append([])
-            return
+            return [], []
         bxs = [(line[0], line[1][0]) for line in bxs]
         bxs = Recognizer.sort_Y_firstly(
             [{"x0": b[0][0] / ZM, "x1": b[1][0] / ZM,
               "top": b[0][1] / ZM, "text": "", "txt": t,
               "bottom": b[-1][1] / ZM,
               "page_number": pagenum} for b, t in bxs if b[0][0] <= b[1][0] and b[0][1] <= b[-1][1]],
-            self.mean_height[-1] / 3
+            self.mean_height[pagenum - 1] / 3
         )
 
         # merge chars in the same rect
+        index = BoxIndex(bxs)
         for c in Recognizer.sort_Y_firstly(
                 chars, self.mean_height[pagenum - 1] // 4):
-            ii = Recognizer.find_overlapped(c, bxs)
+            ii = Recognizer.find_overlapped(c, bxs, index=index)
             if ii is None:
                 self.lefted_chars.append(c)
                 continue
@@ -330,7 +413,6 @@ class RAGFlowPdfParser:
                 bxs[ii]["text"] += c["text"]
 
         logging.info(f"__ocr sorting {len(chars)} chars cost {timer() - start}s")
-        start = timer()
         boxes_to_reg = []
         img_np = np.array(img)
         for b in bxs:
@@ -340,18 +422,92 @@ class RAGFlowPdfParser:
                 b["box_image"] = self.ocr.get_rotate_crop_image(img_np, np.array([[left, top], [right, top], [right, bott], [left, bott]], dtype=np.float32))
                 boxes_to_reg.append(b)
             del b["txt"]
+        return bxs, boxes_to_reg
+
+    @staticmethod
+    def _is_bad_char(c):
+        txt = c.get("text", "")
+        if not txt or "(cid:" in txt or "\ufffd" in txt:
+            return True
+        if any(unicodedata.category(t) in ("Cc", "Co", "Cn") for t in txt):
+            return True
+        return not c.get("fontname") or not 2 < c.get("size", 0) < 200 \
+            or not c.get("upright", True) or c["x1"] <= c["x0"] or c["bottom"] <= c["top"]
+
+    def _text_layer_usable(self, page, chars):
+        """
+        Tells whether the text layer of a page can stand in for its OCR: enough glyphs that map to
+        real characters in sane, horizontal fonts, and no large image which may hold more text.
+        """
+        if len(chars) < TEXT_LAYER_MIN_CHARS:
+            return False
+        if sum([1 for c in chars if self._is_bad_char(c)]) > TEXT_LAYER_MAX_BAD_CHARS * len(chars):
+            return False
+        covered = 0
+        for img in page.images:
+            w = min(img["x1"], page.width) - max(img["x0"], 0)
+            h = min(img["bottom"], page.height) - max(img["top"], 0)
+            if w > 0 and h > 0:
+                covered += w * h
+        return covered <= TEXT_LAYER_MAX_IMAGE_COVERAGE * page.width * page.height
+
+    def _text_layer_boxes(self, pagenum, chars):
+        """
+        Builds the text lines of a page from the geometry of its chars, the way __ocr_detect
+        would have returned them: chars overlapping vertically make a line, which is split
+        wherever the horizontal gap exceeds the line height, e.g. between columns.
+        """
+        lines = []
+        for c in sorted(chars, key=lambda c: (c["top"] + c["bottom"]) / 2):
+            ln = lines[-1] if lines else None
+            if ln and min(c["bottom"], ln["bottom"]) - max(c["top"], ln["top"]) >= \
+                    min(c["bottom"] - c["top"], ln["bottom"] - ln["top"]) / 2:
+                ln["chars"].append(c)
+                ln["top"] = min(ln["top"], c["top"])
+                ln["bottom"] = max(ln["bottom"], c["bottom"])
+                continue
+            lines.append({"top": c["top"], "bottom": c["bottom"], "chars": [c]})
+
+        bxs = []
+        for ln in lines:
+            segs = []
+            for c in sorted(ln["chars"], key=lambda c: c["x0"]):
+                if segs and c["x0"] - segs[-1][-1]["x1"] <= ln["bottom"] - ln["top"]:
+                    segs[-1].append(c)
+                else:
+                    segs.append([c])
+            for seg in segs:
+                txt = re.sub(r" +", " ", "".join([c["text"] for c in seg])).strip()
+                if not txt:
+                    continue
+                bxs.append({"x0": seg[0]["x0"], "x1": max([c["x1"] for c in seg]),
+                            "top": min([c["top"] for c in seg]), "bottom": max([c["bottom"] for c in seg]),
+                            "text": txt, "page_number": pagenum})
+        return Recognizer.sort_Y_firstly(bxs, self.mean_height[pagenum - 1] / 3)
+
+    def __ocr_recognize(self, pages, device_id: int | None = None):
+        """
+        Recognizes together the text lines left by __ocr_detect on several pages, so that the
+        recognizer gets batches of lines of similar width whatever page they come from.
+        `pages` is a list of (pagenum, boxes, boxes_to_reg).
+        """
+        start = timer()
+        boxes_to_reg = [b for _, _, to_reg in pages for b in to_reg]
         texts = self.ocr.recognize_batch([b["box_image"] for b in boxes_to_reg], device_id)
         for i in range(len(boxes_to_reg)):
             boxes_to_reg[i]["text"] = texts[i]
             del boxes_to_reg[i]["box_image"]
-        logging.info(f"__ocr recognize {len(bxs)} boxes cost {timer() - start}s")
-        bxs = [b for b in bxs if b["text"]]
-        if self.mean_height[-1] == 0:
-            self.mean_height[-1] = np.median([b["bottom"] - b["top"]
-                                              for b in bxs])
-        self.boxes.append(bxs)
+        logging.info(f"__ocr recognize {len(boxes_to_reg)} boxes of {len(pages)} pages cost {timer() - start}s")
+        for pagenum, bxs, _ in pages:
+            bxs = [b for b in bxs if b["text"]]
+            if bxs and self.mean_height[pagenum - 1] == 0:
+                self.mean_height[pagenum - 1] = np.median([b["bottom"] - b["top"]
+                                                           for b in bxs])
+            self.boxes[pagenum - 1] = bxs
 
     def _layouts_rec(self, ZM, drop=True):
+        if self._parse_cache_hit("layout"):
+            return
         assert len(self.page_images) == len(self.boxes)
         self.boxes, self.page_layout = self.layouter(
             self.page_images, self.boxes, ZM, drop=drop)
@@ -361,6 +517,7 @@ class RAGFlowPdfParser:
                 self.page_cum_height[self.boxes[i]["page_number"] - 1]
             self.boxes[i]["bottom"] += \
                 self.page_cum_height[self.boxes[i]["page_number"] - 1]
+        self._save_parse_cache("layout")
 
     def _text_merge(self):
         # merge adjusted boxes
@@ -852,6 +1009,7 @@ class RAGFlowPdfParser:
             res.append((cropout(bxs, "table", poss),
                         self.tbl_det.construct_table(bxs, html=return_html, is_english=self.is_english)))
             positions.append(poss)
+        self._release_page_images()
 
         if separate_tables_figures:
             assert len(positions) + len(figure_positions) == len(res) + len(figure_results)
@@ -866,6 +1024,12 @@ class RAGFlowPdfParser:
             else:
                 return res
 
+    def _release_page_images(self):
+        """The figures and tables are cropped: only chunk crops read the page images from now on."""
+        decoded = [None, None]
+        self.page_images = [img if isinstance(img, _EncodedPage) else _EncodedPage(img, decoded)
+                            for img in self.page_images]
+
     def proj_match(self, line):
         if len(line) <= 2:
             return
@@ -982,15 +1146,86 @@ class RAGFlowPdfParser:
     @staticmethod
     def total_page_number(fnm, binary=None):
         try:
-            with sys.modules[LOCK_KEY_pdfplumber]:
-                pdf = pdfplumber.open(
-                    fnm) if not binary else pdfplumber.open(BytesIO(binary))
+            pdf = pdfplumber.open(
+                fnm) if not binary else pdfplumber.open(BytesIO(binary))
             total_page = len(pdf.pages)
             pdf.close()
             return total_page
         except Exception:
             logging.exception("total_page_number")
 
+    def _parse_cache_digest(self, fnm, zoomin, page_from, page_to):
+        h = xxhash.xxh64()
+        if isinstance(fnm, str):
+            with open(fnm, "rb") as f:
+                h.update(f.read())
+        else:
+            h.update(fnm)
+        conf = [PARSE_CACHE_VERSION, type(self).__module__, type(self).__qualname__, getattr(self, "model_speciess", ""),
+                zoomin, page_from, page_to, TEXT_LAYER_FAST_PATH]
+        h.update(str(conf).encode("utf-8"))
+        return h.hexdigest()
+
+    def _load_parse_cache(self, fnm, zoomin, page_from, page_to):
+        """Restores the stages cached for this file and page range, and returns the last of them, or None."""
+        self._parse_cache_key = None
+        self._parse_cache_stage = None
+        if not PARSE_CACHE:
+            return None
+        try:
+            from rag.utils.storage_factory import STORAGE_IMPL
+            self._parse_cache_key = self._parse_cache_digest(fnm, zoomin, page_from, page_to)
+            if not STORAGE_IMPL.obj_exist(PARSE_CACHE_BUCKET, self._parse_cache_key + "/state"):
+                return None
+            state = pickle.loads(STORAGE_IMPL.get(PARSE_CACHE_BUCKET, self._parse_cache_key + "/state"))
+            images = pickle.loads(STORAGE_IMPL.get(PARSE_CACHE_BUCKET, self._parse_cache_key + "/images"))
+        except Exception:
+            logging.exception("RAGFlowPdfParser _load_parse_cache")
+            return None
+        for k in PARSE_CACHE_STATE:
+            if k in state:
+                setattr(self, k, state[k])
+        self.page_images = [Image.open(BytesIO(img)) for img in images]
+        self._parse_cache_stage = state["stage"]
+        logging.info(f"RAGFlowPdfParser reuses the cached {state['stage']} stage of {self._parse_cache_key}")
+        return self._parse_cache_stage
+
+    def _save_parse_cache(self, stage):
+        if not self._parse_cache_key:
+            return
+        try:
+            from rag.utils.storage_factory import STORAGE_IMPL
+            if stage == PARSE_CACHE_STAGES[0]:
+                images = []
+                for img in self.page_images:
+                    buf = BytesIO()
+                    img.save(buf, format="PNG", compress_level=1)
+                    images.append(buf.getvalue())
+                STORAGE_IMPL.put(PARSE_CACHE_BUCKET, self._parse_cache_key + "/images", pickle.dumps(images))
+            state = {k: getattr(self, k) for k in PARSE_CACHE_STATE if hasattr(self, k)}
+            state["stage"] = stage
+            STORAGE_IMPL.put(PARSE_CACHE_BUCKET, self._parse_cache_key + "/state", pickle.dumps(state))
+        except Exception:
+            logging.exception("RAGFlowPdfParser _save_parse_cache")
+
+    def _parse_cache_hit(self, stage):
+        return self._parse_cache_stage is not None and \
+            PARSE_CACHE_STAGES.index(self._parse_cache_stage) >= PARSE_CACHE_STAGES.index(stage)
+
+    @staticmethod
+    def _sparse_ink(img):
+        """Whether the page has some ink, but at most OCR_ZOOM_RETRY_MAX_INK of its pixels."""
+        hist = img.convert("L").histogram()
+        ink = sum(hist[:OCR_INK_LEVEL]) / max(1, sum(hist))
+        return 0 < ink <= OCR_ZOOM_RETRY_MAX_INK
+
+    @staticmethod
+    def _render_page(page, zoomin):
+        # Pages are rendered by pdfium, which is not thread-safe even across documents,
+        # whereas reading the text layer with pdfminer does not need the lock.
+        with sys.modules[LOCK_KEY_pdfplumber]:
+            return page.to_image(resolution=72 * zoomin).annotated
+
     def __images__(self, fnm, zoomin=3, page_from=0,
                    page_to=299, callback=None):
         self.lefted_chars = []
@@ -1001,33 +1236,36 @@ class RAGFlowPdfParser:
         self.page_cum_height = [0]
         self.page_layout = []
         self.page_from = page_from
+        self.page_images = []
+        self.page_chars = []
+        if self._load_parse_cache(fnm, zoomin, page_from, page_to):
+            if callback:
+                callback(prog=0.6, msg="Reuse the cached OCR result")
+            return
         start = timer()
+        pdf = None
+        pages = []
         try:
-            with sys.modules[LOCK_KEY_pdfplumber]:
-                with (pdfplumber.open(fnm) if isinstance(fnm, str) else pdfplumber.open(BytesIO(fnm))) as pdf:
-                    self.pdf = pdf
-                    self.page_images = [p.to_image(resolution=72 * zoomin).annotated for i, p in
-                                        enumerate(self.pdf.pages[page_from:page_to])]
-
-                    try:
-                        self.page_chars = [[c for c in page.dedupe_chars().chars if self._has_color(c)] for page in self.pdf.pages[page_from:page_to]]
-                    except Exception as e:
-                        logging.warning(f"Failed to extract characters for pages {page_from}-{page_to}: {str(e)}")
-                        self.page_chars = [[] for _ in range(page_to - page_from)]  # If failed to extract, using empty list instead.
-
-                    self.total_page = len(self.pdf.pages)
-
+            pdf = pdfplumber.open(fnm) if isinstance(fnm, str) else pdfplumber.open(BytesIO(fnm))
+            self.pdf = pdf
+            self.total_page = len(pdf.pages)
+            pages = pdf.pages[page_from:page_to]
         except Exception:
             logging.exception("RAGFlowPdfParser __images__")
+
+        for page in pages:
+            try:
+                self.page_chars.append([c for c in page.dedupe_chars().chars if self._has_color(c)])
+            except Exception as e:
+                logging.warning(f"Failed to extract characters for page {page.page_number}: {str(e)}")
+                self.page_chars.append([])  # If failed to extract, using empty list instead.
         logging.info(f"__images__ dedupe_chars cost {timer() - start}s")
 
         self.outlines = []
         try:
             with (pdf2_read(fnm if isinstance(fnm, str)
-                            else BytesIO(fnm))) as pdf:
-                self.pdf = pdf
-
-                outlines = self.pdf.outline
+                            else BytesIO(fnm))) as outline_pdf:
+                outlines = outline_pdf.outline
                 def dfs(arr, depth):
                     for a in arr:
                         if isinstance(a, dict):
@@ -1043,17 +1281,33 @@ class RAGFlowPdfParser:
         if not self.outlines:
             logging.warning("Miss outlines")
 
-        logging.debug("Images converted.")
         self.is_english = [re.search(r"[a-zA-Z0-9,/¸;:'\[\]\(\)!@#$%^&*\"?<>._-]{30,}", "".join(
             random.choices([c["text"] for c in self.page_chars[i]], k=min(100, len(self.page_chars[i]))))) for i in
             range(len(self.page_chars))]
         if sum([1 if e else 0 for e in self.is_english]) > len(
-                self.page_images) / 2:
+                pages) / 2:
             self.is_english = True
         else:
             self.is_english = False
 
-        async def __img_ocr(i, id, img, chars, limiter):
+        text_layer_pages = set()
+        image_pages = set()
+
+        def __ocr_preprocess(i):
+            if TEXT_LAYER_FAST_PATH and self._text_layer_usable(pages[i], self.page_chars[i]):
+                text_layer_pages.add(i)
+            try:
+                if pages[i].images:
+                    image_pages.add(i)
+            except Exception:
+                image_pages.add(i)
+            chars = self.page_chars[i] if not self.is_english or i in text_layer_pages else []
+            self.mean_height.append(
+                np.median(sorted([c["height"] for c in chars])) if chars else 0
+            )
+            self.mean_width.append(
+                np.median(sorted([c["width"] for c in chars])) if chars else 8
+            )
             j = 0
             while j + 1 < len(chars):
                 if chars[j]["text"] and chars[j + 1]["text"] \
@@ -1062,44 +1316,83 @@ class RAGFlowPdfParser:
                                                                        chars[j]["width"]) / 2:
                     chars[j]["text"] += " "
                 j += 1
-
-            if limiter:
+            return chars
+
+        def __ocr_page(i, img, chars, device_id):
+            if i in text_layer_pages:
+                return self._text_layer_boxes(i + 1, chars), []
+            bxs, boxes_to_reg = self.__ocr_detect(i + 1, img, chars, zoomin, device_id)
+            ZM = zoomin
+            # Small print may only be found on a finer rendering of the page. Only pages with a little
+            # ink and no pictures, whose ink can hardly be anything else, are rendered again.
+            while not bxs and not chars and ZM < 9 and i not in image_pages and self._sparse_ink(img):
+                ZM *= 3
+                img = self._render_page(pages[i], ZM)
+                bxs, boxes_to_reg = self.__ocr_detect(i + 1, img, chars, ZM, device_id)
+            return bxs, boxes_to_reg
+
+        # Pages are rendered one at a time, at most OCR_LOOKAHEAD_PAGES ahead of detection.
+        # Detection runs concurrently and hands the pages over to recognizers which batch
+        # the lines of every page detected meanwhile, so detection of the next pages
+        # overlaps recognition of the previous ones.
+        async def __img_ocr(i, img, chars, send_chan, render_slots):
+            device_id = i % PARALLEL_DEVICES if self.parallel_limiter else 0
+            limiter = self.parallel_limiter[device_id] if self.parallel_limiter else self.ocr_limiter
+            async with send_chan:
                 async with limiter:
-                    await trio.to_thread.run_sync(lambda: self.__ocr(i + 1, img, chars, zoomin, id))
-            else:
-                self.__ocr(i + 1, img, chars, zoomin, id)
-
-            if callback and i % 6 == 5:
-                callback(prog=(i + 1) * 0.6 / len(self.page_images), msg="")
+                    bxs, boxes_to_reg = await trio.to_thread.run_sync(lambda: __ocr_page(i, img, chars, device_id))
+                render_slots.release()
+                await send_chan.send((i + 1, bxs, boxes_to_reg))
+
+        pages_done = 0
+
+        async def __img_rec(device_id, receive_chan):
+            nonlocal pages_done
+            limiter = self.parallel_limiter[device_id] if self.parallel_limiter else self.ocr_limiter
+            async with receive_chan:
+                async for page in receive_chan:
+                    pages_rec = [page]
+                    lines = len(page[2])
+                    while lines < OCR_REC_BATCH_SIZE:
+                        try:
+                            page = receive_chan.receive_nowait()
+                        except (trio.WouldBlock, trio.EndOfChannel):
+                            break
+                        pages_rec.append(page)
+                        lines += len(page[2])
+                    async with limiter:
+                        await trio.to_thread.run_sync(lambda: self.__ocr_recognize(pages_rec, device_id))
+                    pages_done += len(pages_rec)
+                    if callback:
+                        callback(prog=pages_done * 0.6 / len(pages), msg="")
 
         async def __img_ocr_launcher():
-            def __ocr_preprocess():
-                chars = self.page_chars[i] if not self.is_english else []
-                self.mean_height.append(
-                    np.median(sorted([c["height"] for c in chars])) if chars else 0
-                )
-                self.mean_width.append(
-                    np.median(sorted([c["width"] for c in chars])) if chars else 8
-                )
-                self.page_cum_height.append(img.size[1] / zoomin)
-                return chars
-
-            if self.parallel_limiter:
-                async with trio.open_nursery() as nursery:
-                    for i, img in enumerate(self.page_images):
-                        chars = __ocr_preprocess()
-
-                        nursery.start_soon(__img_ocr, i, i % PARALLEL_DEVICES, img, chars,
-                                           self.parallel_limiter[i % PARALLEL_DEVICES])
-                        await trio.sleep(0.1)
-            else:
-                for i, img in enumerate(self.page_images):
-                    chars = __ocr_preprocess()
-                    await __img_ocr(i, 0, img, chars, None)
+            send_chan, receive_chan = trio.open_memory_channel(len(pages))
+            render_slots = trio.Semaphore(max(OCR_LOOKAHEAD_PAGES, PARALLEL_DEVICES if self.parallel_limiter else 1))
+            recognizers = PARALLEL_DEVICES if self.parallel_limiter else max(1, min(OCR_WORKERS // 2, math.ceil(len(pages) / 4)))
+            async with trio.open_nursery() as nursery:
+                async with send_chan, receive_chan:
+                    for device_id in range(recognizers):
+                        nursery.start_soon(__img_rec, device_id, receive_chan.clone())
+                    for i, page in enumerate(pages):
+                        await render_slots.acquire()
+                        img = await trio.to_thread.run_sync(lambda: self._render_page(page, zoomin))
+                        self.page_images[i] = img
+                        self.page_cum_height[i + 1] = img.size[1] / zoomin
+                        nursery.start_soon(__img_ocr, i, img, page_chars[i], send_chan.clone(), render_slots)
 
         start = timer()
 
-        trio.run(__img_ocr_launcher)
+        page_chars = [__ocr_preprocess(i) for i in range(len(pages))]
+        logging.info(f"__images__ reads {len(text_layer_pages)} of {len(pages)} pages from their text layer")
+        self.page_images = [None] * len(pages)
+        self.page_cum_height = [0] * (len(pages) + 1)
+        self.boxes = [[] for _ in pages]
+        try:
+            trio.run(__img_ocr_launcher)
+        finally:
+            if pdf:
+                pdf.close()
 
         logging.info(f"__images__ {len(self.page_images)} pages cost {timer() - start}s")
 
@@ -1113,8 +1406,7 @@ class RAGFlowPdfParser:
 
         self.page_cum_height = np.cumsum(self.page_cum_height)
         assert len(self.page_cum_height) == len(self.page_images) + 1
-        if len(self.boxes) == 0 and zoomin < 9:
-            self.__images__(fnm, zoomin * 3, page_from, page_to, callback)
+        self._save_parse_cache("ocr")
 
     def __call__(self, fnm, need_image=True, zoomin=3, return_html=False):
         self.__images__(fnm, zoomin)
@@ -1270,12 +1562,10 @@ class VisionParser(RAGFlowPdfParser):
 
     def __images__(self, fnm, zoomin=3, page_from=0, page_to=299, callback=None):
         try:
-            with sys.modules[LOCK_KEY_pdfplumber]:
-                self.pdf = pdfplumber.open(fnm) if isinstance(
-                    fnm, str) else pdfplumber.open(BytesIO(fnm))
-                self.page_images = [p.to_image(resolution=72 * zoomin).annotated for i, p in
-                                    enumerate(self.pdf.pages[page_from:page_to])]
-                self.total_page = len(self.pdf.pages)
+            self.pdf = pdfplumber.open(fnm) if isinstance(
+                fnm, str) else pdfplumber.open(BytesIO(fnm))
+            self.page_images = [self._render_page(p, zoomin) for p in self.pdf.pages[page_from:page_to]]
+            self.total_page = len(self.pdf.pages)
         except Exception:
             self.page_images = None
             self.total_page = 0
@@ -1286,27 +1576,9 @@ class VisionParser(RAGFlowPdfParser):
 
         self.__images__(fnm=filename, zoomin=3, page_from=from_page, page_to=to_page, **kwargs)
 
-        total_pdf_pages = self.total_page
-
-        start_page = max(0, from_page)
-        end_page = min(to_page, total_pdf_pages)
-
-        all_docs = []
-
-        for idx, img_binary in enumerate(self.page_images or []):
-            pdf_page_num = idx  # 0-based
-            if pdf_page_num < start_page or pdf_page_num >= end_page:
-                continue
-
-            docs = picture_vision_llm_chunk(
-                binary=img_binary,
-                vision_model=self.vision_model,
-                prompt=vision_llm_describe_prompt(page=pdf_page_num+1),
-                callback=callback,
-            )
-
-            if docs:
-                all_docs.append(docs)
+        images = self.page_images or []
+        prompts = [vision_llm_describe_prompt(page=from_page + idx + 1) for idx in range(len(images))]
+        all_docs = [docs for docs in picture_vision_llm_chunks(images, self.vision_model, prompts, callback) if docs]
         return [(doc, "") for doc in all_docs], []
 
 
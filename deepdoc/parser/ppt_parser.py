@@ -15,9 +15,33 @@
 #
 
 import logging
+import math
+import multiprocessing
+import os
 from io import BytesIO
+from itertools import islice
 from pptx import Presentation
 
+# Processes extracting the slides of big decks, a range of slides each.
+PPT_WORKERS = int(os.environ.get("PPT_WORKERS", max(1, min(8, (os.cpu_count() or 2) // 2))))
+# Decks with fewer slides to extract are read in this process.
+PPT_PARALLEL_MIN_SLIDES = int(os.environ.get("PPT_PARALLEL_MIN_SLIDES", 64))
+# Seconds the workers get to extract a deck.
+PPT_PARALLEL_TIMEOUT = int(os.environ.get("PPT_PARALLEL_TIMEOUT", 600))
+
+# Parser and deck of a worker process, opened once by _open_deck for all the ranges it extracts.
+_worker_deck = None
+
+
+def _open_deck(parser_cls, fnm):
+    global _worker_deck
+    _worker_deck = (parser_cls(), Presentation(fnm if isinstance(fnm, str) else BytesIO(fnm)))
+
+
+def _extract_slides(from_page, to_page):
+    parser, ppt = _worker_deck
+    return [parser._slide_text(slide) for slide in islice(ppt.slides, from_page, to_page)]
+
 
 class RAGFlowPptParser:
     def __init__(self):
@@ -63,7 +87,7 @@ class RAGFlowPptParser:
             if shape_type == 6:
                 texts = []
                 for p in sorted(shape.shapes, key=lambda x: (x.top // 10, x.left)):
-                    t = self.__extract_texts(p)
+                    t = self.__extract(p)
                     if t:
                         texts.append(t)
                 return "\n".join(texts)
@@ -74,26 +98,36 @@ class RAGFlowPptParser:
             logging.error(f"Error processing shape: {str(e)}")
             return ""
 
+    def _slide_text(self, slide):
+        texts = []
+        for shape in sorted(
+                slide.shapes, key=lambda x: ((x.top if x.top is not None else 0) // 10, x.left)):
+            try:
+                txt = self.__extract(shape)
+                if txt:
+                    texts.append(txt)
+            except Exception as e:
+                logging.exception(e)
+        return "\n".join(texts)
+
     def __call__(self, fnm, from_page, to_page, callback=None):
         ppt = Presentation(fnm) if isinstance(
             fnm, str) else Presentation(
             BytesIO(fnm))
-        txts = []
         self.total_page = len(ppt.slides)
-        for i, slide in enumerate(ppt.slides):
-            if i < from_page:
-                continue
-            if i >= to_page:
-                break
-            texts = []
-            for shape in sorted(
-                    slide.shapes, key=lambda x: ((x.top if x.top is not None else 0) // 10, x.left)):
-                try:
-                    txt = self.__extract(shape)
-                    if txt:
-                        texts.append(txt)
-                except Exception as e:
-                    logging.exception(e)
-            txts.append("\n".join(texts))
-
-        return txts
\ No newline at end of file
+        from_page, to_page = max(0, from_page), min(to_page, self.total_page)
+        n = to_page - from_page
+        workers = min(PPT_WORKERS, n // PPT_PARALLEL_MIN_SLIDES + 1)
+        if workers <= 1 or "forkserver" not in multiprocessing.get_all_start_methods():
+            return [self._slide_text(slide) for slide in islice(ppt.slides, from_page, to_page)]
+
+        # The workers are forked from a single-threaded server process, which has imported the main
+        # module once for all of them, not from this one whose other threads may hold locks. They
+        # get the file rather than the parsed deck.
+        ctx = multiprocessing.get_context("forkserver")
+        # A few ranges per worker, so that slow slides do not hold up one worker alone.
+        step = math.ceil(n / (workers * 4))
+        ranges = [(i, min(i + step, to_page)) for i in range(from_page, to_page, step)]
+        with ctx.Pool(workers, initializer=_open_deck, initargs=(type(self), fnm)) as pool:
+            parts = pool.starmap_async(_extract_slides, ranges).get(timeout=PPT_PARALLEL_TIMEOUT)
+        return [txt for part in parts for txt in part]
@@ -19,7 +19,7 @@ import threading
 import pdfplumber
 
 from .ocr import OCR
-from .recognizer import Recognizer
+from .recognizer import BoxIndex, Recognizer
 from .layout_recognizer import LayoutRecognizer4YOLOv10 as LayoutRecognizer
 from .table_structure_recognizer import TableStructureRecognizer
 
@@ -80,6 +80,7 @@ def init_in_out(args):
 __all__ = [
     "OCR",
     "Recognizer",
+    "BoxIndex",
     "LayoutRecognizer",
     "TableStructureRecognizer",
     "init_in_out",
@@ -0,0 +1,91 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Client side of the deepdoc inference server (see inference_server.py).
+
+When DEEPDOC_SERVER is set to the Unix socket of a running server, OCR, layout and TSR models are
+not loaded in this process: their calls are forwarded to the server, which holds a single copy of
+each model for all the task executors of the host.
+"""
+import logging
+import os
+import threading
+import time
+from multiprocessing.connection import Client
+
+DEEPDOC_SERVER = os.environ.get("DEEPDOC_SERVER", "")
+# Set by the server itself, so that its models run locally.
+SERVING = False
+
+
+class InferenceClient:
+    """Thread-safe client: every thread talks to the server over its own connection."""
+
+    def __init__(self, address):
+        self.address = address
+        self.local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = Client(self.address, family="AF_UNIX")
+            self.local.conn = conn
+        return conn
+
+    def call(self, *req):
+        for i in range(3):
+            try:
+                conn = self._conn()
+                conn.send(req)
+                status, res = conn.recv()
+                break
+            except (EOFError, OSError) as e:
+                self.local.conn = None
+                if i >= 2:
+                    raise e
+                logging.warning(f"deepdoc inference server {self.address} unreachable, retrying: {e}")
+                time.sleep(1)
+        if status != "ok":
+            raise RuntimeError(f"deepdoc inference server: {res}")
+        return res
+
+
+class RemoteModel:
+    """Stands for a local model object: calling it runs `method` of the model `name` on the server."""
+
+    def __init__(self, client, method, *model):
+        self.client = client
+        self.method = method
+        self.model = model
+
+    def __call__(self, *args):
+        return self.client.call(self.method, self.model, *args)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def inference_client():
+    """The client of DEEPDOC_SERVER, or None when models are to be run in this process."""
+    global _client
+    if not DEEPDOC_SERVER or SERVING:
+        return None
+    with _client_lock:
+        if _client is None:
+            _client = InferenceClient(DEEPDOC_SERVER)
+            logging.info(f"deepdoc models are served by {DEEPDOC_SERVER}")
+    return _client
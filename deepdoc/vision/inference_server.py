@@ -0,0 +1,193 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Serves the deepdoc models (OCR, layout and TSR) to every task executor of a host over a Unix socket,
+so that the models are loaded once per host instead of once per executor.
+
+    python deepdoc/vision/inference_server.py --socket /tmp/deepdoc.sock
+
+and start the task executors with DEEPDOC_SERVER=/tmp/deepdoc.sock.
+
+Requests for the same model that arrive within DEEPDOC_SERVER_BATCH_WAIT milliseconds of each other
+are run as one batch, whichever executor they come from. DEEPDOC_SERVER_WORKERS threads run the
+batches; ONNX Runtime releases the GIL and the CPU threads of all models are capped by
+DEEPDOC_ORT_THREAD_BUDGET.
+"""
+import argparse
+import importlib
+import inspect
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from functools import partial
+from multiprocessing.connection import Listener
+
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../')))
+
+import deepdoc.vision.inference_client as inference_client
+
+inference_client.SERVING = True
+
+from deepdoc.vision.ocr import OCR
+from deepdoc.vision.recognizer import Recognizer
+
+WORKERS = int(os.environ.get("DEEPDOC_SERVER_WORKERS", max(1, (os.cpu_count() or 2) // 4)))
+BATCH_WAIT = int(os.environ.get("DEEPDOC_SERVER_BATCH_WAIT", 5)) / 1000.
+MAX_BATCH = int(os.environ.get("DEEPDOC_SERVER_MAX_BATCH", 32))
+
+
+class InferenceServer:
+    def __init__(self, address):
+        self.address = address
+        self._ocr = None
+        self.recognizers = {}
+        self.recognizers_lock = threading.Lock()
+        self.queues = defaultdict(queue.Queue)
+        self.pending = queue.Queue()
+
+    @property
+    def ocr(self):
+        with self.recognizers_lock:
+            if self._ocr is None:
+                self._ocr = OCR()
+                logging.info("Loaded OCR")
+            return self._ocr
+
+    def recognizer(self, module, qualname, task_name):
+        key = (module, qualname, task_name)
+        with self.recognizers_lock:
+            if key not in self.recognizers:
+                cls = importlib.import_module(module)
+                for nm in qualname.split("."):
+                    cls = getattr(cls, nm)
+                if len(inspect.signature(cls.__init__).parameters) > 1:
+                    self.recognizers[key] = cls(task_name)
+                else:
+                    self.recognizers[key] = cls()
+                logging.info(f"Loaded {qualname}({task_name})")
+            return self.recognizers[key]
+
+    def run_batch(self, method, model, reqs):
+        """Run the requests `reqs` [(args, future)] of one model as a single call where possible."""
+        if method == "detect":
+            for args, fut in reqs:
+                fut.set_result(self.ocr.text_detector[model[0]](*args))
+            return
+
+        if method == "recognize":
+            groups = [((), reqs)]
+            run = self.ocr.text_recognizer[model[0]]
+        else:
+            inst = self.recognizer(*model)
+            by_params = defaultdict(list)
+            for args, fut in reqs:
+                by_params[tuple(args[1:])].append((args, fut))
+            groups = list(by_params.items())
+            # Clients forward the batch step of Recognizer.__call__, which subclasses wrap with
+            # their own arguments and post-processing, already run on the client side.
+            run = partial(Recognizer.__call__, inst)
+
+        for params, grp in groups:
+            imgs = []
+            for args, _ in grp:
+                imgs.extend(args[0])
+            if method == "recognize":
+                res, elapse = run(imgs)
+            else:
+                res = run(imgs, *params)
+            i = 0
+            for args, fut in grp:
+                n = len(args[0])
+                fut.set_result((res[i:i + n], elapse) if method == "recognize" else res[i:i + n])
+                i += n
+
+    def dispatch(self):
+        while True:
+            key = self.pending.get()
+            q = self.queues[key]
+            reqs = []
+            deadline = time.time() + BATCH_WAIT
+            while len(reqs) < MAX_BATCH:
+                try:
+                    reqs.append(q.get(timeout=max(0, deadline - time.time())))
+                except queue.Empty:
+                    break
+            if not reqs:
+                continue
+            method, model = key
+            try:
+                self.run_batch(method, model, reqs)
+            except Exception as e:
+                logging.exception(f"deepdoc inference server: {method}{model} failed")
+                for _, fut in reqs:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    def submit(self, method, model, args):
+        fut = Future()
+        key = (method, tuple(model))
+        self.queues[key].put((args, fut))
+        self.pending.put(key)
+        return fut
+
+    def serve_conn(self, conn):
+        with conn:
+            while True:
+                try:
+                    method, model, *args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    conn.send(("ok", self.submit(method, model, args).result()))
+                except Exception as e:
+                    conn.send(("error", repr(e)))
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        # Requests are pickles: the socket is created accessible to its owner only, not tightened
+        # after the fact.
+        umask = os.umask(0o177)
+        try:
+            listener = Listener(self.address, family="AF_UNIX")
+        finally:
+            os.umask(umask)
+        for _ in range(WORKERS):
+            threading.Thread(target=self.dispatch, daemon=True).start()
+        with listener:
+            logging.info(f"deepdoc inference server listening on {self.address} with {WORKERS} workers")
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self.serve_conn, args=(conn,), daemon=True).start()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(levelname)-8s %(message)s")
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--socket', help="Unix socket to listen on", default=inference_client.DEEPDOC_SERVER or "/tmp/deepdoc.sock")
+    args = parser.parse_args()
+    InferenceServer(args.socket).serve_forever()
@@ -31,6 +31,8 @@ import cv2
 import onnxruntime as ort
 
 from .postprocess import build_post_process
+from .ort_session import create_session
+from .inference_client import RemoteModel, inference_client
 
 loaded_models = {}
 
@@ -90,12 +92,6 @@ def load_model(model_dir, nm, device_id: int | None = None):
             return False
         return False
 
-    options = ort.SessionOptions()
-    options.enable_cpu_mem_arena = False
-    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
-    options.intra_op_num_threads = 2
-    options.inter_op_num_threads = 2
-
     # https://github.com/microsoft/onnxruntime/issues/9509#issuecomment-951546580
     # Shrink GPU memory after execution
     run_options = ort.RunOptions()
@@ -105,18 +101,16 @@ def load_model(model_dir, nm, device_id: int | None = None):
             "gpu_mem_limit": 512 * 1024 * 1024, # Limit gpu memory
             "arena_extend_strategy": "kNextPowerOfTwo",  # gpu memory allocation strategy
         }
-        sess = ort.InferenceSession(
-            model_file_path,
-            options=options,
+        sess = create_session(
+            model_dir, nm, model_file_path,
             providers=['CUDAExecutionProvider'],
             provider_options=[cuda_provider_options]
             )
         run_options.add_run_config_entry("memory.enable_memory_arena_shrinkage", "gpu:" + str(device_id))
         logging.info(f"load_model {model_file_path} uses GPU")
     else:
-        sess = ort.InferenceSession(
-            model_file_path,
-            options=options,
+        sess = create_session(
+            model_dir, nm, model_file_path,
             providers=['CPUExecutionProvider'])
         run_options.add_run_config_entry("memory.enable_memory_arena_shrinkage", "cpu")
         logging.info(f"load_model {model_file_path} uses CPU")
@@ -522,7 +516,12 @@ class OCR:
         ^_-
 
         """
-        if not model_dir:
+        client = inference_client()
+        if client:
+            devices = range(PARALLEL_DEVICES) if PARALLEL_DEVICES else range(1)
+            self.text_detector = [RemoteModel(client, "detect", device_id) for device_id in devices]
+            self.text_recognizer = [RemoteModel(client, "recognize", device_id) for device_id in devices]
+        elif not model_dir:
             try:
                 model_dir = os.path.join(
                         get_project_base_directory(),
@@ -0,0 +1,228 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+ONNX Runtime sessions of the deepdoc models (OCR, layout and TSR).
+
+Every setting can be given for all models with `DEEPDOC_ORT_<SETTING>` or for a single model with
+`DEEPDOC_ORT_<MODEL>_<SETTING>`, where <MODEL> is the upper-cased model name with non-alphanumeric
+characters replaced by `_` (DET, REC, LAYOUT, LAYOUT_LAWS, TSR, ...):
+
+- INTRA_OP_THREADS / INTER_OP_THREADS: thread pools of the session (default 0 / 0, ORT's own sizing:
+  one intra-op thread per physical core, and a run takes the whole thread budget). The sessions
+  used to be pinned to 2 / 2 threads; set DEEPDOC_ORT_INTRA_OP_THREADS=2 to keep that behaviour.
+- EXECUTION_MODE: `sequential` or `parallel` (default sequential).
+- GRAPH_OPT_LEVEL: `disable`, `basic`, `extended` or `all` (default all).
+- CPU_MEM_ARENA: 1 to enable the CPU memory arena (default 0).
+- INT8: 1 to load `<model>.int8.onnx`, quantizing the model into the cache directory if it is not shipped.
+
+On CPU the optimized graph is saved into DEEPDOC_ORT_CACHE_DIR (default: the model directory) and
+reused on the next start. At level `all`, the graph saved is the `extended` one: the layout
+optimizations `all` adds depend on the CPU, so they are redone when the saved graph is loaded. DEEPDOC_ORT_THREAD_BUDGET (default: the number of CPUs) caps the intra-op
+threads busy at the same time across all CPU sessions, so that concurrent pages share the models
+without oversubscribing the cores.
+"""
+import logging
+import os
+import re
+import threading
+
+import onnxruntime as ort
+
+GRAPH_OPT_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+THREAD_BUDGET = int(os.environ.get("DEEPDOC_ORT_THREAD_BUDGET", os.cpu_count() or 2))
+CACHE_DIR = os.environ.get("DEEPDOC_ORT_CACHE_DIR", "")
+
+
+def ort_setting(nm, key, default):
+    model_key = "DEEPDOC_ORT_{}_{}".format(re.sub(r"[^A-Z0-9]", "_", nm.upper()), key)
+    return os.environ.get(model_key, os.environ.get("DEEPDOC_ORT_" + key, default))
+
+
+class ThreadBudget:
+    """Counting semaphore whose holders take as many units as the threads their run will use."""
+
+    def __init__(self, total):
+        self.total = max(1, total)
+        self.free = self.total
+        self.cond = threading.Condition()
+
+    def acquire(self, n):
+        n = min(n, self.total)
+        with self.cond:
+            self.cond.wait_for(lambda: self.free >= n)
+            self.free -= n
+        return n
+
+    def release(self, n):
+        with self.cond:
+            self.free += n
+            self.cond.notify_all()
+
+
+cpu_thread_budget = ThreadBudget(THREAD_BUDGET)
+
+
+class PooledSession:
+    """
+    An InferenceSession shared by every caller of the same model. Runs on CPU hold their share of
+    the thread budget for the duration of the call.
+    """
+
+    def __init__(self, sess, threads, budget=None):
+        self.sess = sess
+        self.threads = threads
+        self.budget = budget
+
+    def run(self, output_names, input_feed, run_options=None):
+        if self.budget is None:
+            return self.sess.run(output_names, input_feed, run_options)
+        n = self.budget.acquire(self.threads)
+        try:
+            return self.sess.run(output_names, input_feed, run_options)
+        finally:
+            self.budget.release(n)
+
+    def __getattr__(self, name):
+        return getattr(self.sess, name)
+
+
+def _cache_dir(model_dir):
+    d = CACHE_DIR or model_dir
+    try:
+        os.makedirs(d, exist_ok=True)
+    except OSError:
+        return None
+    return d if os.access(d, os.W_OK) else None
+
+
+def _is_fresh(path, source):
+    """Whether the cache entry `path` was made from the current `source`. Entries are written by
+    _write_atomically, so an entry that exists is complete."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return st.st_size > 0 and st.st_mtime >= os.path.getmtime(source)
+
+
+def _write_atomically(path, write):
+    """Calls write(tmp) and moves `tmp` to `path`, so that readers never see a partial file."""
+    root, ext = os.path.splitext(path)
+    # keeps the extension, from which ONNX Runtime picks the format it writes
+    tmp = f"{root}.{os.getpid()}.{threading.get_ident()}.tmp{ext}"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _int8_model(model_dir, nm, model_file_path):
+    shipped = os.path.join(model_dir, nm + ".int8.onnx")
+    if os.path.exists(shipped):
+        return shipped
+    cache_dir = _cache_dir(model_dir)
+    if not cache_dir:
+        logging.warning(f"No writable directory to quantize {model_file_path}, keeping float model")
+        return model_file_path
+    quantized = os.path.join(cache_dir, nm + ".int8.onnx")
+    if _is_fresh(quantized, model_file_path):
+        return quantized
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        _write_atomically(quantized, lambda tmp: quantize_dynamic(model_file_path, tmp, weight_type=QuantType.QInt8))
+        logging.info(f"Quantized {model_file_path} into {quantized}")
+        return quantized
+    except Exception:
+        logging.exception(f"Fail to quantize {model_file_path}, keeping float model")
+        return model_file_path
+
+
+def _optimize_model(nm, model_file_path, optimized, level):
+    """Saves the graph of `model_file_path` optimized at `level` for the CPU into `optimized`."""
+    options = session_options(nm)
+    options.graph_optimization_level = GRAPH_OPT_LEVELS[level]
+
+    def write(tmp):
+        options.optimized_model_filepath = tmp
+        ort.InferenceSession(model_file_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+    try:
+        _write_atomically(optimized, write)
+        logging.info(f"load_model saved optimized model {optimized}")
+    except Exception:
+        logging.exception(f"Fail to save the optimized graph of {model_file_path}")
+
+
+def session_options(nm):
+    options = ort.SessionOptions()
+    options.enable_cpu_mem_arena = int(ort_setting(nm, "CPU_MEM_ARENA", 0)) > 0
+    options.execution_mode = EXECUTION_MODES[ort_setting(nm, "EXECUTION_MODE", "sequential").lower()]
+    options.intra_op_num_threads = int(ort_setting(nm, "INTRA_OP_THREADS", 0))
+    options.inter_op_num_threads = int(ort_setting(nm, "INTER_OP_THREADS", 0))
+    options.graph_optimization_level = GRAPH_OPT_LEVELS[ort_setting(nm, "GRAPH_OPT_LEVEL", "all").lower()]
+    return options
+
+
+def create_session(model_dir, nm, model_file_path, providers, provider_options=None):
+    """
+    Build the session of `model_file_path`. On CPU, the optimized graph is read from or written to the
+    cache directory so that graph optimizations only run once per model, level and ORT version. A
+    cached graph that fails to load is ignored in favor of the original model.
+    """
+    options = session_options(nm)
+    if int(ort_setting(nm, "INT8", 0)) > 0:
+        model_file_path = _int8_model(model_dir, nm, model_file_path)
+
+    on_cpu = providers == ["CPUExecutionProvider"]
+    cache_dir = _cache_dir(model_dir) if on_cpu and options.graph_optimization_level != ort.GraphOptimizationLevel.ORT_DISABLE_ALL else None
+    sess = None
+    if cache_dir:
+        level = ort_setting(nm, "GRAPH_OPT_LEVEL", "all").lower()
+        saved_level = "extended" if level == "all" else level
+        base = os.path.splitext(os.path.basename(model_file_path))[0]
+        optimized = os.path.join(cache_dir, f"{base}.{saved_level}.ort{ort.__version__}.opt.onnx")
+        if not _is_fresh(optimized, model_file_path):
+            _optimize_model(nm, model_file_path, optimized, saved_level)
+        if _is_fresh(optimized, model_file_path):
+            if level != "all":
+                options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            try:
+                sess = ort.InferenceSession(optimized, sess_options=options, providers=providers, provider_options=provider_options)
+                logging.info(f"load_model reuses optimized model {optimized}")
+            except Exception:
+                logging.exception(f"Fail to load the optimized model {optimized}, loading {model_file_path}")
+                options.graph_optimization_level = GRAPH_OPT_LEVELS[level]
+                try:
+                    os.remove(optimized)
+                except OSError:
+                    pass
+
+    if sess is None:
+        sess = ort.InferenceSession(model_file_path, sess_options=options, providers=providers, provider_options=provider_options)
+    budget = cpu_thread_budget if on_cpu else None
+    # 0 lets ORT use one thread per core
+    return PooledSession(sess, options.intra_op_num_threads or THREAD_BUDGET, budget)
@@ -19,6 +19,7 @@ import os
 import math
 import numpy as np
 import cv2
+from collections import defaultdict
 from functools import cmp_to_key
 
 
@@ -27,6 +28,40 @@ from .operators import *  # noqa: F403
 from .operators import preprocess
 from . import operators
 from .ocr import load_model
+from .inference_client import RemoteModel, inference_client
+
+
+class BoxIndex:
+    """
+    Grid over the vertical extent of a list of boxes. candidates() returns, in list order, the
+    boxes touching a box vertically, which are the only ones the overlap searches of Recognizer
+    can pick, so they no longer scan every box for every char or line.
+    """
+
+    def __init__(self, boxes, cell=None):
+        self.boxes = boxes
+        top = np.array([b["top"] for b in boxes], dtype=np.float64)
+        bottom = np.array([b["bottom"] for b in boxes], dtype=np.float64)
+        if cell is None:
+            heights = bottom - top
+            heights = heights[heights > 0]
+            cell = float(np.median(heights)) if len(heights) else 10.
+        self.cell = max(cell, 1.)
+        self.grid = defaultdict(list)
+        for i, (t, b) in enumerate(zip(np.floor(top / self.cell).astype(int), np.floor(bottom / self.cell).astype(int))):
+            for k in range(t, max(t, b) + 1):
+                self.grid[k].append(i)
+
+    def candidates(self, box):
+        t = math.floor(box["top"] / self.cell)
+        b = math.floor(box["bottom"] / self.cell)
+        if b - t == 0:
+            return self.grid.get(t, [])
+        ii = set()
+        for k in range(t, max(t, b) + 1):
+            ii.update(self.grid.get(k, []))
+        return sorted(ii)
+
 
 class Recognizer:
     def __init__(self, label_list, task_name, model_dir=None):
@@ -41,6 +76,12 @@ class Recognizer:
         ^_-
 
         """
+        self.label_list = label_list
+        self.remote = None
+        client = inference_client()
+        if client:
+            self.remote = RemoteModel(client, "predict", type(self).__module__, type(self).__qualname__, task_name)
+            return
         if not model_dir:
             model_dir = os.path.join(
                         get_project_base_directory(),
@@ -49,7 +90,6 @@ class Recognizer:
         self.input_names = [node.name for node in self.ort_sess.get_inputs()]
         self.output_names = [node.name for node in self.ort_sess.get_outputs()]
         self.input_shape = self.ort_sess.get_inputs()[0].shape[2:4]
-        self.label_list = label_list
 
     @staticmethod
     def sort_Y_firstly(arr, threashold):
@@ -76,6 +116,9 @@ class Recognizer:
         # sort using y1 first and then x1
         # sorted(arr, key=lambda r: (r["x0"], r["top"]))
         arr = Recognizer.sort_X_firstly(arr, thr)
+        if all(["C" in a for a in arr]):
+            # The passes below are then an insertion sort, hence a stable sort.
+            return sorted(arr, key=lambda a: (a["C"], a["top"]))
         for i in range(len(arr) - 1):
             for j in range(i, -1, -1):
                 # restore the order using th
@@ -96,6 +139,9 @@ class Recognizer:
         # sort using y1 first and then x1
         # sorted(arr, key=lambda r: (r["top"], r["x0"]))
         arr = Recognizer.sort_Y_firstly(arr, thr)
+        if all(["R" in a for a in arr]):
+            # The passes below are then an insertion sort, hence a stable sort.
+            return sorted(arr, key=lambda a: (a["R"], a["x0"]))
         for i in range(len(arr) - 1):
             for j in range(i, -1, -1):
                 if "R" not in arr[j] or "R" not in arr[j + 1]:
@@ -139,6 +185,7 @@ class Recognizer:
                         a["bottom"] < b["top"],
                         a["top"] > b["bottom"]])
 
+        index = None
         i = 0
         while i + 1 < len(layouts):
             j = i + 1
@@ -161,12 +208,15 @@ class Recognizer:
                     layouts.pop(i)
                 continue
 
+            if index is None:
+                index = BoxIndex(boxes)
             area_i, area_i_1 = 0, 0
-            for b in boxes:
-                if not notOverlapped(b, layouts[i]):
-                    area_i += Recognizer.overlapped_area(b, layouts[i], False)
-                if not notOverlapped(b, layouts[j]):
-                    area_i_1 += Recognizer.overlapped_area(b, layouts[j], False)
+            for k in index.candidates(layouts[i]):
+                if not notOverlapped(boxes[k], layouts[i]):
+                    area_i += Recognizer.overlapped_area(boxes[k], layouts[i], False)
+            for k in index.candidates(layouts[j]):
+                if not notOverlapped(boxes[k], layouts[j]):
+                    area_i_1 += Recognizer.overlapped_area(boxes[k], layouts[j], False)
 
             if area_i > area_i_1:
                 layouts.pop(j)
@@ -215,7 +265,7 @@ class Recognizer:
         return inputs
 
     @staticmethod
-    def find_overlapped(box, boxes_sorted_by_y, naive=False):
+    def find_overlapped(box, boxes_sorted_by_y, naive=False, index: BoxIndex | None = None):
         if not boxes_sorted_by_y:
             return
         bxs = boxes_sorted_by_y
@@ -240,7 +290,9 @@ class Recognizer:
             break
 
         max_overlaped_i, max_overlaped = None, 0
-        for i in range(s, e):
+        for i in (range(s, e) if index is None else index.candidates(box)):
+            if i < s or i >= e:
+                continue
             ov = Recognizer.overlapped_area(bxs[i], box)
             if ov <= max_overlaped:
                 continue
@@ -264,12 +316,13 @@ class Recognizer:
         return min_i
 
     @staticmethod
-    def find_overlapped_with_threashold(box, boxes, thr=0.3):
+    def find_overlapped_with_threashold(box, boxes, thr=0.3, index: BoxIndex | None = None):
         if not boxes:
             return
         max_overlapped_i, max_overlapped, _max_overlapped = None, thr, 0
         s, e = 0, len(boxes)
-        for i in range(s, e):
+        # Without overlap, a box can only be picked with a null threshold.
+        for i in (range(s, e) if index is None or thr <= 0 else index.candidates(box)):
             ov = Recognizer.overlapped_area(box, boxes[i])
             _ov = Recognizer.overlapped_area(boxes[i], box)
             if (ov, _ov) < (max_overlapped, _max_overlapped):
@@ -406,7 +459,38 @@ class Recognizer:
             "score": float(scores[i])
         } for i in indices]
 
+    def _can_batch(self, inputs):
+        """Whether preprocessed inputs can go through the model in a single run."""
+        if len(inputs) < 2:
+            return False
+        # Models exported with a fixed batch size of 1 have to be run image by image.
+        batch_dim = self.ort_sess.get_inputs()[0].shape[0]
+        if isinstance(batch_dim, int) and batch_dim > 0:
+            return False
+        # Detection models output the boxes of the whole batch at once, they are split by the per image box count.
+        if "scale_factor" in self.input_names and len(self.output_names) < 2:
+            return False
+        return True
+
+    def _shape_buckets(self, inputs):
+        """Group the indices of preprocessed inputs by input shapes, so that each group can be stacked."""
+        buckets = {}
+        for i, ins in enumerate(inputs):
+            buckets.setdefault(tuple(ins[k].shape for k in self.input_names), []).append(i)
+        return list(buckets.values())
+
+    def _run_batch(self, inputs):
+        """Stack same-shape inputs into one NCHW tensor, run the model once and split the outputs per image."""
+        feed = {k: np.concatenate([ins[k] for ins in inputs], axis=0) for k in self.input_names}
+        outputs = self.ort_sess.run(None, feed, self.run_options)
+        if "scale_factor" not in self.input_names:
+            return [outputs[0][i:i + 1] for i in range(len(inputs))]
+        counts = np.cumsum(np.array(outputs[1]).reshape(-1).astype(int))[:-1]
+        return np.split(outputs[0], counts, axis=0)
+
     def __call__(self, image_list, thr=0.7, batch_size=16):
+        if self.remote:
+            return self.remote([img if isinstance(img, np.ndarray) else np.array(img) for img in image_list], thr, batch_size)
         res = []
         imgs = []
         for i in range(len(image_list)):
@@ -422,6 +506,15 @@ class Recognizer:
             batch_image_list = imgs[start_index:end_index]
             inputs = self.preprocess(batch_image_list)
             logging.debug("preprocess")
+            if self._can_batch(inputs):
+                batch_res = [None] * len(inputs)
+                for ii in self._shape_buckets(inputs):
+                    outs = self._run_batch([inputs[j] for j in ii]) if len(ii) > 1 else \
+                        [self.ort_sess.run(None, {k: v for k, v in inputs[ii[0]].items() if k in self.input_names}, self.run_options)[0]]
+                    for j, out in zip(ii, outs):
+                        batch_res[j] = self.postprocess(out, inputs[j], thr)
+                res.extend(batch_res)
+                continue
             for ins in inputs:
                 bb = self.postprocess(self.ort_sess.run(None, {k:v for k,v in ins.items() if k in self.input_names}, self.run_options)[0], ins, thr)
                 res.append(bb)
@@ -429,6 +522,3 @@ class Recognizer:
         #seeit.save_results(image_list, res, self.label_list, threshold=thr)
 
         return res
-
-
-
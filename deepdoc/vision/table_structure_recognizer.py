@@ -17,6 +17,7 @@ import logging
 import os
 import re
 from collections import Counter
+from functools import lru_cache
 
 import numpy as np
 from huggingface_hub import snapshot_download
@@ -57,6 +58,7 @@ class TableStructureRecognizer(Recognizer):
                     "top": b["bbox"][1], "bottom": b["bbox"][-1]
                     } for b in tbl]
             if not lts:
+                res.append(lts)
                 continue
 
             left = [b["x0"] for b in lts if b["label"].find(
@@ -64,6 +66,7 @@ class TableStructureRecognizer(Recognizer):
             right = [b["x1"] for b in lts if b["label"].find(
                 "row") > 0 or b["label"].find("header") > 0]
             if not left:
+                res.append(lts)
                 continue
             left = np.mean(left) if len(left) > 4 else np.min(left)
             right = np.mean(right) if len(right) > 4 else np.max(right)
@@ -103,6 +106,11 @@ class TableStructureRecognizer(Recognizer):
 
     @staticmethod
     def blockType(b):
+        return TableStructureRecognizer._block_type(b["text"].strip())
+
+    @staticmethod
+    @lru_cache(maxsize=65536)
+    def _block_type(txt):
         patt = [
             ("^(20|19)[0-9]{2}[年/-][0-9]{1,2}[月/-][0-9]{1,2}日*$", "Dt"),
             (r"^(20|19)[0-9]{2}年$", "Dt"),
@@ -118,9 +126,9 @@ class TableStructureRecognizer(Recognizer):
             (r"^.{1}$", "Sg")
         ]
         for p, n in patt:
-            if re.search(p, b["text"].strip()):
+            if re.search(p, txt):
                 return n
-        tks = [t for t in rag_tokenizer.tokenize(b["text"]).split() if len(t) > 1]
+        tks = [t for t in rag_tokenizer.tokenize(txt).split() if len(t) > 1]
         if len(tks) > 3:
             if len(tks) < 12:
                 return "Tx"
@@ -367,7 +375,7 @@ class TableStructureRecognizer(Recognizer):
                     continue
                 txt = ""
                 if arr:
-                    h = min(np.min([c["bottom"] - c["top"]
+                    h = min(min([c["bottom"] - c["top"]
                             for c in arr]) / 2, 10)
                     txt = " ".join([c["text"]
                                    for c in Recognizer.sort_Y_firstly(arr, h)])
@@ -511,29 +519,20 @@ class TableStructureRecognizer(Recognizer):
                 for row in rows]
         rbtm = [np.mean([c.get("R_btm", c["bottom"])
                          for c in row]) for row in rows]
+        clft, crgt = np.array(clft, dtype=np.float64), np.array(crgt, dtype=np.float64)
+        rtop, rbtm = np.array(rtop, dtype=np.float64), np.array(rbtm, dtype=np.float64)
+        # the columns and rows whose middle falls within the spanning cell
+        cmid_l, cmid_r = clft + (crgt - clft) / 2, crgt - (crgt - clft) / 2
+        rmid_t, rmid_b = rtop + (rbtm - rtop) / 2, rbtm - (rbtm - rtop) / 2
         for b in boxes:
             if "SP" not in b:
                 continue
             b["colspan"] = [b["cn"]]
             b["rowspan"] = [b["rn"]]
             # col span
-            for j in range(0, len(clft)):
-                if j == b["cn"]:
-                    continue
-                if clft[j] + (crgt[j] - clft[j]) / 2 < b["H_left"]:
-                    continue
-                if crgt[j] - (crgt[j] - clft[j]) / 2 > b["H_right"]:
-                    continue
-                b["colspan"].append(j)
+            b["colspan"].extend([int(j) for j in np.nonzero((cmid_l >= b["H_left"]) & (cmid_r <= b["H_right"]))[0] if j != b["cn"]])
             # row span
-            for j in range(0, len(rtop)):
-                if j == b["rn"]:
-                    continue
-                if rtop[j] + (rbtm[j] - rtop[j]) / 2 < b["H_top"]:
-                    continue
-                if rbtm[j] - (rbtm[j] - rtop[j]) / 2 > b["H_bott"]:
-                    continue
-                b["rowspan"].append(j)
+            b["rowspan"].extend([int(j) for j in np.nonzero((rmid_t >= b["H_top"]) & (rmid_b <= b["H_bott"]))[0] if j != b["rn"]])
 
         def join(arr):
             if not arr:
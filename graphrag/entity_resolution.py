@@ -23,6 +23,7 @@ import networkx as nx
 import trio
 
 from graphrag.general.extractor import Extractor
+from graphrag.graph_analytics import update_graph_analytics
 from rag.nlp import is_english
 import editdistance
 from graphrag.entity_resolution_prompt import ENTITY_RESOLUTION_PROMPT
@@ -114,10 +115,8 @@ class EntityResolution(Extractor):
                 merging_nodes = list(sub_connect_graph)
                 nursery.start_soon(self._merge_graph_nodes, graph, merging_nodes, change)
 
-        # Update pagerank
-        pr = nx.pagerank(graph)
-        for node_name, pagerank in pr.items():
-            graph.nodes[node_name]["pagerank"] = pagerank
+        # Update pagerank and n-hop neighbourhoods around the merged nodes
+        update_graph_analytics(graph, change)
 
         return EntityResolutionResult(
             graph=graph,
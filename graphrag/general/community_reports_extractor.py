@@ -5,13 +5,15 @@ Reference:
  - [graphrag](https://github.com/microsoft/graphrag)
 """
 
+import csv
+import io
 import logging
 import json
 import re
 from typing import Callable
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import networkx as nx
-import pandas as pd
+import xxhash
 from graphrag.general import leiden
 from graphrag.general.community_report_prompt import COMMUNITY_REPORT_PROMPT
 from graphrag.general.extractor import Extractor
@@ -28,6 +30,8 @@ class CommunityReportsResult:
 
     output: list[str]
     structured_output: list[dict]
+    # Community ids whose previously indexed reports are stale, either regenerated or gone.
+    removed: set[str] = field(default_factory=set)
 
 
 class CommunityReportsExtractor(Extractor):
@@ -47,13 +51,35 @@ class CommunityReportsExtractor(Extractor):
         self._llm = llm_invoker
         self._extraction_prompt = COMMUNITY_REPORT_PROMPT
         self._max_report_length = max_report_length or 1500
+        # Tokens left for the entity and relation tables once the prompt itself is accounted for.
+        self._max_context_tokens = max(int(self._llm.max_length * 0.8) - num_tokens_from_string(self._extraction_prompt), 1024)
 
     async def __call__(self, graph: nx.Graph, callback: Callable | None = None):
         for node_degree in graph.degree:
             graph.nodes[str(node_degree[0])]["rank"] = int(node_degree[1])
 
-        communities: dict[str, dict[str, list]] = leiden.run(graph, {})
-        total = sum([len(comm.items()) for _, comm in communities.items()])
+        communities: dict[int, dict[str, dict]] = leiden.run(graph, {})
+        communities = {level: {cm_id: cm for cm_id, cm in comm.items() if len(cm["nodes"]) >= 2} for level, comm in communities.items()}
+        previous: dict[str, dict] = graph.graph.get("communities", {})
+        communities = leiden.stabilize_community_ids(communities, previous)
+
+        # A community whose members, descriptions and inner relations are unchanged keeps its report.
+        current: dict[str, dict] = {}
+        todo = []
+        for level, comm in communities.items():
+            for cm_id, cm in comm.items():
+                fingerprint = self._community_fingerprint(graph, cm["nodes"])
+                current[cm_id] = {"level": level, "nodes": cm["nodes"], "fingerprint": fingerprint}
+                prev = previous.get(cm_id)
+                if prev and prev.get("title") and prev.get("fingerprint") == fingerprint:
+                    current[cm_id]["title"] = prev["title"]
+                    continue
+                todo.append((cm_id, cm))
+        removed = set([cm_id for cm_id in previous.keys() if cm_id not in current or "title" not in current[cm_id]])
+        total = len(todo)
+        if callback:
+            callback(msg=f"Communities: {len(current)}, {total} of them changed, {len(removed)} stale reports.")
+
         res_str = []
         res_dict = []
         over, token_count = 0, 0
@@ -62,29 +88,10 @@ class CommunityReportsExtractor(Extractor):
             cm_id, cm = community
             weight = cm["weight"]
             ents = cm["nodes"]
-            if len(ents) < 2:
-                return
-            ent_list = [{"entity": ent, "description": graph.nodes[ent]["description"]} for ent in ents]
-            ent_df = pd.DataFrame(ent_list)
-
-            rela_list = []
-            k = 0
-            for i in range(0, len(ents)):
-                if k >= 10000:
-                    break
-                for j in range(i + 1, len(ents)):
-                    if k >= 10000:
-                        break
-                    edge = graph.get_edge_data(ents[i], ents[j])
-                    if edge is None:
-                        continue
-                    rela_list.append({"source": ents[i], "target": ents[j], "description": edge["description"]})
-                    k += 1
-            rela_df = pd.DataFrame(rela_list)
-
+            ent_rows, rela_rows = self._pack_community_context(graph, ents)
             prompt_variables = {
-                "entity_df": ent_df.to_csv(index_label="id"),
-                "relation_df": rela_df.to_csv(index_label="id")
+                "entity_df": _to_csv(ent_rows, ["entity", "description"]),
+                "relation_df": _to_csv(rela_rows, ["source", "target", "description"])
             }
             text = perform_variable_replacements(self._extraction_prompt, variables=prompt_variables)
             gen_conf = {"temperature": 0.3}
@@ -110,9 +117,10 @@ class CommunityReportsExtractor(Extractor):
                         ("rating_explanation", str),
                     ]):
                 return
+            response["id"] = cm_id
             response["weight"] = weight
             response["entities"] = ents
-            add_community_info2graph(graph, ents, response["title"])
+            current[cm_id]["title"] = response["title"]
             res_str.append(self._get_text_output(response))
             res_dict.append(response)
             over += 1
@@ -121,18 +129,73 @@ class CommunityReportsExtractor(Extractor):
 
         st = trio.current_time()
         async with trio.open_nursery() as nursery:
-            for level, comm in communities.items():
-                logging.info(f"Level {level}: Community: {len(comm.keys())}")
-                for community in comm.items():
-                    nursery.start_soon(extract_community_report, community)
+            for community in todo:
+                nursery.start_soon(extract_community_report, community)
         if callback:
             callback(msg=f"Community reports done in {trio.current_time() - st:.2f}s, used tokens: {token_count}")
 
+        for n in graph.nodes():
+            graph.nodes[n].pop("communities", None)
+        for cm in current.values():
+            if cm.get("title"):
+                add_community_info2graph(graph, cm["nodes"], cm["title"])
+        graph.graph["communities"] = current
+
         return CommunityReportsResult(
             structured_output=res_dict,
             output=res_str,
+            removed=removed,
         )
 
+    def _pack_community_context(self, graph: nx.Graph, ents: list[str]) -> tuple[list[dict], list[dict]]:
+        """
+        Collect the entity and relation rows of a community, most connected entities and heaviest
+        relations first, until the token budget is used up. Relations are read from the adjacency
+        of each member, so the cost is linear in the community's edges.
+        """
+        members = set(ents)
+        rela_list = []
+        for ent in ents:
+            for nbr, edge in graph.adj[ent].items():
+                if nbr not in members or nbr < ent:
+                    continue
+                rela_list.append((edge.get("weight", 0), ent, nbr, edge["description"]))
+        rela_list = sorted(rela_list, key=lambda x: x[0], reverse=True)[:10000]
+        ent_list = sorted(ents, key=lambda e: graph.nodes[e].get("rank", 0), reverse=True)
+
+        budget = self._max_context_tokens
+        ent_rows = []
+        ent_budget = budget // 2 if rela_list else budget
+        for ent in ent_list:
+            row = {"entity": ent, "description": graph.nodes[ent]["description"]}
+            tks = num_tokens_from_string(ent + row["description"]) + 2
+            if ent_rows and tks > ent_budget:
+                break
+            ent_budget -= tks
+            budget -= tks
+            ent_rows.append(row)
+
+        rela_rows = []
+        for _, f, t, desc in rela_list:
+            tks = num_tokens_from_string(f + t + desc) + 3
+            if tks > budget:
+                break
+            budget -= tks
+            rela_rows.append({"source": f, "target": t, "description": desc})
+        return ent_rows, rela_rows
+
+    @staticmethod
+    def _community_fingerprint(graph: nx.Graph, ents: list[str]) -> str:
+        members = set(ents)
+        hasher = xxhash.xxh64()
+        for n in sorted(members):
+            hasher.update(f"{n}\x00{graph.nodes[n].get('description', '')}\x00".encode("utf-8"))
+            for nbr in sorted(graph.adj[n]):
+                if nbr <= n or nbr not in members:
+                    continue
+                hasher.update(f"{nbr}\x00{graph.adj[n][nbr].get('description', '')}\x00".encode("utf-8"))
+        return hasher.hexdigest()
+
     def _get_text_output(self, parsed_output: dict) -> str:
         title = parsed_output.get("title", "Report")
         summary = parsed_output.get("summary", "")
@@ -152,3 +215,13 @@ class CommunityReportsExtractor(Extractor):
             f"## {finding_summary(f)}\n\n{finding_explanation(f)}" for f in findings
         )
         return f"# {title}\n\n{summary}\n\n{report_sections}"
+
+
+def _to_csv(rows: list[dict], columns: list[str]) -> str:
+    """Render rows the way `pd.DataFrame(rows).to_csv(index_label="id")` does, without building a frame."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(["id"] + columns)
+    for i, row in enumerate(rows):
+        writer.writerow([i] + [row[c] for c in columns])
+    return buf.getvalue()
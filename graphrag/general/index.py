@@ -17,14 +17,15 @@ import json
 import logging
 import networkx as nx
 import trio
+import xxhash
 
 from api import settings
-from api.utils import get_uuid
 from graphrag.light.graph_extractor import GraphExtractor as LightKGExt
 from graphrag.general.graph_extractor import GraphExtractor as GeneralKGExt
 from graphrag.general.community_reports_extractor import CommunityReportsExtractor
 from graphrag.entity_resolution import EntityResolution
 from graphrag.general.extractor import Extractor
+from graphrag.graph_analytics import update_graph_analytics
 from graphrag.utils import (
     graph_merge,
     get_graph,
@@ -213,9 +214,7 @@ async def merge_subgraph(
         new_graph = subgraph
         change.added_updated_nodes = set(new_graph.nodes())
         change.added_updated_edges = set(new_graph.edges())
-    pr = nx.pagerank(new_graph)
-    for node_name, pagerank in pr.items():
-        new_graph.nodes[node_name]["pagerank"] = pagerank
+    update_graph_analytics(new_graph, change, full=old_graph is None)
 
     await set_graph(tenant_id, kb_id, embedding_model, new_graph, change, callback)
     now = trio.current_time()
@@ -260,17 +259,18 @@ async def extract_community(
     callback,
 ):
     start = trio.current_time()
+    # Reports indexed before community ids were tracked can't be matched, so they are all dropped once.
+    untracked = "communities" not in graph.graph
     ext = CommunityReportsExtractor(
         llm_bdl,
     )
     cr = await ext(graph, callback=callback)
     community_structure = cr.structured_output
     community_reports = cr.output
-    doc_ids = graph.graph["source_id"]
 
     now = trio.current_time()
     callback(
-        msg=f"Graph extracted {len(cr.structured_output)} communities in {now - start:.2f}s."
+        msg=f"Graph extracted {len(cr.structured_output)} changed communities in {now - start:.2f}s."
     )
     start = now
     chunks = []
@@ -279,8 +279,11 @@ async def extract_community(
             "report": rep,
             "evidences": "\n".join([f.get("explanation", "") for f in stru["findings"]]),
         }
+        doc_ids = set()
+        for ent in stru["entities"]:
+            doc_ids.update(graph.nodes[ent].get("source_id", []))
         chunk = {
-            "id": get_uuid(),
+            "id": community_chunk_id(kb_id, stru["id"]),
             "docnm_kwd": stru["title"],
             "title_tks": rag_tokenizer.tokenize(stru["title"]),
             "content_with_weight": json.dumps(obj, ensure_ascii=False),
@@ -292,7 +295,7 @@ async def extract_community(
             "entities_kwd": stru["entities"],
             "important_kwd": stru["entities"],
             "kb_id": kb_id,
-            "source_id": list(doc_ids),
+            "source_id": sorted(doc_ids),
             "available_int": 0,
         }
         chunk["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(
@@ -300,22 +303,39 @@ async def extract_community(
         )
         chunks.append(chunk)
 
-    await trio.to_thread.run_sync(
-        lambda: settings.docStoreConn.delete(
-            {"knowledge_graph_kwd": "community_report", "kb_id": kb_id},
-            search.index_name(tenant_id),
-            kb_id,
+    if untracked:
+        await trio.to_thread.run_sync(
+            lambda: settings.docStoreConn.delete(
+                {"knowledge_graph_kwd": "community_report", "kb_id": kb_id},
+                search.index_name(tenant_id),
+                kb_id,
+            )
         )
-    )
-    es_bulk_size = 4
+    elif cr.removed:
+        stale_ids = [community_chunk_id(kb_id, cm_id) for cm_id in sorted(cr.removed)]
+        await trio.to_thread.run_sync(
+            lambda: settings.docStoreConn.delete(
+                {"id": stale_ids},
+                search.index_name(tenant_id),
+                kb_id,
+            )
+        )
+    es_bulk_size = 64
     for b in range(0, len(chunks), es_bulk_size):
         doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.insert(chunks[b:b + es_bulk_size], search.index_name(tenant_id), kb_id))
         if doc_store_result:
             error_message = f"Insert chunk error: {doc_store_result}, please check log file and Elasticsearch/Infinity status!"
             raise Exception(error_message)
 
+    # Persist community ids and fingerprints so the next document only refreshes what changed.
+    await set_graph(tenant_id, kb_id, embed_bdl, graph, GraphChange(), None)
+
     now = trio.current_time()
     callback(
-        msg=f"Graph indexed {len(cr.structured_output)} communities in {now - start:.2f}s."
+        msg=f"Graph indexed {len(cr.structured_output)} communities and removed {len(cr.removed)} stale reports in {now - start:.2f}s."
     )
     return community_structure, community_reports
+
+
+def community_chunk_id(kb_id: str, community_id: str) -> str:
+    return xxhash.xxh64((kb_id + community_id).encode("utf-8")).hexdigest()
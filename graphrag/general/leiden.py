@@ -7,10 +7,12 @@ Reference:
 
 import logging
 import html
+from collections import defaultdict
 from typing import Any, cast
 from graspologic.partition import hierarchical_leiden
 from graspologic.utils import largest_connected_component
 import networkx as nx
+import xxhash
 from networkx import is_empty
 
 
@@ -147,3 +149,57 @@ def add_community_info2graph(graph: nx.Graph, nodes: list[str], community_title)
             graph.nodes[n]["communities"] = []
         graph.nodes[n]["communities"].append(community_title)
         graph.nodes[n]["communities"] = list(set(graph.nodes[n]["communities"]))
+
+
+def _community_id(level: int, nodes: list[str]) -> str:
+    hasher = xxhash.xxh64()
+    hasher.update(str(level).encode("utf-8"))
+    for n in sorted(nodes):
+        hasher.update(n.encode("utf-8"))
+        hasher.update(b"\x00")
+    return hasher.hexdigest()
+
+
+def stabilize_community_ids(communities: dict[int, dict[str, dict]], previous: dict[str, dict], min_overlap: float = 0.5) -> dict[int, dict[str, dict]]:
+    """
+    Relabel the communities of `leiden.run` so that a community keeps the id it had in `previous`
+    (id -> {"level", "nodes", ...}, as kept in graph.graph["communities"]) when their node sets overlap
+    by at least `min_overlap` (Jaccard). Each previous id is reused at most once; the others get an id
+    derived from their level and members.
+    """
+    results: dict[int, dict[str, dict]] = {}
+    for level, comms in communities.items():
+        node2prev = {}
+        for prev_id, prev in previous.items():
+            if prev.get("level") != level:
+                continue
+            for n in prev["nodes"]:
+                node2prev[n] = prev_id
+
+        candidates = []
+        for raw_id, comm in comms.items():
+            overlaps = defaultdict(int)
+            for n in comm["nodes"]:
+                if n in node2prev:
+                    overlaps[node2prev[n]] += 1
+            for prev_id, inter in overlaps.items():
+                union = len(comm["nodes"]) + len(previous[prev_id]["nodes"]) - inter
+                jaccard = inter / union
+                if jaccard >= min_overlap:
+                    candidates.append((jaccard, raw_id, prev_id))
+
+        matched = {}
+        used = set()
+        for _, raw_id, prev_id in sorted(candidates, key=lambda x: x[0], reverse=True):
+            if raw_id in matched or prev_id in used:
+                continue
+            matched[raw_id] = prev_id
+            used.add(prev_id)
+
+        results[level] = {}
+        for raw_id, comm in comms.items():
+            cid = matched.get(raw_id)
+            if cid is None:
+                cid = _community_id(level, comm["nodes"])
+            results[level][cid] = comm
+    return results
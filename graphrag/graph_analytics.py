@@ -0,0 +1,121 @@
+#
+#  Copyright 2024 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+PageRank and n-hop neighbourhoods of the knowledge graph, kept up to date from a GraphChange
+instead of being recomputed over the whole graph for every document.
+"""
+import logging
+import os
+from collections import deque
+
+import networkx as nx
+
+from graphrag.utils import GraphChange
+
+PAGERANK_ALPHA = 0.85
+# Incremental updates between two full recomputations, which also clear accumulated drift.
+PAGERANK_FULL_EVERY = int(os.environ.get("GRAPHRAG_PAGERANK_FULL_EVERY", 32))
+# Entity chunks are only rewritten when their pagerank moved by more than this ratio.
+PAGERANK_REL_TOL = 0.01
+
+
+def _full_pagerank(graph: nx.Graph) -> set[str]:
+    changed = set()
+    for node, pagerank in nx.pagerank(graph, alpha=PAGERANK_ALPHA).items():
+        old = graph.nodes[node].get("pagerank")
+        if old is None or abs(pagerank - old) > PAGERANK_REL_TOL * old:
+            changed.add(node)
+        graph.nodes[node]["pagerank"] = pagerank
+    graph.graph["pagerank_updates"] = 0
+    return changed
+
+
+def _push_pagerank(graph: nx.Graph, seeds: set[str]) -> set[str] | None:
+    """
+    Gauss-Seidel sweeps of the PageRank equation that start at `seeds` and only spread to the
+    neighbours of nodes whose value moved, so untouched regions of the graph are never visited.
+    Returns None if the update spreads over too much of the graph to be worth it.
+    """
+    n = graph.number_of_nodes()
+    strength = {}
+
+    def node_strength(u):
+        if u not in strength:
+            strength[u] = sum(attrs.get("weight", 1) for attrs in graph.adj[u].values())
+        return strength[u]
+
+    dangling = sum(attrs.get("pagerank", 1.0 / n) for u, attrs in graph.nodes(data=True) if not graph.adj[u])
+    base = (1 - PAGERANK_ALPHA) / n + PAGERANK_ALPHA * dangling / n
+    tol = 1e-4 / n
+
+    queue = deque(seeds)
+    queued = set(seeds)
+    changed = set()
+    start = {}
+    budget = 20 * n
+    while queue:
+        budget -= 1
+        if budget < 0:
+            return None
+        v = queue.popleft()
+        queued.discard(v)
+        x = base
+        for u, attrs in graph.adj[v].items():
+            if u != v and node_strength(u) > 0:
+                x += PAGERANK_ALPHA * graph.nodes[u].get("pagerank", base) * attrs.get("weight", 1) / node_strength(u)
+        old = graph.nodes[v].get("pagerank")
+        start.setdefault(v, old)
+        graph.nodes[v]["pagerank"] = x
+        if old is not None and abs(x - old) <= tol:
+            continue
+        for u in graph.adj[v]:
+            if u not in queued:
+                queue.append(u)
+                queued.add(u)
+
+    for v, old in start.items():
+        pagerank = graph.nodes[v]["pagerank"]
+        if old is None or abs(pagerank - old) > PAGERANK_REL_TOL * old:
+            changed.add(v)
+    return changed
+
+
+def update_graph_analytics(graph: nx.Graph, change: GraphChange, full: bool = False):
+    """
+    Refresh the pagerank of the nodes affected by `change` and add every node whose pagerank or
+    n-hop neighbourhood changed to `change.added_updated_nodes`, so that their entity chunks are
+    rewritten by set_graph.
+    """
+    if not graph.number_of_nodes():
+        return
+    seeds = set([n for n in change.added_updated_nodes if graph.has_node(n)])
+    for edge in change.added_updated_edges | change.removed_edges:
+        seeds.update([n for n in edge if graph.has_node(n)])
+
+    updates = graph.graph.get("pagerank_updates", 0)
+    changed = None
+    if not full and updates < PAGERANK_FULL_EVERY and all("pagerank" in attrs for n, attrs in graph.nodes(data=True) if n not in seeds):
+        changed = _push_pagerank(graph, seeds)
+        graph.graph["pagerank_updates"] = updates + 1
+    if changed is None:
+        logging.info("Recomputing pagerank over the whole graph...")
+        changed = _full_pagerank(graph)
+
+    # The n-hop paths of a node go through its neighbours, so both ends of a changed edge and their neighbours are refreshed.
+    nhop_changed = set(seeds)
+    for n in seeds:
+        nhop_changed.update(graph.adj[n])
+    change.added_updated_nodes.update(changed | nhop_changed)
@@ -16,14 +16,14 @@
 import json
 import logging
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 import json_repair
 import pandas as pd
-import trio
 
 from api.utils import get_uuid
 from graphrag.query_analyze_prompt import PROMPTS
-from graphrag.utils import get_entity_type2sampels, get_llm_cache, set_llm_cache, get_relation
+from graphrag.utils import entity_type2samples, get_llm_cache, set_llm_cache, get_relations
 from rag.utils import num_tokens_from_string, get_float
 from rag.utils.doc_store_conn import OrderByExpr
 
@@ -42,7 +42,7 @@ class KGSearch(Dealer):
         return response
 
     def query_rewrite(self, llm, question, idxnms, kb_ids):
-        ty2ents = trio.run(lambda: get_entity_type2sampels(idxnms, kb_ids))
+        ty2ents = entity_type2samples(idxnms, kb_ids)
         hint_prompt = PROMPTS["minirag_query2kwd"].format(query=question,
                                                           TYPE_POOL=json.dumps(ty2ents, ensure_ascii=False, indent=2))
         result = self._chat(llm, hint_prompt, [{"role": "user", "content": "Output:"}], {"temperature": .5})
@@ -156,17 +156,22 @@ class KGSearch(Dealer):
             tenant_ids = tenant_ids.split(",")
         idxnms = [index_name(tid) for tid in tenant_ids]
         ty_kwds = []
-        try:
-            ty_kwds, ents = self.query_rewrite(llm, qst, [index_name(tid) for tid in tenant_ids], kb_ids)
-            logging.info(f"Q: {qst}, Types: {ty_kwds}, Entities: {ents}")
-        except Exception as e:
-            logging.exception(e)
-            ents = [qst]
-            pass
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            # Relations are searched by the question itself, so that search overlaps the query rewriting.
+            rels_future = executor.submit(self.get_relevant_relations_by_txt, qst, filters, idxnms, kb_ids, emb_mdl, rel_sim_threshold)
+            try:
+                ty_kwds, ents = self.query_rewrite(llm, qst, idxnms, kb_ids)
+                logging.info(f"Q: {qst}, Types: {ty_kwds}, Entities: {ents}")
+            except Exception as e:
+                logging.exception(e)
+                ents = [qst]
+                pass
 
-        ents_from_query = self.get_relevant_ents_by_keywords(ents, filters, idxnms, kb_ids, emb_mdl, ent_sim_threshold)
-        ents_from_types = self.get_relevant_ents_by_types(ty_kwds, filters, idxnms, kb_ids, 10000)
-        rels_from_txt = self.get_relevant_relations_by_txt(qst, filters, idxnms, kb_ids, emb_mdl, rel_sim_threshold)
+            ents_future = executor.submit(self.get_relevant_ents_by_keywords, ents, filters, idxnms, kb_ids, emb_mdl, ent_sim_threshold)
+            types_future = executor.submit(self.get_relevant_ents_by_types, ty_kwds, filters, idxnms, kb_ids, 10000)
+            ents_from_query = ents_future.result()
+            ents_from_types = types_future.result()
+            rels_from_txt = rels_future.result()
         nhop_pathes = defaultdict(dict)
         for _, ent in ents_from_query.items():
             nhops = ent.get("n_hop_ents", [])
@@ -237,13 +242,11 @@ class KGSearch(Dealer):
                 ents = ents[:-1]
                 break
 
+        relations = get_relations(idxnms, kb_ids, [(f, t) for (f, t), rel in rels_from_txt if not rel.get("description")])
         for (f, t), rel in rels_from_txt:
             if not rel.get("description"):
-                for tid in tenant_ids:
-                    rela = get_relation(tid, kb_ids, f, t)
-                    if rela:
-                        break
-                else:
+                rela = relations.get(tuple(sorted([f, t])))
+                if not rela:
                     continue
                 rel["description"] = rela["description"]
             desc = rel["description"]
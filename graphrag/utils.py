@@ -36,6 +36,10 @@ ErrorHandlerFn = Callable[[BaseException | None, str | None, dict | None], None]
 
 chat_limiter = trio.CapacityLimiter(int(os.environ.get('MAX_CONCURRENT_CHATS', 10)))
 
+N_HOP = 2
+# Paths kept per entity, heaviest first, so entity chunks stay small around hubs.
+N_HOP_MAX_PATHS = 64
+
 @dataclasses.dataclass
 class GraphChange:
     removed_nodes: Set[str] = dataclasses.field(default_factory=set)
@@ -299,7 +303,31 @@ def chunk_id(chunk):
     return xxhash.xxh64((chunk["content_with_weight"] + chunk["kb_id"]).encode("utf-8")).hexdigest()
 
 
-async def graph_node_to_chunk(kb_id, embd_mdl, ent_name, meta, chunks):
+def n_hop_neighbours(graph: nx.Graph, node: str, n_hop: int = N_HOP) -> list[dict]:
+    """Simple paths of up to `n_hop` edges starting at `node`, with the weight of every edge on them."""
+    paths = []
+
+    def walk(path, weights):
+        if len(path) > 1:
+            paths.append({"path": list(path), "weights": list(weights)})
+        if len(path) > n_hop:
+            return
+        nbrs = sorted(graph.adj[path[-1]].items(), key=lambda x: x[1].get("weight", 0), reverse=True)
+        for nbr, attrs in nbrs[:N_HOP_MAX_PATHS]:
+            if nbr in path:
+                continue
+            path.append(nbr)
+            weights.append(attrs.get("weight", 0))
+            walk(path, weights)
+            path.pop()
+            weights.pop()
+
+    walk([node], [])
+    paths = sorted(paths, key=lambda p: sum(p["weights"]) / len(p["weights"]), reverse=True)
+    return paths[:N_HOP_MAX_PATHS]
+
+
+async def graph_node_to_chunk(kb_id, embd_mdl, ent_name, meta, n_hop_ents, chunks):
     chunk = {
         "id": get_uuid(),
         "important_kwd": [ent_name],
@@ -310,6 +338,8 @@ async def graph_node_to_chunk(kb_id, embd_mdl, ent_name, meta, chunks):
         "content_with_weight": json.dumps(meta, ensure_ascii=False),
         "content_ltks": rag_tokenizer.tokenize(meta["description"]),
         "source_id": meta["source_id"],
+        "rank_flt": meta.get("pagerank", 0),
+        "n_hop_with_weight": json.dumps(n_hop_ents, ensure_ascii=False),
         "kb_id": kb_id,
         "available_int": 0
     }
@@ -351,6 +381,35 @@ def get_relation(tenant_id, kb_id, from_ent_name, to_ent_name, size=1):
     return res
 
 
+def get_relations(idxnms, kb_ids, pairs: list[tuple[str, str]]) -> dict[tuple[str, str], dict]:
+    """Look up the relations between the given entity pairs with a single query, keyed by sorted pair."""
+    if not pairs:
+        return {}
+    ents = sorted(set([e for pair in pairs for e in pair]))
+    wanted = set([tuple(sorted(pair)) for pair in pairs])
+    conds = {
+        "fields": ["content_with_weight", "from_entity_kwd", "to_entity_kwd"],
+        "size": max(len(ents) * len(ents), 64),
+        "from_entity_kwd": ents,
+        "to_entity_kwd": ents,
+        "knowledge_graph_kwd": ["relation"]
+    }
+    res = {}
+    es_res = settings.retrievaler.search(conds, idxnms, kb_ids)
+    for id in es_res.ids:
+        f, t = es_res.field[id].get("from_entity_kwd"), es_res.field[id].get("to_entity_kwd")
+        f = f[0] if isinstance(f, list) else f
+        t = t[0] if isinstance(t, list) else t
+        pair = tuple(sorted([f, t]))
+        if pair not in wanted or pair in res:
+            continue
+        try:
+            res[pair] = json.loads(es_res.field[id]["content_with_weight"])
+        except Exception:
+            continue
+    return res
+
+
 async def graph_edge_to_chunk(kb_id, embd_mdl, from_ent_name, to_ent_name, meta, chunks):
     chunk = {
         "id": get_uuid(),
@@ -432,9 +491,12 @@ async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, chang
     start = trio.current_time()
 
     await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"knowledge_graph_kwd": ["graph"]}, search.index_name(tenant_id), kb_id))
+    invalidate_entity_type2samples_cache(kb_id)
 
-    if change.removed_nodes:
-        await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"knowledge_graph_kwd": ["entity"], "entity_kwd": sorted(change.removed_nodes)}, search.index_name(tenant_id), kb_id))
+    # Entity chunks of updated nodes are rebuilt below, drop the previous ones along with the removed nodes'.
+    stale_nodes = change.removed_nodes | change.added_updated_nodes
+    if stale_nodes:
+        await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"knowledge_graph_kwd": ["entity"], "entity_kwd": sorted(stale_nodes)}, search.index_name(tenant_id), kb_id))
 
     if change.removed_edges:
         async with trio.open_nursery() as nursery:
@@ -457,7 +519,7 @@ async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, chang
     async with trio.open_nursery() as nursery:
         for node in change.added_updated_nodes:
             node_attrs = graph.nodes[node]
-            nursery.start_soon(graph_node_to_chunk, kb_id, embd_mdl, node, node_attrs, chunks)
+            nursery.start_soon(graph_node_to_chunk, kb_id, embd_mdl, node, node_attrs, n_hop_neighbours(graph, node), chunks)
         for from_node, to_node in change.added_updated_edges:
             edge_attrs = graph.get_edge_data(from_node, to_node)
             if not edge_attrs:
@@ -469,7 +531,7 @@ async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, chang
         callback(msg=f"set_graph converted graph change to {len(chunks)} chunks in {now - start:.2f}s.")
     start = now
 
-    es_bulk_size = 4
+    es_bulk_size = 64
     for b in range(0, len(chunks), es_bulk_size):
         doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.insert(chunks[b:b + es_bulk_size], search.index_name(tenant_id), kb_id))
         if doc_store_result:
@@ -522,13 +584,40 @@ def merge_tuples(list1, list2):
     return result
 
 
-async def get_entity_type2sampels(idxnms, kb_ids: list):
-    es_res = await trio.to_thread.run_sync(lambda: settings.retrievaler.search({"knowledge_graph_kwd": "ty2ents", "kb_id": kb_ids,
-                                       "size": 10000,
-                                       "fields": ["content_with_weight"]},
-                                      idxnms, kb_ids))
+def get_entity_type2samples_from_cache(kb_id):
+    bin = REDIS_CONN.get(f"graphrag_ty2ents_{kb_id}")
+    if not bin:
+        return
+    return json.loads(bin)
+
+
+def set_entity_type2samples_to_cache(kb_id, ty2ents):
+    REDIS_CONN.set(f"graphrag_ty2ents_{kb_id}", json.dumps(ty2ents, ensure_ascii=False).encode("utf-8"), 3600)
 
+
+def invalidate_entity_type2samples_cache(kb_id):
+    REDIS_CONN.delete(f"graphrag_ty2ents_{kb_id}")
+
+
+def entity_type2samples(idxnms, kb_ids: list):
+    """Entity samples of every type, cached per knowledge base until its graph changes."""
     res = defaultdict(list)
+    missing = []
+    for kb_id in kb_ids:
+        cached = get_entity_type2samples_from_cache(kb_id)
+        if cached is None:
+            missing.append(kb_id)
+            continue
+        for ty, ents in cached.items():
+            res[ty].extend(ents)
+    if not missing:
+        return res
+
+    es_res = settings.retrievaler.search({"knowledge_graph_kwd": "ty2ents", "kb_id": missing,
+                                          "size": 10000,
+                                          "fields": ["content_with_weight", "kb_id"]},
+                                         idxnms, missing)
+    fetched = {kb_id: defaultdict(list) for kb_id in missing}
     for id in es_res.ids:
         smp = es_res.field[id].get("content_with_weight")
         if not smp:
@@ -537,9 +626,15 @@ async def get_entity_type2sampels(idxnms, kb_ids: list):
             smp = json.loads(smp)
         except Exception as e:
             logging.exception(e)
-
+            continue
+        kb_id = es_res.field[id].get("kb_id")
+        kb_id = kb_id[0] if isinstance(kb_id, list) else kb_id
         for ty, ents in smp.items():
             res[ty].extend(ents)
+            if kb_id in fetched:
+                fetched[kb_id][ty].extend(ents)
+    for kb_id, ty2ents in fetched.items():
+        set_entity_type2samples_to_cache(kb_id, ty2ents)
     return res
 
 
@@ -15,95 +15,249 @@
 #
 
 import logging
+import mailbox
+import multiprocessing
+import os
 from email import policy
 from email.parser import BytesParser
 from rag.app.naive import chunk as naive_chunk
 import re
-from rag.nlp import rag_tokenizer, naive_merge, tokenize_chunks
+import xxhash
+from rag.nlp import add_positions, rag_tokenizer, naive_merge, tokenize_chunks
 from deepdoc.parser import HtmlParser, TxtParser
 from timeit import default_timer as timer
 import io
 
+# Processes parsing the messages of big archives, a range of messages each.
+MAIL_WORKERS = int(os.environ.get("MAIL_WORKERS", max(1, min(8, (os.cpu_count() or 2) // 2))))
+# Archives with fewer messages are parsed in this process.
+MAIL_PARALLEL_MIN_MESSAGES = int(os.environ.get("MAIL_PARALLEL_MIN_MESSAGES", 64))
+# Seconds the workers get to parse an archive.
+MAIL_PARALLEL_TIMEOUT = int(os.environ.get("MAIL_PARALLEL_TIMEOUT", 600))
+# Headers kept for the messages of an archive: the others (Received, DKIM...) are noise repeated in
+# every message.
+ARCHIVE_HEADERS = {"from", "to", "cc", "date", "subject"}
 
-def chunk(
-    filename,
-    binary=None,
-    from_page=0,
-    to_page=100000,
-    lang="Chinese",
-    callback=None,
-    **kwargs,
-):
-    """
-    Only eml is supported
-    """
-    eng = lang.lower() == "english"  # is_english(cks)
-    parser_config = kwargs.get(
-        "parser_config",
-        {"chunk_token_num": 128, "delimiter": "\n!?。；！？", "layout_recognize": "DeepDOC"},
-    )
-    doc = {
-        "docnm_kwd": filename,
-        "title_tks": rag_tokenizer.tokenize(re.sub(r"\.[a-zA-Z]+$", "", filename)),
-    }
-    doc["title_sm_tks"] = rag_tokenizer.fine_grained_tokenize(doc["title_tks"])
-    main_res = []
-    attachment_res = []
+QUOTE_ATTRIBUTION = re.compile(r"(wrote|writes|写道)\s*[:：]?\s*$", re.IGNORECASE)
+FORWARDED_ORIGINAL = re.compile(r"^\s*-{2,}\s*(Original Message|原始邮件)\s*-{2,}\s*$", re.IGNORECASE)
+
+
+def _collapse_quotes(txt):
+    """Drops the quoted lines of a plain text reply, with the line introducing them."""
+    lines = []
+    for line in txt.split("\n"):
+        if FORWARDED_ORIGINAL.match(line):
+            break
+        if line.lstrip().startswith(">"):
+            while lines and not lines[-1].strip():
+                lines.pop()
+            if lines and QUOTE_ATTRIBUTION.search(lines[-1]):
+                lines.pop()
+            continue
+        lines.append(line)
+    return "\n".join(lines)
 
-    if binary:
-        msg = BytesParser(policy=policy.default).parse(io.BytesIO(binary))
-    else:
-        msg = BytesParser(policy=policy.default).parse(open(filename, "rb"))
 
+def _strip_blockquotes(html):
+    """Drops the <blockquote> elements, in which HTML mail clients quote the replied message."""
+    parts, depth, pos = [], 0, 0
+    for m in re.finditer(r"<(/?)blockquote\b[^>]*>", html, flags=re.IGNORECASE):
+        if not m.group(1):
+            if not depth:
+                parts.append(html[pos:m.start()])
+            depth += 1
+        elif depth:
+            depth -= 1
+            if not depth:
+                pos = m.end()
+    if not depth:
+        parts.append(html[pos:])
+    return "".join(parts)
+
+
+def _message_texts(msg, headers=None, collapse_quotes=False):
+    """Header lines with the text/plain parts, and the text/html parts of the message."""
     text_txt, html_txt = [], []
     # get the email header info
     for header, value in msg.items():
-        text_txt.append(f"{header}: {value}")
+        if headers is None or header.lower() in headers:
+            text_txt.append(f"{header}: {value}")
 
     #  get the email main info
     def _add_content(msg, content_type):
-        if content_type == "text/plain":
-            text_txt.append(
-                msg.get_payload(decode=True).decode(msg.get_content_charset())
-            )
-        elif content_type == "text/html":
-            html_txt.append(
-                msg.get_payload(decode=True).decode(msg.get_content_charset())
-            )
+        if content_type in ("text/plain", "text/html"):
+            payload = msg.get_payload(decode=True)
+            if not payload:
+                return
+            txt = payload.decode(msg.get_content_charset() or "utf-8", errors="ignore")
+            if content_type == "text/plain":
+                text_txt.append(_collapse_quotes(txt) if collapse_quotes else txt)
+            else:
+                html_txt.append(_strip_blockquotes(txt) if collapse_quotes else txt)
         elif "multipart" in content_type:
             if msg.is_multipart():
                 for part in msg.iter_parts():
                     _add_content(part, part.get_content_type())
 
     _add_content(msg, msg.get_content_type())
+    return text_txt, html_txt
+
 
+def _attachments(msg):
+    """(filename, xxh64 digest, payload) of the attachments of the message."""
+    res = []
+    for part in msg.iter_attachments():
+        content_disposition = part.get("Content-Disposition")
+        if content_disposition:
+            dispositions = content_disposition.strip().split(";")
+            if dispositions[0].lower() == "attachment":
+                payload = part.get_payload(decode=True)
+                if payload:
+                    res.append((part.get_filename(), xxhash.xxh64(payload).hexdigest(), payload))
+    return res
+
+
+def _message_chunks(binary, doc, eng, parser_config, headers=None, collapse_quotes=False):
+    """Message-ID, tokenized chunks and attachments of a message."""
+    msg = BytesParser(policy=policy.default).parse(io.BytesIO(binary))
+    text_txt, html_txt = _message_texts(msg, headers, collapse_quotes)
     sections = TxtParser.parser_txt("\n".join(text_txt)) + [
         (line, "") for line in HtmlParser.parser_txt("\n".join(html_txt)) if line
     ]
-
-    st = timer()
     chunks = naive_merge(
         sections,
         int(parser_config.get("chunk_token_num", 128)),
         parser_config.get("delimiter", "\n!?。；！？"),
     )
+    return str(msg.get("Message-ID", "")).strip(), tokenize_chunks(chunks, doc, eng, None), _attachments(msg)
+
+
+def _archive_chunks(messages, doc, eng, parser_config):
+    res, seen = [], set()
+    for binary in messages:
+        try:
+            msg_id, cks, attachments = _message_chunks(binary, doc, eng, parser_config, headers=ARCHIVE_HEADERS, collapse_quotes=True)
+        except Exception as e:
+            logging.warning(f"Fail to parse a message of the archive: {e}")
+            continue
+        # the payloads of attachments repeated in the range are sent back once
+        res.append((msg_id, cks, [(nm, digest, None if digest in seen else payload) for nm, digest, payload in attachments]))
+        seen.update(digest for _, digest, _ in attachments)
+    return res
+
+
+def _split_mbox(binary):
+    """Messages of an mbox archive, whose bodies escape their lines starting with "From " as ">From "."""
+    starts = [m.start() + 1 for m in re.finditer(rb"\nFrom ", binary)]
+    if binary.startswith(b"From "):
+        starts.insert(0, 0)
+    messages = []
+    for s, e in zip(starts, starts[1:] + [len(binary)]):
+        nl = binary.find(b"\n", s, e)
+        if nl < 0:
+            continue
+        messages.append(re.sub(rb"(?m)^>(>*From )", rb"\1", binary[nl + 1:e]))
+    return messages
+
+
+def _parse_archive(messages, doc, eng, parser_config):
+    workers = min(MAIL_WORKERS, len(messages) // MAIL_PARALLEL_MIN_MESSAGES + 1)
+    if workers <= 1 or "forkserver" not in multiprocessing.get_all_start_methods():
+        return _archive_chunks(messages, doc, eng, parser_config)
+    # The workers are forked from a single-threaded server process, which has imported the main
+    # module once for all of them, not from this one whose other threads may hold locks.
+    # A few ranges per worker, so that long threads do not hold up one worker alone.
+    step = -(-len(messages) // (workers * 4))
+    ranges = [(messages[i:i + step], doc, eng, parser_config) for i in range(0, len(messages), step)]
+    with multiprocessing.get_context("forkserver").Pool(workers) as pool:
+        parts = pool.starmap_async(_archive_chunks, ranges).get(timeout=MAIL_PARALLEL_TIMEOUT)
+    return [r for part in parts for r in part]
+
+
+def _merge_archive(parsed, callback):
+    """
+    Chunks and distinct attachments [(filename, payload)] of the parsed messages of an archive,
+    without the messages repeated with the same Message-ID and the chunks repeated across messages.
+    """
+    main_res, attachments = [], {}
+    seen_ids, seen_chunks = set(), set()
+    n_messages = 0
+    for msg_id, cks, atts in parsed:
+        for nm, digest, payload in atts:
+            if payload is not None and digest not in attachments:
+                attachments[digest] = (nm, payload)
+        if msg_id and msg_id in seen_ids:
+            continue
+        seen_ids.add(msg_id)
+        n_messages += 1
+        for d in cks:
+            digest = xxhash.xxh64(d["content_with_weight"]).digest()
+            if digest in seen_chunks:
+                continue
+            seen_chunks.add(digest)
+            add_positions(d, [[len(main_res)] * 5])
+            main_res.append(d)
+    callback(0.5, f"{len(main_res)} distinct chunks from {n_messages} messages, {len(attachments)} distinct attachments.")
+    return main_res, list(attachments.values())
+
+
+def chunk(
+    filename,
+    binary=None,
+    from_page=0,
+    to_page=100000,
+    lang="Chinese",
+    callback=None,
+    **kwargs,
+):
+    """
+    eml, mbox archives and maildir directories are supported.
+
+    In archives, quoted reply text is dropped, messages repeated with the same Message-ID are read
+    once, every distinct attachment is parsed once and chunks repeated across messages (list
+    footers, signatures...) are indexed once.
+    """
+    eng = lang.lower() == "english"  # is_english(cks)
+    parser_config = kwargs.get(
+        "parser_config",
+        {"chunk_token_num": 128, "delimiter": "\n!?。；！？", "layout_recognize": "DeepDOC"},
+    )
+    doc = {
+        "docnm_kwd": filename,
+        "title_tks": rag_tokenizer.tokenize(re.sub(r"\.[a-zA-Z]+$", "", filename)),
+    }
+    doc["title_sm_tks"] = rag_tokenizer.fine_grained_tokenize(doc["title_tks"])
+
+    st = timer()
+    if re.search(r"\.(mbox|mbx)$", filename, re.IGNORECASE) or (not binary and os.path.isdir(filename)):
+        if binary:
+            messages = _split_mbox(binary)
+        elif os.path.isdir(filename):
+            box = mailbox.Maildir(filename, factory=None, create=False)
+            messages = [box.get_bytes(k) for k in box.keys()]
+        else:
+            with open(filename, "rb") as f:
+                messages = _split_mbox(f.read())
+        callback(0.1, f"Start to parse {len(messages)} messages.")
+        parsed = _parse_archive(messages, doc, eng, parser_config)
+        main_res, attachments = _merge_archive(parsed, callback)
+    else:
+        if not binary:
+            with open(filename, "rb") as f:
+                binary = f.read()
+        _, main_res, attachments = _message_chunks(binary, doc, eng, parser_config)
+        attachments = [(nm, payload) for nm, _, payload in attachments]
+    logging.debug("parse mails({}): {}".format(filename, timer() - st))
 
-    main_res.extend(tokenize_chunks(chunks, doc, eng, None))
-    logging.debug("naive_merge({}): {}".format(filename, timer() - st))
     # get the attachment info
-    for part in msg.iter_attachments():
-        content_disposition = part.get("Content-Disposition")
-        if content_disposition:
-            dispositions = content_disposition.strip().split(";")
-            if dispositions[0].lower() == "attachment":
-                filename = part.get_filename()
-                payload = part.get_payload(decode=True)
-                try:
-                    attachment_res.extend(
-                        naive_chunk(filename, payload, callback=callback, **kwargs)
-                    )
-                except Exception:
-                    pass
+    attachment_res = []
+    for nm, payload in attachments:
+        try:
+            attachment_res.extend(
+                naive_chunk(nm, payload, callback=callback, **kwargs)
+            )
+        except Exception as e:
+            logging.warning(f"Fail to parse the attachment {nm}: {e}")
 
     return main_res + attachment_res
 
@@ -15,6 +15,7 @@
 #
 
 import logging
+import math
 import re
 from functools import reduce
 from io import BytesIO
@@ -27,8 +28,8 @@ from PIL import Image
 from tika import parser
 
 from api.db import LLMType
-from api.db.services.llm_service import LLMBundle
-from deepdoc.parser import DocxParser, ExcelParser, HtmlParser, JsonParser, MarkdownParser, PdfParser, TxtParser
+from api.db.services.llm_service import ParserContext
+from deepdoc.parser import DocParser, DocxParser, ExcelParser, HtmlParser, JsonParser, MarkdownParser, PdfParser, TxtParser
 from deepdoc.parser.figure_parser import VisionFigureParser, vision_figure_parser_figure_data_wraper
 from deepdoc.parser.pdf_parser import PlainParser, VisionParser
 from rag.nlp import concat_img, find_codec, naive_merge, naive_merge_docx, rag_tokenizer, tokenize_chunks, tokenize_chunks_docx, tokenize_table
@@ -40,6 +41,7 @@ class Docx(DocxParser):
         pass
 
     def get_picture(self, document, paragraph):
+        """The first picture of the paragraph, or None when it has none or it cannot be decoded."""
         img = paragraph._element.xpath('.//pic:pic')
         if not img:
             return None
@@ -47,137 +49,68 @@ class Docx(DocxParser):
         embed = img.xpath('.//a:blip/@r:embed')
         if not embed:
             return None
-        embed = embed[0]
-        related_part = document.part.related_parts[embed]
+        return self.__image(document.part.related_parts[embed[0]])
+
+    def __image(self, related_part):
+        # pictures repeated through the document share their part, which is decoded once
+        if related_part.partname in self.images:
+            return self.images[related_part.partname]
+        image = None
         try:
-            image_blob = related_part.image.blob
+            image = Image.open(BytesIO(related_part.image.blob)).convert('RGB')
         except UnrecognizedImageError:
             logging.info("Unrecognized image format. Skipping image.")
-            return None
         except UnexpectedEndOfFileError:
             logging.info("EOF was unexpectedly encountered while reading an image stream. Skipping image.")
-            return None
         except InvalidImageStreamError:
             logging.info("The recognized image stream appears to be corrupted. Skipping image.")
-            return None
-        try:
-            image = Image.open(BytesIO(image_blob)).convert('RGB')
-            return image
         except Exception:
-            return None
+            pass
+        self.images[related_part.partname] = image
+        return image
 
     def __clean(self, line):
         line = re.sub(r"\u3000", " ", line).strip()
         return line
 
-    def __get_nearest_title(self, table_index, filename):
-        """Get the hierarchical title structure before the table"""
-        import re
+    def __table_titles(self, filename):
+        """The hierarchical title structure before every table, in one pass over the document"""
         from docx.text.paragraph import Paragraph
-        
-        titles = []
-        blocks = []
-        
+
         # Get document name from filename parameter
         doc_name = re.sub(r"\.[a-zA-Z]+$", "", filename)
         if not doc_name:
             doc_name = "Untitled Document"
-            
-        # Collect all document blocks while maintaining document order
+
+        # headings of strictly increasing levels, ending with the nearest one
+        headings = []
+        titles = []
         try:
-            # Iterate through all paragraphs and tables in document order
-            for i, block in enumerate(self.doc._element.body):
-                if block.tag.endswith('p'):  # Paragraph
-                    p = Paragraph(block, self.doc)
-                    blocks.append(('p', i, p))
-                elif block.tag.endswith('tbl'):  # Table
-                    blocks.append(('t', i, None))  # Table object will be retrieved later
+            for block in self.doc._element.body:
+                if block.tag.endswith('tbl'):
+                    titles.append(" > ".join([doc_name] + [t for _, t in headings]) if headings else "")
+                    continue
+                if not block.tag.endswith('p'):
+                    continue
+                p = Paragraph(block, self.doc)
+                if not p.style or not p.style.name or not re.search(r"Heading\s*(\d+)", p.style.name, re.I):
+                    continue
+                level = int(re.search(r"(\d+)", p.style.name).group(1))
+                title_text = p.text.strip()
+                # Support up to 7 heading levels, avoid empty titles
+                if level > 7 or not title_text:
+                    continue
+                while headings and headings[-1][0] >= level:
+                    headings.pop()
+                headings.append((level, title_text))
         except Exception as e:
-            logging.error(f"Error collecting blocks: {e}")
-            return ""
-            
-        # Find the target table position
-        target_table_pos = -1
-        table_count = 0
-        for i, (block_type, pos, _) in enumerate(blocks):
-            if block_type == 't':
-                if table_count == table_index:
-                    target_table_pos = pos
-                    break
-                table_count += 1
-                
-        if target_table_pos == -1:
-            return ""  # Target table not found
-            
-        # Find the nearest heading paragraph in reverse order
-        nearest_title = None
-        for i in range(len(blocks)-1, -1, -1):
-            block_type, pos, block = blocks[i]
-            if pos >= target_table_pos:  # Skip blocks after the table
-                continue
-                
-            if block_type != 'p':
-                continue
-                
-            if block.style and re.search(r"Heading\s*(\d+)", block.style.name, re.I):
-                try:
-                    level_match = re.search(r"(\d+)", block.style.name)
-                    if level_match:
-                        level = int(level_match.group(1))
-                        if level <= 7:  # Support up to 7 heading levels
-                            title_text = block.text.strip()
-                            if title_text:  # Avoid empty titles
-                                nearest_title = (level, title_text)
-                                break
-                except Exception as e:
-                    logging.error(f"Error parsing heading level: {e}")
-        
-        if nearest_title:
-            # Add current title
-            titles.append(nearest_title)
-            current_level = nearest_title[0]
-            
-            # Find all parent headings, allowing cross-level search
-            while current_level > 1:
-                found = False
-                for i in range(len(blocks)-1, -1, -1):
-                    block_type, pos, block = blocks[i]
-                    if pos >= target_table_pos:  # Skip blocks after the table
-                        continue
-                        
-                    if block_type != 'p':
-                        continue
-                        
-                    if block.style and re.search(r"Heading\s*(\d+)", block.style.name, re.I):
-                        try:
-                            level_match = re.search(r"(\d+)", block.style.name)
-                            if level_match:
-                                level = int(level_match.group(1))
-                                # Find any heading with a higher level
-                                if level < current_level:  
-                                    title_text = block.text.strip()
-                                    if title_text:  # Avoid empty titles
-                                        titles.append((level, title_text))
-                                        current_level = level
-                                        found = True
-                                        break
-                        except Exception as e:
-                            logging.error(f"Error parsing parent heading: {e}")
-                            
-                if not found:  # Break if no parent heading is found
-                    break
-            
-            # Sort by level (ascending, from highest to lowest)
-            titles.sort(key=lambda x: x[0])
-            # Organize titles (from highest to lowest)
-            hierarchy = [doc_name] + [t[1] for t in titles]
-            return " > ".join(hierarchy)
-            
-        return ""
+            logging.error(f"Error collecting table titles: {e}")
+        return titles
 
     def __call__(self, filename, binary=None, from_page=0, to_page=100000):
         self.doc = Document(
             filename) if not binary else Document(BytesIO(binary))
+        self.images = {}
         pn = 0
         lines = []
         last_image = None
@@ -208,16 +141,14 @@ class Docx(DocxParser):
                         else:
                             last_image = current_image
             for run in p.runs:
-                if 'lastRenderedPageBreak' in run._element.xml:
-                    pn += 1
-                    continue
-                if 'w:br' in run._element.xml and 'type="page"' in run._element.xml:
+                if run._element.xpath('./w:lastRenderedPageBreak | ./w:br[@w:type="page"]'):
                     pn += 1
         new_line = [(line[0], reduce(concat_img, line[1]) if line[1] else None) for line in lines]
 
         tbls = []
+        titles = self.__table_titles(filename)
         for i, tb in enumerate(self.doc.tables):
-            title = self.__get_nearest_title(i, filename)
+            title = titles[i] if i < len(titles) else ""
             html = "<table>"
             if title:
                 html += f"<caption>Table Location: {title}</caption>"
@@ -294,24 +225,34 @@ class Markdown(MarkdownParser):
         else:
             with open(filename, "r") as f:
                 txt = f.read()
-        remainder, tables = self.extract_tables_and_remainder(f'{txt}\n')
         sections = []
         tbls = []
-        for sec in remainder.split("\n"):
-            if num_tokens_from_string(sec) > 3 * self.chunk_token_num:
-                sections.append((sec[:int(len(sec) / 2)], ""))
-                sections.append((sec[int(len(sec) / 2):], ""))
+        # lines under the last heading, kept together up to a chunk
+        heading, heading_tks = [], 0
+        for kind, sec in self.iter_blocks(f'{txt}\n'):
+            if kind == "table":
+                tbls.append(((None, markdown(sec, extensions=['markdown.extensions.tables'])), ""))
+                continue
+            tnum = num_tokens_from_string(sec)
+            if heading and not sec.strip().startswith("#") and tnum <= 3 * self.chunk_token_num and heading_tks < self.chunk_token_num:
+                heading.append(sec)
+                heading_tks += tnum
+                continue
+            if heading:
+                sections.append(("\n".join(heading), ""))
+                heading, heading_tks = [], 0
+            if tnum > 3 * self.chunk_token_num:
+                # pieces of at most about 3 chunks each
+                n = max(2, math.ceil(tnum / (3 * self.chunk_token_num)))
+                step = math.ceil(len(sec) / n)
+                sections.extend([(sec[i:i + step], "") for i in range(0, len(sec), step)])
+            elif sec.strip().startswith("#"):
+                heading, heading_tks = [sec], tnum
             else:
-                if sec.strip().find("#") == 0:
-                    sections.append((sec, ""))
-                elif sections and sections[-1][0].strip().find("#") == 0:
-                    sec_, _ = sections.pop(-1)
-                    sections.append((sec_ + "\n" + sec, ""))
-                else:
-                    sections.append((sec, ""))
+                sections.append((sec, ""))
+        if heading:
+            sections.append(("\n".join(heading), ""))
 
-        for table in tables:
-            tbls.append(((None, markdown(table, extensions=['markdown.extensions.tables'])), ""))
         return sections, tbls
 
 
@@ -333,13 +274,14 @@ def chunk(filename, binary=None, from_page=0, to_page=100000,
         "title_tks": rag_tokenizer.tokenize(re.sub(r"\.[a-zA-Z]+$", "", filename))
     }
     doc["title_sm_tks"] = rag_tokenizer.fine_grained_tokenize(doc["title_tks"])
+    ctx = kwargs.get("parser_context") or ParserContext(kwargs.get("tenant_id"))
     res = []
     pdf_parser = None
     if re.search(r"\.docx$", filename, re.IGNORECASE):
         callback(0.1, "Start to parse.")
 
         try:
-            vision_model = LLMBundle(kwargs["tenant_id"], LLMType.IMAGE2TEXT)
+            vision_model = ctx.llm_bundle(LLMType.IMAGE2TEXT)
             callback(0.15, "Visual model detected. Attempting to enhance figure extraction...")
         except Exception:
             vision_model = None
@@ -382,7 +324,7 @@ def chunk(filename, binary=None, from_page=0, to_page=100000,
             pdf_parser = Pdf()
 
             try:
-                vision_model = LLMBundle(kwargs["tenant_id"], LLMType.IMAGE2TEXT)
+                vision_model = ctx.llm_bundle(LLMType.IMAGE2TEXT)
                 callback(0.15, "Visual model detected. Attempting to enhance figure extraction...")
             except Exception:
                 vision_model = None
@@ -407,7 +349,7 @@ def chunk(filename, binary=None, from_page=0, to_page=100000,
             if layout_recognizer == "Plain Text":
                 pdf_parser = PlainParser()
             else:
-                vision_model = LLMBundle(kwargs["tenant_id"], LLMType.IMAGE2TEXT, llm_name=layout_recognizer, lang=lang)
+                vision_model = ctx.llm_bundle(LLMType.IMAGE2TEXT, llm_name=layout_recognizer, lang=lang)
                 pdf_parser = VisionParser(vision_model=vision_model, **kwargs)
 
             sections, tables = pdf_parser(filename if not binary else binary, from_page=from_page, to_page=to_page,
@@ -438,11 +380,12 @@ def chunk(filename, binary=None, from_page=0, to_page=100000,
 
     elif re.search(r"\.(htm|html)$", filename, re.IGNORECASE):
         callback(0.1, "Start to parse.")
-        sections = HtmlParser()(filename, binary)
+        sections, tables = HtmlParser().sections(filename, binary, int(parser_config.get("chunk_token_num", 128)))
         sections = [(_, "") for _ in sections if _]
+        res = tokenize_table([((None, t), "") for t in tables], doc, is_english)
         callback(0.8, "Finish parsing.")
 
-    elif re.search(r"\.json$", filename, re.IGNORECASE):
+    elif re.search(r"\.(json|jsonl|ldjson)$", filename, re.IGNORECASE):
         callback(0.1, "Start to parse.")
         chunk_token_num = int(parser_config.get("chunk_token_num", 128))
         sections = JsonParser(chunk_token_num)(binary)
@@ -451,16 +394,26 @@ def chunk(filename, binary=None, from_page=0, to_page=100000,
 
     elif re.search(r"\.doc$", filename, re.IGNORECASE):
         callback(0.1, "Start to parse.")
-        binary = BytesIO(binary)
-        doc_parsed = parser.from_buffer(binary)
-        if doc_parsed.get('content', None) is not None:
-            sections = doc_parsed['content'].split('\n')
+        try:
+            sections, tables = DocParser()(filename, binary)
+        except Exception as e:
+            logging.warning(f"Fail to read {filename} as a Word 97-2003 document: {e}, falling back to tika.")
+            sections, tables = [], []
+        if sections or tables:
             sections = [(_, "") for _ in sections if _]
+            res = tokenize_table([((None, tb), "") for tb in tables], doc, is_english)
             callback(0.8, "Finish parsing.")
         else:
-            callback(0.8, f"tika.parser got empty content from {filename}.")
-            logging.warning(f"tika.parser got empty content from {filename}.")
-            return []
+            binary = BytesIO(binary)
+            doc_parsed = parser.from_buffer(binary)
+            if doc_parsed.get('content', None) is not None:
+                sections = doc_parsed['content'].split('\n')
+                sections = [(_, "") for _ in sections if _]
+                callback(0.8, "Finish parsing.")
+            else:
+                callback(0.8, f"tika.parser got empty content from {filename}.")
+                logging.warning(f"tika.parser got empty content from {filename}.")
+                return []
 
     else:
         raise NotImplementedError(
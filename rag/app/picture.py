@@ -20,7 +20,7 @@ import numpy as np
 from PIL import Image
 
 from api.db import LLMType
-from api.db.services.llm_service import LLMBundle
+from api.db.services.llm_service import ParserContext
 from deepdoc.vision import OCR
 from rag.nlp import tokenize
 from rag.utils import clean_markdown_block
@@ -45,7 +45,7 @@ def chunk(filename, binary, tenant_id, lang, callback=None, **kwargs):
 
     try:
         callback(0.4, "Use CV LLM to describe the picture.")
-        cv_mdl = LLMBundle(tenant_id, LLMType.IMAGE2TEXT, lang=lang)
+        cv_mdl = (kwargs.get("parser_context") or ParserContext(tenant_id)).llm_bundle(LLMType.IMAGE2TEXT, lang=lang)
         img_binary = io.BytesIO()
         img.save(img_binary, format='JPEG')
         img_binary.seek(0)
@@ -87,3 +87,20 @@ def vision_llm_chunk(binary, vision_model, prompt=None, callback=None):
         callback(-1, str(e))
 
     return ""
+
+
+def vision_llm_chunks(images, vision_model, prompts=None, callback=None):
+    """
+    vision_llm_chunk for several images at once, described in batches by the VLM.
+
+    Returns:
+        The markdown text of every image, "" for the images that failed.
+    """
+    callback = callback or (lambda prog, msg: None)
+
+    try:
+        return [clean_markdown_block(ans) for ans in vision_model.describe_batch(images, prompts)]
+    except Exception as e:
+        callback(-1, str(e))
+
+    return [""] * len(images)
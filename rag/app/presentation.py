@@ -20,9 +20,14 @@ from io import BytesIO
 
 from PIL import Image
 
+from api.db import LLMType
+from api.db.services.llm_service import ParserContext
+from rag.app.picture import vision_llm_chunks
 from rag.nlp import tokenize, is_english
 from rag.nlp import rag_tokenizer
+from rag.prompts import vision_llm_describe_prompt
 from deepdoc.parser import PdfParser, PptParser, PlainParser
+from deepdoc.parser.pdf_parser import VisionParser
 from PyPDF2 import PdfReader as pdf2_read
 
 
@@ -83,6 +88,19 @@ class Pdf(PdfParser):
         return res
 
 
+class VisionPdf(VisionParser):
+    def __call__(self, filename, binary=None, from_page=0,
+                 to_page=100000, callback=None, **kwargs):
+        self.__images__(filename if not binary else binary, 3, from_page, to_page, callback)
+        images = self.page_images or []
+        callback(msg="Page {}~{}: transcribing {} slides".format(from_page, min(to_page, self.total_page), len(images)))
+        prompts = [vision_llm_describe_prompt(page=from_page + i + 1) for i in range(len(images))]
+        txts = vision_llm_chunks(images, self.vision_model, prompts, callback)
+        callback(0.9, "Page {}~{}: Parsing finished".format(
+            from_page, min(to_page, self.total_page)))
+        return list(zip(txts, images))
+
+
 class PlainPdf(PlainParser):
     def __call__(self, filename, binary=None, from_page=0,
                  to_page=100000, callback=None, **kwargs):
@@ -122,9 +140,17 @@ def chunk(filename, binary=None, from_page=0, to_page=100000,
             res.append(d)
         return res
     elif re.search(r"\.pdf$", filename, re.IGNORECASE):
-        pdf_parser = Pdf()
-        if kwargs.get("layout_recognize", "DeepDOC") == "Plain Text":
+        layout_recognizer = kwargs.get("layout_recognize", "DeepDOC")
+        if isinstance(layout_recognizer, bool):
+            layout_recognizer = "DeepDOC" if layout_recognizer else "Plain Text"
+        if layout_recognizer == "DeepDOC":
+            pdf_parser = Pdf()
+        elif layout_recognizer == "Plain Text":
             pdf_parser = PlainParser()
+        else:
+            ctx = kwargs.get("parser_context") or ParserContext(kwargs.get("tenant_id"))
+            vision_model = ctx.llm_bundle(LLMType.IMAGE2TEXT, llm_name=layout_recognizer, lang=lang)
+            pdf_parser = VisionPdf(vision_model=vision_model)
         for pn, (txt, img) in enumerate(pdf_parser(filename, binary,
                                                    from_page=from_page, to_page=to_page, callback=callback)):
             d = copy.deepcopy(doc)
@@ -36,26 +36,26 @@ from rag.utils import get_float
 class Excel(ExcelParser):
     def __call__(self, fnm, binary=None, callback=None):
         if not binary:
-            wb = load_workbook(fnm)
+            wb = load_workbook(fnm, read_only=True)
         else:
-            wb = load_workbook(BytesIO(binary))
+            wb = load_workbook(BytesIO(binary), read_only=True)
         total = 0
         for sheetname in wb.sheetnames:
-            total += len(list(wb[sheetname].rows))
+            total += Excel._sheet_rows(wb[sheetname])
 
         res, fails = [], []
         for sheetname in wb.sheetnames:
             ws = wb[sheetname]
-            rows = list(ws.rows)
-            for i, r in enumerate(rows):
+            Excel._reset_dimensions(ws)
+            for i, r in enumerate(ws.iter_rows(values_only=True)):
                 q, a = "", ""
-                for cell in r:
-                    if not cell.value:
+                for v in r:
+                    if not v:
                         continue
                     if not q:
-                        q = str(cell.value)
+                        q = str(v)
                     elif not a:
-                        a = str(cell.value)
+                        a = str(v)
                     else:
                         break
                 if q and a:
@@ -69,6 +69,8 @@ class Excel(ExcelParser):
                                      (f"{len(fails)} failure, line: %s..." %
                                       (",".join(fails[:3])) if fails else "")))
 
+        wb.close()
+
         callback(0.6, ("Extract pairs: {}. ".format(len(res)) + (
             f"{len(fails)} failure, line: %s..." % (",".join(fails[:3])) if fails else "")))
         self.is_english = is_english(
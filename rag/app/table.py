@@ -33,38 +33,37 @@ class Excel(ExcelParser):
     def __call__(self, fnm, binary=None, from_page=0,
                  to_page=10000000000, callback=None):
         if not binary:
-            wb = Excel._load_excel_to_workbook(fnm)
+            wb = Excel._load_excel_to_workbook(fnm, read_only=True)
         else:
-            wb = Excel._load_excel_to_workbook(BytesIO(binary))
-        total = 0
-        for sheetname in wb.sheetnames:
-            total += len(list(wb[sheetname].rows))
+            wb = Excel._load_excel_to_workbook(BytesIO(binary), read_only=True)
 
         res, fails, done = [], [], 0
         rn = 0
         for sheetname in wb.sheetnames:
+            if rn >= to_page:
+                break
             ws = wb[sheetname]
-            rows = list(ws.rows)
-            if not rows:
+            Excel._reset_dimensions(ws)
+            headers = next(ws.iter_rows(max_row=1, values_only=True), None)
+            if headers is None:
                 continue
-            headers = [cell.value for cell in rows[0]]
             missed = set([i for i, h in enumerate(headers) if h is None])
-            headers = [
-                cell.value for i,
-                cell in enumerate(
-                    rows[0]) if i not in missed]
+            headers = [h for i, h in enumerate(headers) if i not in missed]
             if not headers:
                 continue
+            # Seek to the task's first row instead of streaming the rows before it.
+            nrows = Excel._sheet_rows(ws) - 1
+            if rn + nrows <= from_page:
+                rn += nrows
+                continue
+            start = max(0, from_page - rn)
+            rn += start
             data = []
-            for i, r in enumerate(rows[1:]):
+            for i, r in enumerate(ws.iter_rows(min_row=start + 2, values_only=True), start):
                 rn += 1
-                if rn - 1 < from_page:
-                    continue
                 if rn - 1 >= to_page:
                     break
-                row = [
-                    cell.value for ii,
-                    cell in enumerate(r) if ii not in missed]
+                row = [v for ii, v in enumerate(r) if ii not in missed]
                 if len(row) != len(headers):
                     fails.append(str(i))
                     continue
@@ -73,6 +72,7 @@ class Excel(ExcelParser):
             if np.array(data).size == 0:
                 continue
             res.append(pd.DataFrame(np.array(data), columns=headers))
+        wb.close()
 
         callback(0.3, ("Extract records: {}~{}".format(from_page + 1, min(to_page, from_page + rn)) + (
             f"{len(fails)} failure, line: %s..." % (",".join(fails[:3])) if fails else "")))
@@ -159,11 +159,7 @@ def chunk(filename, binary=None, from_page=0, to_page=10000000000,
         fails = []
         headers = lines[0].split(kwargs.get("delimiter", "\t"))
         rows = []
-        for i, line in enumerate(lines[1:]):
-            if i < from_page:
-                continue
-            if i >= to_page:
-                break
+        for i, line in enumerate(lines[1 + from_page:1 + to_page], from_page):
             row = [field for field in line.split(kwargs.get("delimiter", "\t"))]
             if len(row) != len(headers):
                 fails.append(str(i))
@@ -16,8 +16,12 @@
 import base64
 import io
 import json
+import logging
+import math
 import os
+import re
 from abc import ABC
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
 import requests
@@ -33,8 +37,18 @@ from rag.nlp import is_english
 from rag.prompts import vision_llm_describe_prompt
 from rag.utils import num_tokens_from_string
 
+# Requests describe_batch sends to the model at the same time.
+VISION_CONCURRENCY = int(os.environ.get("VISION_CONCURRENCY", 4))
+# Pixels an image is downscaled to before being sent, shared by the images packed in one request
+# but never below VISION_MIN_PIXELS per image.
+VISION_MAX_PIXELS = int(os.environ.get("VISION_MAX_PIXELS", 2400000))
+VISION_MIN_PIXELS = int(os.environ.get("VISION_MIN_PIXELS", 800000))
+
 
 class Base(ABC):
+    # Images describe_batch packs in one request, 1 when the backend is not known to take several.
+    max_images_per_request = 1
+
     def __init__(self, key, model_name):
         pass
 
@@ -44,6 +58,96 @@ class Base(ABC):
     def describe_with_prompt(self, image, prompt=None):
         raise NotImplementedError("Please implement encode method!")
 
+    def describe_batch(self, images, prompts=None):
+        """
+        Describes several images, as describe_with_prompt with `prompts[i]` or as describe without
+        prompts, and returns [(text, used tokens)] in the order of `images`.
+
+        Images are downscaled first. Backends taking several images per request get them packed
+        `max_images_per_request` at a time, the others get concurrent single requests. An image that
+        cannot be described is logged and gets ("", 0), without failing the others.
+        """
+        n = len(images)
+        if not n:
+            return []
+        per_request = max(1, min(self.max_images_per_request, n))
+        max_pixels = max(VISION_MIN_PIXELS, VISION_MAX_PIXELS // per_request)
+        groups = [list(range(i, min(i + per_request, n))) for i in range(0, n, per_request)]
+        res = [None] * n
+
+        def describe_group(idx):
+            scaled = {}
+            for i in idx:
+                try:
+                    scaled[i] = self.downscale(images[i], max_pixels)
+                except Exception:
+                    logging.exception(f"{self.model_name}: can't read image {i} of the batch")
+                    res[i] = ("", 0)
+            idx = [i for i in idx if i in scaled]
+            if len(idx) > 1:
+                try:
+                    packed = self._describe_packed([scaled[i] for i in idx], [prompts[i] for i in idx] if prompts else None)
+                    for i, r in zip(idx, packed):
+                        res[i] = r
+                except Exception as e:
+                    logging.warning(f"{self.model_name}: describing {len(idx)} images in one request failed, describing them one by one: {e}")
+            for i in idx:
+                if res[i] is not None:
+                    continue
+                try:
+                    res[i] = self.describe_with_prompt(scaled[i], prompts[i]) if prompts else self.describe(scaled[i])
+                except Exception:
+                    logging.exception(f"{self.model_name}: describing image {i} of the batch failed")
+                    res[i] = ("", 0)
+
+        with ThreadPoolExecutor(max_workers=min(len(groups), VISION_CONCURRENCY)) as executor:
+            list(executor.map(describe_group, groups))
+        return res
+
+    def _describe_packed(self, images, prompts=None):
+        """
+        Describes `images` in a single chat completion, the output of every image following a marker
+        line. Returns [(text, used tokens)], None for the images the answer has no output for.
+        """
+        if prompts and len(set(prompts)) > 1:
+            header = f"There are {len(images)} images below, each one with its own instruction. "
+        else:
+            instruction = (prompts[0] or vision_llm_describe_prompt()) if prompts else self.describe_prompt()
+            header = f"There are {len(images)} images below. For each of them, on its own:\n{instruction}\n"
+            prompts = None
+        content = [{"type": "text", "text": header + "Start the output for image k with a line holding only <<<IMAGE k>>>."}]
+        for k, img in enumerate(images, 1):
+            content.append({"type": "text", "text": f"<<<IMAGE {k}>>>" + (f"\n{prompts[k - 1]}" if prompts else "")})
+            content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{self.image2base64(img)}"}})
+
+        res = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": content}],
+        )
+        parts = re.split(r"^[ \t]*<<<IMAGE ([0-9]+)>>>[ \t]*$", res.choices[0].message.content or "", flags=re.MULTILINE)
+        outputs = {}
+        for i in range(1, len(parts) - 1, 2):
+            outputs[int(parts[i])] = parts[i + 1].strip()
+        found = [k for k in range(1, len(images) + 1) if k in outputs]
+        tokens = res.usage.total_tokens // max(1, len(found))
+        return [(outputs[k], tokens) if k in outputs else None for k in range(1, len(images) + 1)]
+
+    @staticmethod
+    def downscale(image, max_pixels):
+        """`image` (bytes, BytesIO or PIL image) as JPEG bytes of at most `max_pixels` pixels."""
+        data = image.getvalue() if isinstance(image, BytesIO) else image
+        img = data if isinstance(data, Image.Image) else Image.open(BytesIO(data))
+        w, h = img.size
+        if w * h <= max_pixels and isinstance(data, bytes) and img.format == "JPEG":
+            return data
+        img = img.convert("RGB")
+        if w * h > max_pixels:
+            ratio = math.sqrt(max_pixels / (w * h))
+            img = img.resize((max(1, int(w * ratio)), max(1, int(h * ratio))), Image.LANCZOS)
+        buffered = BytesIO()
+        img.save(buffered, format="JPEG", quality=90)
+        return buffered.getvalue()
+
     def chat(self, system, history, gen_conf, image=""):
         if system:
             history[-1]["content"] = system + history[-1]["content"] + "user query: " + history[-1]["content"]
@@ -121,13 +225,16 @@ class Base(ABC):
                         },
                     },
                     {
-                        "text": "请用中文详细描述一下图中的内容，比如时间，地点，人物，事情，人物心情等，如果有数据请提取出数据。" if self.lang.lower() == "chinese" else
-                        "Please describe the content of this picture, like where, when, who, what happen. If it has number data, please extract them out.",
+                        "text": self.describe_prompt(),
                     },
                 ],
             }
         ]
 
+    def describe_prompt(self):
+        return "请用中文详细描述一下图中的内容，比如时间，地点，人物，事情，人物心情等，如果有数据请提取出数据。" if self.lang.lower() == "chinese" else \
+            "Please describe the content of this picture, like where, when, who, what happen. If it has number data, please extract them out."
+
     def vision_llm_prompt(self, b64, prompt=None):
         return [
             {
@@ -163,6 +270,8 @@ class Base(ABC):
 
 
 class GptV4(Base):
+    max_images_per_request = 4
+
     def __init__(self, key, model_name="gpt-4-vision-preview", lang="Chinese", base_url="https://api.openai.com/v1"):
         if not base_url:
             base_url = "https://api.openai.com/v1"
@@ -196,6 +305,8 @@ class GptV4(Base):
 
 
 class AzureGptV4(Base):
+    max_images_per_request = 4
+
     def __init__(self, key, model_name, lang="Chinese", **kwargs):
         api_key = json.loads(key).get('api_key', '')
         api_version = json.loads(key).get('api_version', '2024-02-01')
@@ -545,6 +656,8 @@ class OllamaCV(Base):
 
 
 class LocalAICV(GptV4):
+    max_images_per_request = 1
+
     def __init__(self, key, model_name, base_url, lang="Chinese"):
         if not base_url:
             raise ValueError("Local cv model url cannot be None")
@@ -673,6 +786,8 @@ class GeminiCV(Base):
 
 
 class OpenRouterCV(GptV4):
+    max_images_per_request = 1
+
     def __init__(
         self,
         key,
@@ -789,6 +904,8 @@ class NvidiaCV(Base):
 
 
 class StepFunCV(GptV4):
+    max_images_per_request = 1
+
     def __init__(self, key, model_name="step-1v-8k", lang="Chinese", base_url="https://api.stepfun.com/v1"):
         if not base_url:
             base_url = "https://api.stepfun.com/v1"
@@ -798,6 +915,8 @@ class StepFunCV(GptV4):
 
 
 class LmStudioCV(GptV4):
+    max_images_per_request = 1
+
     def __init__(self, key, model_name, lang="Chinese", base_url=""):
         if not base_url:
             raise ValueError("Local llm url cannot be None")
@@ -809,6 +928,8 @@ class LmStudioCV(GptV4):
 
 
 class OpenAI_APICV(GptV4):
+    max_images_per_request = 1
+
     def __init__(self, key, model_name, lang="Chinese", base_url=""):
         if not base_url:
             raise ValueError("url cannot be None")
@@ -820,6 +941,8 @@ class OpenAI_APICV(GptV4):
 
 
 class TogetherAICV(GptV4):
+    max_images_per_request = 1
+
     def __init__(self, key, model_name, lang="Chinese", base_url="https://api.together.xyz/v1"):
         if not base_url:
             base_url = "https://api.together.xyz/v1"
@@ -827,6 +950,8 @@ class TogetherAICV(GptV4):
 
 
 class YiCV(GptV4):
+    max_images_per_request = 1
+
     def __init__(self, key, model_name, lang="Chinese", base_url="https://api.lingyiwanwu.com/v1",):
         if not base_url:
             base_url = "https://api.lingyiwanwu.com/v1"
@@ -834,6 +959,8 @@ class YiCV(GptV4):
 
 
 class SILICONFLOWCV(GptV4):
+    max_images_per_request = 1
+
     def __init__(self, key, model_name, lang="Chinese", base_url="https://api.siliconflow.cn/v1",):
         if not base_url:
             base_url = "https://api.siliconflow.cn/v1"
@@ -1031,6 +1158,8 @@ class AnthropicCV(Base):
         yield total_tokens
 
 class GPUStackCV(GptV4):
+    max_images_per_request = 1
+
     def __init__(self, key, model_name, lang="Chinese", base_url=""):
         if not base_url:
             raise ValueError("Local llm url cannot be None")
@@ -255,14 +255,32 @@ def tokenize(d, t, eng):
     d["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(d["content_ltks"])
 
 
+def doc_copier(doc):
+    """
+    Returns a function that builds a fresh copy of `doc` for each chunk. Strings and numbers are
+    shared with `doc` and only container values are deep-copied, which gives the same chunks as
+    copy.deepcopy(doc) at a fraction of the cost.
+    """
+    mutable = [k for k, v in doc.items() if not isinstance(v, (str, bytes, int, float, bool, type(None)))]
+
+    def new_doc():
+        d = dict(doc)
+        for k in mutable:
+            d[k] = copy.deepcopy(doc[k])
+        return d
+
+    return new_doc
+
+
 def tokenize_chunks(chunks, doc, eng, pdf_parser=None):
     res = []
+    new_doc = doc_copier(doc)
     # wrap up as es documents
     for ii, ck in enumerate(chunks):
         if len(ck.strip()) == 0:
             continue
         logging.debug("-- {}".format(ck))
-        d = copy.deepcopy(doc)
+        d = new_doc()
         if pdf_parser:
             try:
                 d["image"], poss = pdf_parser.crop(ck, need_position=True)
@@ -279,12 +297,13 @@ def tokenize_chunks(chunks, doc, eng, pdf_parser=None):
 
 def tokenize_chunks_docx(chunks, doc, eng, images):
     res = []
+    new_doc = doc_copier(doc)
     # wrap up as es documents
     for ck, image in zip(chunks, images):
         if len(ck.strip()) == 0:
             continue
         logging.debug("-- {}".format(ck))
-        d = copy.deepcopy(doc)
+        d = new_doc()
         d["image"] = image
         tokenize(d, ck, eng)
         res.append(d)
@@ -293,12 +312,13 @@ def tokenize_chunks_docx(chunks, doc, eng, images):
 
 def tokenize_table(tbls, doc, eng, batch_size=10):
     res = []
+    new_doc = doc_copier(doc)
     # add tables
     for (img, rows), poss in tbls:
         if not rows:
             continue
         if isinstance(rows, str):
-            d = copy.deepcopy(doc)
+            d = new_doc()
             tokenize(d, rows, eng)
             d["content_with_weight"] = rows
             if img:
@@ -309,7 +329,7 @@ def tokenize_table(tbls, doc, eng, batch_size=10):
             continue
         de = "; " if eng else "； "
         for i in range(0, len(rows), batch_size):
-            d = copy.deepcopy(doc)
+            d = new_doc()
             r = de.join(rows[i:i + batch_size])
             tokenize(d, r, eng)
             d["image"] = img
@@ -14,9 +14,12 @@
 #  limitations under the License.
 #
 import logging
+import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 import umap
 import numpy as np
+from sklearn.cluster import HDBSCAN, MiniBatchKMeans
 from sklearn.mixture import GaussianMixture
 import trio
 
@@ -29,12 +32,23 @@ from graphrag.utils import (
 )
 from rag.utils import truncate
 
+# Number of GaussianMixture fits run side by side while searching the cluster count.
+RAPTOR_BIC_WORKERS = int(os.environ.get("RAPTOR_BIC_WORKERS", min(8, os.cpu_count() or 1)))
+# Stop searching once this many successive cluster counts fail to improve the BIC.
+RAPTOR_BIC_PATIENCE = int(os.environ.get("RAPTOR_BIC_PATIENCE", 8))
+# Bounds on the dimensionality reduction: UMAP is fit on a sample at most this large and the rest is projected.
+RAPTOR_UMAP_MAX_SAMPLES = int(os.environ.get("RAPTOR_UMAP_MAX_SAMPLES", 2000))
+RAPTOR_UMAP_MAX_NEIGHBORS = int(os.environ.get("RAPTOR_UMAP_MAX_NEIGHBORS", 64))
+# Upper bound of summaries embedded in one request.
+RAPTOR_EMBEDDING_BATCH_SIZE = int(os.environ.get("RAPTOR_EMBEDDING_BATCH_SIZE", 16))
+
 
 class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
     def __init__(
-        self, max_cluster, llm_model, embd_model, prompt, max_token=512, threshold=0.1
+        self, max_cluster, llm_model, embd_model, prompt, max_token=512, threshold=0.1, cluster_method="gmm"
     ):
         self._max_cluster = max_cluster
+        self._cluster_method = cluster_method
         self._llm_model = llm_model
         self._embd_model = embd_model
         self._threshold = threshold
@@ -54,105 +68,153 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
         set_llm_cache(self._llm_model.llm_name, system, response, history, gen_conf)
         return response
 
-    async def _embedding_encode(self, txt):
-        response = get_embed_cache(self._embd_model.llm_name, txt)
-        if response is not None:
-            return response
-        embds, _ = await trio.to_thread.run_sync(lambda: self._embd_model.encode([txt]))
-        if len(embds) < 1 or len(embds[0]) < 1:
-            raise Exception("Embedding error: ")
-        embds = embds[0]
-        set_embed_cache(self._embd_model.llm_name, txt, embds)
+    async def _embedding_encode(self, txts: list[str]):
+        """Embed texts in one call, skipping those already in the embedding cache."""
+        embds = [get_embed_cache(self._embd_model.llm_name, txt) for txt in txts]
+        missing = [i for i, embd in enumerate(embds) if embd is None]
+        if missing:
+            vects, _ = await trio.to_thread.run_sync(lambda: self._embd_model.encode([txts[i] for i in missing]))
+            if len(vects) != len(missing) or any(len(v) < 1 for v in vects):
+                raise Exception("Embedding error: ")
+            for i, v in zip(missing, vects):
+                embds[i] = v
+                set_embed_cache(self._embd_model.llm_name, txts[i], v)
         return embds
 
     def _get_optimal_clusters(self, embeddings: np.ndarray, random_state: int):
+        """
+        Pick the cluster count with the lowest BIC. Candidates are fitted in parallel batches and the
+        search stops once RAPTOR_BIC_PATIENCE successive counts did not improve. The best fitted
+        model is returned along with its size so it doesn't have to be fitted again.
+        """
         max_clusters = min(self._max_cluster, len(embeddings))
         n_clusters = np.arange(1, max_clusters)
-        bics = []
-        for n in n_clusters:
+
+        def fit(n):
             gm = GaussianMixture(n_components=n, random_state=random_state)
             gm.fit(embeddings)
-            bics.append(gm.bic(embeddings))
-        optimal_clusters = n_clusters[np.argmin(bics)]
-        return optimal_clusters
+            return gm, gm.bic(embeddings)
 
-    async def __call__(self, chunks, random_state, callback=None):
+        optimal_clusters, optimal_gm, best_bic, stale = 1, None, np.inf, 0
+        workers = max(1, RAPTOR_BIC_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for b in range(0, len(n_clusters), workers):
+                batch = n_clusters[b:b + workers]
+                for n, (gm, bic) in zip(batch, executor.map(fit, batch)):
+                    if bic < best_bic:
+                        optimal_clusters, optimal_gm, best_bic, stale = n, gm, bic, 0
+                    else:
+                        stale += 1
+                if stale >= RAPTOR_BIC_PATIENCE:
+                    break
+        return optimal_clusters, optimal_gm
+
+    def _reduce_dimensions(self, embeddings: list, random_state: int) -> np.ndarray:
+        embeddings = np.array(embeddings)
+        n_neighbors = min(int((len(embeddings) - 1) ** 0.8), RAPTOR_UMAP_MAX_NEIGHBORS)
+        reducer = umap.UMAP(
+            n_neighbors=max(2, n_neighbors),
+            n_components=min(12, len(embeddings) - 2),
+            metric="cosine",
+        )
+        if len(embeddings) <= RAPTOR_UMAP_MAX_SAMPLES:
+            return reducer.fit_transform(embeddings)
+        sample = np.random.RandomState(random_state).choice(len(embeddings), RAPTOR_UMAP_MAX_SAMPLES, replace=False)
+        reducer.fit(embeddings[sample])
+        return reducer.transform(embeddings)
+
+    def _cluster(self, embeddings: np.ndarray, random_state: int):
+        """Return the number of clusters and the cluster label of every embedding."""
+        if self._cluster_method == "kmeans":
+            n_clusters = int(min(self._max_cluster, max(2, len(embeddings) ** 0.5)))
+            lbls = MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state, n_init=3).fit_predict(embeddings)
+        elif self._cluster_method == "hdbscan":
+            lbls = HDBSCAN(min_cluster_size=max(2, len(embeddings) // max(1, self._max_cluster))).fit_predict(embeddings)
+            # Noise points (-1) are summarized together as one more cluster.
+            lbls = np.unique(lbls, return_inverse=True)[1]
+        else:
+            n_clusters, gm = self._get_optimal_clusters(embeddings, random_state)
+            if n_clusters == 1:
+                return 1, [0 for _ in range(len(embeddings))]
+            probs = gm.predict_proba(embeddings)
+            lbls = [np.where(prob > self._threshold)[0] for prob in probs]
+            lbls = [lbl[0] if isinstance(lbl, np.ndarray) else lbl for lbl in lbls]
+        # Keep labels contiguous, a cluster may end up empty after thresholding.
+        uniq, lbls = np.unique(lbls, return_inverse=True)
+        return len(uniq), lbls.tolist()
+
+    async def __call__(self, chunks, random_state, callback=None, on_layer=None):
+        """
+        Build the summary tree over `chunks` ((text, embedding) pairs) and return them followed by
+        the summaries. `on_layer` is awaited with the summaries of every finished layer, so they
+        can be indexed before the whole tree is done; returning False from it stops the build.
+        """
         if len(chunks) <= 1:
             return []
         chunks = [(s, a) for s, a in chunks if s and len(a) > 0]
         layers = [(0, len(chunks))]
         start, end = 0, len(chunks)
 
-        async def summarize(ck_idx: list[int]):
-            nonlocal chunks
-            texts = [chunks[i][0] for i in ck_idx]
-            len_per_chunk = int(
-                (self._llm_model.max_length - self._max_token) / len(texts)
-            )
-            cluster_content = "\n".join(
-                [truncate(t, max(1, len_per_chunk)) for t in texts]
-            )
-            async with chat_limiter:
-                cnt = await self._chat(
-                    "You're a helpful assistant.",
-                    [
-                        {
-                            "role": "user",
-                            "content": self._prompt.format(
-                                cluster_content=cluster_content
-                            ),
-                        }
-                    ],
-                    {"temperature": 0.3, "max_tokens": self._max_token},
+        async def summarize(ck_idx: list[int], send_channel):
+            async with send_channel:
+                texts = [chunks[i][0] for i in ck_idx]
+                len_per_chunk = int(
+                    (self._llm_model.max_length - self._max_token) / len(texts)
                 )
-            cnt = re.sub(
-                "(······\n由于长度的原因，回答被截断了，要继续吗？|For the content length reason, it stopped, continue?)",
-                "",
-                cnt,
-            )
-            logging.debug(f"SUM: {cnt}")
-            embds = await self._embedding_encode(cnt)
-            chunks.append((cnt, embds))
+                cluster_content = "\n".join(
+                    [truncate(t, max(1, len_per_chunk)) for t in texts]
+                )
+                async with chat_limiter:
+                    cnt = await self._chat(
+                        "You're a helpful assistant.",
+                        [
+                            {
+                                "role": "user",
+                                "content": self._prompt.format(
+                                    cluster_content=cluster_content
+                                ),
+                            }
+                        ],
+                        {"temperature": 0.3, "max_tokens": self._max_token},
+                    )
+                cnt = re.sub(
+                    "(······\n由于长度的原因，回答被截断了，要继续吗？|For the content length reason, it stopped, continue?)",
+                    "",
+                    cnt,
+                )
+                logging.debug(f"SUM: {cnt}")
+                await send_channel.send(cnt)
+
+        async def embed(receive_channel):
+            # Summaries that finish while a batch is being embedded are embedded together next round.
+            async with receive_channel:
+                async for cnt in receive_channel:
+                    batch = [cnt]
+                    while len(batch) < RAPTOR_EMBEDDING_BATCH_SIZE:
+                        try:
+                            batch.append(receive_channel.receive_nowait())
+                        except (trio.WouldBlock, trio.EndOfChannel):
+                            break
+                    embds = await self._embedding_encode(batch)
+                    chunks.extend(zip(batch, embds))
 
         labels = []
         while end - start > 1:
             embeddings = [embd for _, embd in chunks[start:end]]
             if len(embeddings) == 2:
-                await summarize([start, start + 1])
-                if callback:
-                    callback(
-                        msg="Cluster one layer: {} -> {}".format(
-                            end - start, len(chunks) - end
-                        )
-                    )
-                labels.extend([0, 0])
-                layers.append((end, len(chunks)))
-                start = end
-                end = len(chunks)
-                continue
-
-            n_neighbors = int((len(embeddings) - 1) ** 0.8)
-            reduced_embeddings = umap.UMAP(
-                n_neighbors=max(2, n_neighbors),
-                n_components=min(12, len(embeddings) - 2),
-                metric="cosine",
-            ).fit_transform(embeddings)
-            n_clusters = self._get_optimal_clusters(reduced_embeddings, random_state)
-            if n_clusters == 1:
-                lbls = [0 for _ in range(len(reduced_embeddings))]
+                n_clusters, lbls = 1, [0, 0]
             else:
-                gm = GaussianMixture(n_components=n_clusters, random_state=random_state)
-                gm.fit(reduced_embeddings)
-                probs = gm.predict_proba(reduced_embeddings)
-                lbls = [np.where(prob > self._threshold)[0] for prob in probs]
-                lbls = [lbl[0] if isinstance(lbl, np.ndarray) else lbl for lbl in lbls]
+                reduced_embeddings = await trio.to_thread.run_sync(lambda: self._reduce_dimensions(embeddings, random_state))
+                n_clusters, lbls = await trio.to_thread.run_sync(lambda: self._cluster(reduced_embeddings, random_state))
 
             async with trio.open_nursery() as nursery:
-                for c in range(n_clusters):
-                    ck_idx = [i + start for i in range(len(lbls)) if lbls[i] == c]
-                    assert len(ck_idx) > 0
-                    async with chat_limiter:
-                        nursery.start_soon(summarize, ck_idx)
+                send_channel, receive_channel = trio.open_memory_channel(n_clusters)
+                nursery.start_soon(embed, receive_channel)
+                async with send_channel:
+                    for c in range(n_clusters):
+                        ck_idx = [i + start for i in range(len(lbls)) if lbls[i] == c]
+                        assert len(ck_idx) > 0
+                        nursery.start_soon(summarize, ck_idx, send_channel.clone())
 
             assert len(chunks) - end == n_clusters, "{} vs. {}".format(
                 len(chunks) - end, n_clusters
@@ -165,6 +227,8 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
                         end - start, len(chunks) - end
                     )
                 )
+            if on_layer and await on_layer(chunks[end:]) is False:
+                break
             start = end
             end = len(chunks)
 
@@ -48,7 +48,7 @@ from peewee import DoesNotExist
 
 from api.db import LLMType, ParserType, TaskStatus
 from api.db.services.document_service import DocumentService
-from api.db.services.llm_service import LLMBundle
+from api.db.services.llm_service import LLMBundle, parser_context
 from api.db.services.task_service import TaskService
 from api.db.services.file2document_service import File2DocumentService
 from api import settings
@@ -254,7 +254,8 @@ async def build_chunks(task, progress_callback):
         async with chunk_limiter:
             cks = await trio.to_thread.run_sync(lambda: chunker.chunk(task["name"], binary=binary, from_page=task["from_page"],
                                 to_page=task["to_page"], lang=task["language"], callback=progress_callback,
-                                kb_id=task["kb_id"], parser_config=task["parser_config"], tenant_id=task["tenant_id"]))
+                                kb_id=task["kb_id"], parser_config=task["parser_config"], tenant_id=task["tenant_id"],
+                                parser_context=parser_context(task["tenant_id"])))
         logging.info("Chunking({}) {}/{} done".format(timer() - st, task["location"], task["name"]))
     except TaskCanceledException:
         raise
@@ -306,7 +307,7 @@ async def build_chunks(task, progress_callback):
     if task["parser_config"].get("auto_keywords", 0):
         st = timer()
         progress_callback(msg="Start to generate keywords for every chunk ...")
-        chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
+        chat_mdl = parser_context(task["tenant_id"]).llm_bundle(LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
 
         async def doc_keyword_extraction(chat_mdl, d, topn):
             cached = get_llm_cache(chat_mdl.llm_name, d["content_with_weight"], "keywords", {"topn": topn})
@@ -326,7 +327,7 @@ async def build_chunks(task, progress_callback):
     if task["parser_config"].get("auto_questions", 0):
         st = timer()
         progress_callback(msg="Start to generate questions for every chunk ...")
-        chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
+        chat_mdl = parser_context(task["tenant_id"]).llm_bundle(LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
 
         async def doc_question_proposal(chat_mdl, d, topn):
             cached = get_llm_cache(chat_mdl.llm_name, d["content_with_weight"], "question", {"topn": topn})
@@ -357,7 +358,7 @@ async def build_chunks(task, progress_callback):
         else:
             all_tags = json.loads(all_tags)
 
-        chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
+        chat_mdl = parser_context(task["tenant_id"]).llm_bundle(LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
 
         docs_to_tag = []
         for d in docs:
@@ -437,7 +438,7 @@ async def embedding(docs, mdl, parser_config=None, callback=None):
     return tk_count, vector_size
 
 
-async def run_raptor(row, chat_mdl, embd_mdl, vector_size, callback=None):
+async def run_raptor(row, chat_mdl, embd_mdl, vector_size, callback=None, on_layer=None):
     chunks = []
     vctr_nm = "q_%d_vec"%vector_size
     for d in settings.retrievaler.chunk_list(row["doc_id"], row["tenant_id"], [str(row["kb_id"])],
@@ -450,10 +451,9 @@ async def run_raptor(row, chat_mdl, embd_mdl, vector_size, callback=None):
         embd_mdl,
         row["parser_config"]["raptor"]["prompt"],
         row["parser_config"]["raptor"]["max_token"],
-        row["parser_config"]["raptor"]["threshold"]
+        row["parser_config"]["raptor"]["threshold"],
+        row["parser_config"]["raptor"].get("cluster_method", "gmm")
     )
-    original_length = len(chunks)
-    chunks = await raptor(chunks, row["parser_config"]["raptor"]["random_seed"], callback)
     doc = {
         "doc_id": row["doc_id"],
         "kb_id": [str(row["kb_id"])],
@@ -464,20 +464,54 @@ async def run_raptor(row, chat_mdl, embd_mdl, vector_size, callback=None):
         doc[PAGERANK_FLD] = int(row["pagerank"])
     res = []
     tk_count = 0
-    for content, vctr in chunks[original_length:]:
-        d = copy.deepcopy(doc)
-        d["id"] = xxhash.xxh64((content + str(d["doc_id"])).encode("utf-8")).hexdigest()
-        d["create_time"] = str(datetime.now()).replace("T", " ")[:19]
-        d["create_timestamp_flt"] = datetime.now().timestamp()
-        d[vctr_nm] = vctr.tolist()
-        d["content_with_weight"] = content
-        d["content_ltks"] = rag_tokenizer.tokenize(content)
-        d["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(d["content_ltks"])
-        res.append(d)
-        tk_count += num_tokens_from_string(content)
+
+    async def build_layer(layer):
+        nonlocal tk_count
+        layer_res = []
+        for content, vctr in layer:
+            d = copy.deepcopy(doc)
+            d["id"] = xxhash.xxh64((content + str(d["doc_id"])).encode("utf-8")).hexdigest()
+            d["create_time"] = str(datetime.now()).replace("T", " ")[:19]
+            d["create_timestamp_flt"] = datetime.now().timestamp()
+            d[vctr_nm] = vctr.tolist()
+            d["content_with_weight"] = content
+            d["content_ltks"] = rag_tokenizer.tokenize(content)
+            d["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(d["content_ltks"])
+            layer_res.append(d)
+            tk_count += num_tokens_from_string(content)
+        res.extend(layer_res)
+        if on_layer:
+            return await on_layer(layer_res)
+
+    await raptor(chunks, row["parser_config"]["raptor"]["random_seed"], callback, build_layer)
     return res, tk_count
 
 
+async def insert_chunks(task, chunks, chunk_ids, progress_callback):
+    """
+    Index chunks and record their ids, appended to `chunk_ids`, on the task.
+    Returns False, after removing what was just indexed, if the task no longer exists.
+    """
+    es_bulk_size = 4
+    for b in range(0, len(chunks), es_bulk_size):
+        doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.insert(chunks[b:b + es_bulk_size], search.index_name(task["tenant_id"]), task["kb_id"]))
+        if b % 128 == 0:
+            progress_callback(prog=0.8 + 0.1 * (b + 1) / len(chunks), msg="")
+        if doc_store_result:
+            error_message = f"Insert chunk error: {doc_store_result}, please check log file and Elasticsearch/Infinity status!"
+            progress_callback(-1, msg=error_message)
+            raise Exception(error_message)
+        chunk_ids.extend([chunk["id"] for chunk in chunks[b:b + es_bulk_size]])
+        chunk_ids_str = " ".join(chunk_ids)
+        try:
+            TaskService.update_chunk_ids(task["id"], chunk_ids_str)
+        except DoesNotExist:
+            logging.warning(f"do_handle_task update_chunk_ids failed since task {task['id']} is unknown.")
+            await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"id": chunk_ids}, search.index_name(task["tenant_id"]), task["kb_id"]))
+            return False
+    return True
+
+
 async def do_handle_task(task):
     task_id = task["id"]
     task_from_page = task["from_page"]
@@ -509,7 +543,7 @@ async def do_handle_task(task):
 
     try:
         # bind embedding model
-        embedding_model = LLMBundle(task_tenant_id, LLMType.EMBEDDING, llm_name=task_embedding_id, lang=task_language)
+        embedding_model = parser_context(task_tenant_id).llm_bundle(LLMType.EMBEDDING, llm_name=task_embedding_id, lang=task_language)
         vts, _ = embedding_model.encode(["ok"])
         vector_size = len(vts[0])
     except Exception as e:
@@ -524,8 +558,18 @@ async def do_handle_task(task):
     if task.get("task_type", "") == "raptor":
         # bind LLM for raptor
         chat_model = LLMBundle(task_tenant_id, LLMType.CHAT, llm_name=task_llm_id, lang=task_language)
-        # run RAPTOR
-        chunks, token_count = await run_raptor(task, chat_model, embedding_model, vector_size, progress_callback)
+        # run RAPTOR, summaries are indexed layer by layer as soon as they are embedded
+        raptor_chunk_ids = []
+        task_alive = True
+
+        async def index_layer(layer):
+            nonlocal task_alive
+            task_alive = await insert_chunks(task, layer, raptor_chunk_ids, progress_callback)
+            return task_alive
+
+        chunks, token_count = await run_raptor(task, chat_model, embedding_model, vector_size, progress_callback, index_layer)
+        if not task_alive:
+            return
     # Either using graphrag or Standard chunking methods
     elif task.get("task_type", "") == "graphrag":
         global task_limiter
@@ -568,23 +612,8 @@ async def do_handle_task(task):
 
     chunk_count = len(set([chunk["id"] for chunk in chunks]))
     start_ts = timer()
-    doc_store_result = ""
-    es_bulk_size = 4
-    for b in range(0, len(chunks), es_bulk_size):
-        doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.insert(chunks[b:b + es_bulk_size], search.index_name(task_tenant_id), task_dataset_id))
-        if b % 128 == 0:
-            progress_callback(prog=0.8 + 0.1 * (b + 1) / len(chunks), msg="")
-        if doc_store_result:
-            error_message = f"Insert chunk error: {doc_store_result}, please check log file and Elasticsearch/Infinity status!"
-            progress_callback(-1, msg=error_message)
-            raise Exception(error_message)
-        chunk_ids = [chunk["id"] for chunk in chunks[:b + es_bulk_size]]
-        chunk_ids_str = " ".join(chunk_ids)
-        try:
-            TaskService.update_chunk_ids(task["id"], chunk_ids_str)
-        except DoesNotExist:
-            logging.warning(f"do_handle_task update_chunk_ids failed since task {task['id']} is unknown.")
-            doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"id": chunk_ids}, search.index_name(task_tenant_id), task_dataset_id))
+    if task.get("task_type", "") != "raptor":
+        if not await insert_chunks(task, chunks, [], progress_callback):
             return
     logging.info("Indexing doc({}), page({}-{}), chunks({}), elapsed: {:.2f}".format(task_document_name, task_from_page,
                                                                                      task_to_page, len(chunks),
@@ -0,0 +1,230 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import logging
+import struct
+import time
+
+import pytest
+
+from deepdoc.parser.doc_parser import RAGFlowDocParser
+
+ENDOFCHAIN = 0xFFFFFFFE
+FREESECT = 0xFFFFFFFF
+FATSECT = 0xFFFFFFFD
+NOSTREAM = 0xFFFFFFFF
+MINI_CUTOFF = 4096
+
+# Where the generated WordDocument stream keeps its text, after the FIB.
+TEXT_OFFSET = 1024
+RUNS_PER_FKP = 24
+
+
+def _compound_file(streams, sector_shift=9):
+    """An OLE2 compound file holding `streams` ({name: bytes}) at its top level, without a mini stream."""
+    size = 1 << sector_shift
+    sectors, starts, lengths = [], {}, {}
+    for name, data in streams.items():
+        lengths[name] = max(len(data), MINI_CUTOFF)
+        data = data.ljust(-(-lengths[name] // size) * size, b"\0")
+        starts[name] = len(sectors)
+        sectors.extend(data[i:i + size] for i in range(0, len(data), size))
+
+    def entry(name, kind, right, child, start, length):
+        raw = (name + "\0").encode("utf-16-le")
+        return (raw.ljust(64, b"\0") + struct.pack("<HBB", len(raw), kind, 1)
+                + struct.pack("<III", NOSTREAM, right, child) + b"\0" * 36 + struct.pack("<II", start, length) + b"\0" * 4)
+
+    names = list(streams)
+    directory = entry("Root Entry", 5, NOSTREAM, 1, ENDOFCHAIN, 0)
+    for i, name in enumerate(names):
+        directory += entry(name, 2, i + 2 if i + 1 < len(names) else NOSTREAM, NOSTREAM, starts[name], lengths[name])
+    directory = directory.ljust(-(-len(directory) // size) * size, b"\0")
+    first_dir = len(sectors)
+    sectors.extend(directory[i:i + size] for i in range(0, len(directory), size))
+
+    n_fat = 1
+    while (len(sectors) + n_fat) * 4 > n_fat * size:
+        n_fat += 1
+    first_fat = len(sectors)
+    fat = []
+    for first, last in [(starts[n], starts[n] + -(-lengths[n] // size)) for n in names] + [(first_dir, first_fat)]:
+        fat += list(range(first + 1, last)) + [ENDOFCHAIN]
+    fat += [FATSECT] * n_fat
+    fat += [FREESECT] * (n_fat * size // 4 - len(fat))
+    fat = struct.pack(f"<{len(fat)}I", *fat)
+    sectors.extend(fat[i:i + size] for i in range(0, len(fat), size))
+
+    header = (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + b"\0" * 16
+              + struct.pack("<HHHHH", 0x3E, 3 if sector_shift == 9 else 4, 0xFFFE, sector_shift, 6) + b"\0" * 6
+              + struct.pack("<IIII", 0, n_fat, first_dir, 0)
+              + struct.pack("<IIIII", MINI_CUTOFF, ENDOFCHAIN, 0, ENDOFCHAIN, 0)
+              + struct.pack("<109I", *(list(range(first_fat, first_fat + n_fat)) + [FREESECT] * (109 - n_fat))))
+    return header.ljust(size, b"\0") + b"".join(sectors)
+
+
+def _papx(in_table, ttp):
+    grpprl = struct.pack("<H", 0)  # istd
+    if in_table:
+        grpprl += struct.pack("<HB", 0x2416, 1)
+    if ttp:
+        grpprl += struct.pack("<HB", 0x2417, 1)
+        grpprl += struct.pack("<HH", 0xD608, 5) + b"\x01\x02\x03\x04"
+    if len(grpprl) % 2 == 0:
+        grpprl += b"\0"
+    return bytes([(len(grpprl) + 1) // 2]) + grpprl
+
+
+def _fkp(fcs, props):
+    """A PAPX FKP page for the runs between consecutive `fcs`, sharing the PAPX of equal properties."""
+    page = bytearray(512)
+    crun = len(props)
+    struct.pack_into(f"<{crun + 1}I", page, 0, *fcs)
+    offsets, end = {}, 511
+    for r, prop in enumerate(props):
+        if prop not in offsets:
+            blob = _papx(*prop)
+            end -= len(blob)
+            end -= end % 2
+            page[end:end + len(blob)] = blob
+            offsets[prop] = end // 2
+        page[4 * (crun + 1) + 13 * r] = offsets[prop]
+    assert 4 * (crun + 1) + 13 * crun <= end
+    page[511] = crun
+    return bytes(page)
+
+
+def make_doc(paragraphs, compressed=False, sector_shift=9, nfib=0x00C1, encrypted=False):
+    """
+    A Word 97-2003 file whose main text is `paragraphs`, a list of (text, in table, row end). Each
+    text carries its own paragraph mark: "\\r", or "\\x07" for the end of a cell or of a table row.
+    """
+    text = "".join(t for t, _, _ in paragraphs)
+    width = 1 if compressed else 2
+    encoded = text.encode("cp1252") if compressed else text.encode("utf-16-le")
+
+    fcs = [TEXT_OFFSET]
+    for t, _, _ in paragraphs:
+        fcs.append(fcs[-1] + len(t) * width)
+    first_page = -(-(TEXT_OFFSET + len(encoded)) // 512)
+    pages, bte_fcs = [], []
+    for i in range(0, len(paragraphs), RUNS_PER_FKP):
+        props = [(it, ttp) for _, it, ttp in paragraphs[i:i + RUNS_PER_FKP]]
+        pages.append(_fkp(fcs[i:i + len(props) + 1], props))
+        bte_fcs.append(fcs[i])
+    bte_fcs.append(fcs[-1])
+
+    word = bytearray(first_page * 512)
+    struct.pack_into("<HH", word, 0, 0xA5EC, nfib)
+    struct.pack_into("<H", word, 0x0A, 0x0200 | (0x0100 if encrypted else 0))
+    struct.pack_into("<I", word, 76, len(text))
+    word[TEXT_OFFSET:TEXT_OFFSET + len(encoded)] = encoded
+    word += b"".join(pages)
+
+    plcbte = struct.pack(f"<{len(bte_fcs)}I", *bte_fcs) + struct.pack(f"<{len(pages)}I", *range(first_page, first_page + len(pages)))
+    fc = (TEXT_OFFSET * 2) | 0x40000000 if compressed else TEXT_OFFSET
+    pcd = struct.pack("<HIH", 0, fc, 0)
+    clx = b"\x01" + struct.pack("<H", 2) + b"\0\0" + b"\x02" + struct.pack("<I", 12 + len(pcd)) + struct.pack("<II", 0, len(text)) + pcd
+    table = bytearray(64)
+    struct.pack_into("<II", word, 0x0102, len(table), len(plcbte))
+    table += plcbte
+    struct.pack_into("<II", word, 0x01A2, len(table), len(clx))
+    table += clx
+    return _compound_file({"WordDocument": bytes(word), "1Table": bytes(table)}, sector_shift)
+
+
+def paragraph(text):
+    return text + "\r", False, False
+
+
+def table(rows):
+    """The paragraphs of a table; a cell may hold several paragraphs separated by "\\n"."""
+    out = []
+    for row in rows:
+        for cell in row:
+            lines = cell.split("\n")
+            out.extend((line + "\r", True, False) for line in lines[:-1])
+            out.append((lines[-1] + "\x07", True, False))
+        out.append(("\x07", True, True))
+    return out
+
+
+SAMPLE = [
+    paragraph("Quarterly report"),
+    paragraph("Revenue grew in every region."),
+    *table([["Region", "Q1"], ["North <east>", "1 & 2"], ["South", "line one\nline two"]]),
+    paragraph("See \x13 HYPERLINK \"http://example.com\" \x14the website\x15 for details."),
+    paragraph("Page \x13 PAGE \x15of the report."),
+    paragraph("Nested \x13 IF \x13 PAGE \x15 = 1 \x14first\x15 page."),
+    paragraph("Line\x0bbreak, non\x1ebreaking, op\x1ftional\xa0space."),
+]
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+@pytest.mark.parametrize("sector_shift", [9, 12])
+def test_paragraphs_fields_and_tables(compressed, sector_shift):
+    sections, tables = RAGFlowDocParser()("sample.doc", make_doc(SAMPLE, compressed, sector_shift))
+    assert sections == [
+        "Quarterly report",
+        "Revenue grew in every region.",
+        "See the website for details.",
+        "Page of the report.",
+        "Nested first page.",
+        "Line\nbreak, non-breaking, optional space.",
+    ]
+    assert tables == [
+        "<table><tr><td>Region</td><td>Q1</td></tr>"
+        "<tr><td>North &lt;east&gt;</td><td>1 &amp; 2</td></tr>"
+        "<tr><td>South</td><td>line one\nline two</td></tr></table>"
+    ]
+
+
+def test_table_at_end_of_document():
+    sections, tables = RAGFlowDocParser()("end.doc", make_doc([paragraph("Intro"), *table([["a", "b"]])]))
+    assert sections == ["Intro"]
+    assert tables == ["<table><tr><td>a</td><td>b</td></tr></table>"]
+
+
+@pytest.mark.parametrize("kwargs", [{"encrypted": True}, {"nfib": 0x0065}])
+def test_unsupported_documents_raise_value_error(kwargs):
+    # rag/app/naive.py hands these to tika.
+    with pytest.raises(ValueError):
+        RAGFlowDocParser()("old.doc", make_doc(SAMPLE, **kwargs))
+
+
+def test_not_a_compound_file_raises_value_error():
+    with pytest.raises(ValueError):
+        RAGFlowDocParser()("fake.doc", b"{\\rtf1 not a word document}")
+
+
+def test_benchmark_generated_documents():
+    docs = []
+    for k, n in enumerate((100, 1000, 5000)):
+        paragraphs = []
+        for i in range(n):
+            paragraphs.append(paragraph(f"Paragraph {i}: " + "lorem ipsum dolor sit amet " * 6))
+            if i % 50 == 49:
+                paragraphs.extend(table([[f"r{r}c{c}" for c in range(4)] for r in range(5)]))
+        docs.append((n, make_doc(paragraphs, sector_shift=12 if k % 2 else 9)))
+
+    for n, binary in docs:
+        start = time.perf_counter()
+        sections, tables = RAGFlowDocParser()("bench.doc", binary)
+        elapsed = time.perf_counter() - start
+        logging.info(f"{n} paragraphs, {len(binary) / 2 ** 20:.1f} MB: {elapsed:.3f}s")
+        assert len(sections) == n
+        assert len(tables) == n // 50
+        # Far below the round trip to a tika server.
+        assert elapsed < max(1.0, n / 1000)
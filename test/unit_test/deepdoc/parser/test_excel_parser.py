@@ -0,0 +1,76 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import re
+import zipfile
+from io import BytesIO
+
+import pytest
+
+openpyxl = pytest.importorskip("openpyxl")
+pytest.importorskip("pandas")
+
+from deepdoc.parser.excel_parser import RAGFlowExcelParser  # noqa: E402
+
+ROWS = 50
+
+
+@pytest.fixture(scope="module")
+def a1_workbook():
+    """A workbook of ROWS rows by 3 columns whose sheet records its dimension as A1, as some writers do."""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Data"
+    ws.append(["question", "answer", "id"])
+    for i in range(1, ROWS):
+        ws.append([f"q{i}", f"a{i}", i])
+    buf = BytesIO()
+    wb.save(buf)
+
+    out = BytesIO()
+    with zipfile.ZipFile(BytesIO(buf.getvalue())) as zin, zipfile.ZipFile(out, "w") as zout:
+        for item in zin.infolist():
+            data = zin.read(item.filename)
+            if item.filename.startswith("xl/worksheets/"):
+                data = re.sub(rb'<dimension ref="[^"]*"', b'<dimension ref="A1"', data)
+            zout.writestr(item, data)
+    return out.getvalue()
+
+
+def test_a1_dimension_is_not_trusted(a1_workbook):
+    wb = RAGFlowExcelParser._load_excel_to_workbook(BytesIO(a1_workbook), read_only=True)
+    ws = wb["Data"]
+    assert RAGFlowExcelParser._sheet_rows(ws) == ROWS
+    rows = list(ws.iter_rows(values_only=True))
+    assert len(rows) == ROWS
+    assert rows[0] == ("question", "answer", "id")
+    assert rows[-1] == (f"q{ROWS - 1}", f"a{ROWS - 1}", ROWS - 1)
+    wb.close()
+
+
+def test_row_number(a1_workbook):
+    assert RAGFlowExcelParser.row_number("a1.xlsx", a1_workbook) == ROWS
+
+
+def test_table_reads_every_row_and_column(a1_workbook):
+    from rag.app.table import Excel
+
+    dfs = Excel()("a1.xlsx", binary=a1_workbook, callback=lambda *args, **kwargs: None)
+    assert len(dfs) == 1
+    assert list(dfs[0].columns) == ["question", "answer", "id"]
+    assert len(dfs[0]) == ROWS - 1
+
+    dfs = Excel()("a1.xlsx", binary=a1_workbook, from_page=40, to_page=45, callback=lambda *args, **kwargs: None)
+    assert list(dfs[0]["question"]) == [f"q{i}" for i in range(41, 46)]
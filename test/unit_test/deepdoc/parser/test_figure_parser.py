@@ -0,0 +1,124 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import threading
+import time
+import uuid
+from io import BytesIO
+
+import pytest
+
+pytest.importorskip("xxhash")
+Image = pytest.importorskip("PIL.Image")
+
+from deepdoc.parser import figure_parser  # noqa: E402
+from deepdoc.parser.figure_parser import VisionFigureParser  # noqa: E402
+
+CAP = 2
+
+
+class FakeVisionModel:
+    """Names each figure by its red level after `delay` seconds, or hangs until `gate` is set."""
+
+    def __init__(self, delay=0.0, gate=None):
+        self.delay = delay
+        self.gate = gate
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def describe_with_prompt(self, binary, prompt=None):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            if self.gate is not None:
+                self.gate.wait()
+            time.sleep(self.delay)
+            red = Image.open(BytesIO(binary)).convert("RGB").getpixel((4, 4))[0]
+            return f"figure {round(red / 40)}"
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def _figures(*ids):
+    return [(Image.new("RGB", (8, 8), (i * 40, 0, 0)), [f"caption {n}"]) for n, i in enumerate(ids)]
+
+
+@pytest.fixture
+def tenant_id(monkeypatch):
+    monkeypatch.setattr(figure_parser, "MAX_CONCURRENT_FIGURE_DESCRIPTIONS", CAP)
+    return uuid.uuid4().hex
+
+
+def test_concurrent_under_tenant_cap(tenant_id):
+    model = FakeVisionModel(delay=0.2)
+    parser = VisionFigureParser(vision_model=model, figures_data=_figures(1, 2, 3, 4, 5, 6), tenant_id=tenant_id)
+    start = time.time()
+    parser()
+    elapsed = time.time() - start
+
+    assert model.calls == 6
+    assert model.peak == CAP
+    # Serially this would take 6 * 0.2s.
+    assert elapsed < 1.0
+
+
+def test_identical_figures_described_once_in_order(tenant_id):
+    model = FakeVisionModel(delay=0.05)
+    figures = _figures(3, 1, 3, 2, 1)
+    assembled = VisionFigureParser(vision_model=model, figures_data=figures, tenant_id=tenant_id)()
+
+    assert model.calls == 3
+    assert [desc for (_, desc), in assembled] == [f"\nfigure {i}caption {n}" for n, i in enumerate([3, 1, 3, 2, 1])]
+
+
+def test_timed_out_figure_does_not_block_tenant(tenant_id, monkeypatch):
+    monkeypatch.setattr(figure_parser, "FIGURE_DESCRIPTION_TIMEOUT", 0.3)
+    gate = threading.Event()
+    messages = []
+    try:
+        hung = FakeVisionModel(gate=gate)
+        start = time.time()
+        assembled = VisionFigureParser(vision_model=hung, figures_data=_figures(1, 2, 3), tenant_id=tenant_id)(
+            callback=lambda prog, msg: messages.append(msg))
+        assert time.time() - start < 3
+        assert [desc for (_, desc), in assembled] == [["caption 0"], ["caption 1"], ["caption 2"]]
+        assert len(messages) == 3 and all("timed out" in m for m in messages)
+
+        # The abandoned calls are still hanging, yet the next parse of this tenant gets its permits.
+        fast = FakeVisionModel()
+        assembled = VisionFigureParser(vision_model=fast, figures_data=_figures(4, 5), tenant_id=tenant_id)()
+        assert [desc for (_, desc), in assembled] == ["\nfigure 4caption 0", "\nfigure 5caption 1"]
+    finally:
+        gate.set()
+
+
+def test_wait_for_permit_is_bounded(tenant_id, monkeypatch):
+    monkeypatch.setattr(figure_parser, "FIGURE_DESCRIPTION_TIMEOUT", 0.2)
+    limiter = figure_parser._tenant_limiter(tenant_id)
+    for _ in range(CAP):
+        limiter.acquire()
+    try:
+        model = FakeVisionModel()
+        assembled = VisionFigureParser(vision_model=model, figures_data=_figures(1, 2), tenant_id=tenant_id)()
+        assert model.calls == 0
+        assert [desc for (_, desc), in assembled] == [["caption 0"], ["caption 1"]]
+    finally:
+        for _ in range(CAP):
+            limiter.release()
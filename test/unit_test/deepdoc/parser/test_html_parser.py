@@ -0,0 +1,110 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import logging
+import time
+
+from deepdoc.parser.html_parser import RAGFlowHtmlParser
+
+
+def _sections(html, chunk_token_num=128):
+    return RAGFlowHtmlParser.parser_sections(html, chunk_token_num)
+
+
+def test_outermost_tables_are_isolated():
+    html = """<html><head><title>Report</title><script>var x = "<table>";</script></head><body>
+    <p>before</p>
+    <table border=1><caption>Sales</caption>
+      <tr><th colspan="2">Region &amp; year</th></tr>
+      <tr><td><div>North</div></td><td><table><tr><td>nested</td></tr></table></td></tr>
+    </table>
+    <p>after</p>
+    </body></html>"""
+    sections, tables = _sections(html)
+    assert sections == ["Report", "before", "after"]
+    assert len(tables) == 1
+    table = tables[0]
+    assert table.startswith("<table><caption>Sales</caption>") and table.endswith("</table>")
+    assert "<th colspan='2'>Region &amp; year</th>" in table
+    assert table.count("<table>") == 2 and "nested" in table and "North" in table
+
+
+def test_unclosed_table_is_closed():
+    sections, tables = _sections("<p>text</p><table><tr><td>a</td><td>b")
+    assert sections == ["text"]
+    assert tables == ["<table><tr><td>a</td><td>b</table>"]
+
+
+def test_skipped_elements_and_whitespace():
+    html = "<nav>menu</nav><p>one\n   two</p><footer>legal</footer><style>p {}</style><div>three<br>four</div>"
+    sections, _ = _sections(html)
+    assert sections == ["one two", "three", "four"]
+
+
+def test_pre_keeps_indentation():
+    sections, _ = _sections("<p>code:</p><pre>\n    if x:\n        return 1\n</pre>")
+    assert sections == ["code:", "    if x:\n        return 1"]
+
+
+def test_heading_groups_following_blocks():
+    html = "<h1>Intro</h1><p>first</p><p>second</p><h2>Next</h2><p>third</p><p>alone</p>"
+    sections, _ = _sections(html, chunk_token_num=128)
+    assert sections == ["Intro\nfirst\nsecond", "Next\nthird\nalone"]
+
+
+def test_heading_group_stops_at_chunk_size():
+    para = "word " * 20
+    html = "<h1>Intro</h1>" + f"<p>{para}</p>" * 4
+    sections, _ = _sections(html, chunk_token_num=16)
+    assert sections[0].startswith("Intro\n")
+    assert len(sections) > 1
+    assert sum(s.count("word") for s in sections) == 80
+
+
+def test_oversized_block_is_split():
+    text = " ".join(f"w{i}" for i in range(2000))
+    sections, _ = _sections(f"<h1>Big</h1><p>{text}</p><p>tail</p>", chunk_token_num=32)
+    assert sections[0] == "Big"
+    pieces = sections[1:-1]
+    assert len(pieces) >= 2
+    assert "".join(pieces) == text
+    assert max(len(p) for p in pieces) - min(len(p) for p in pieces) <= len(text) // len(pieces)
+    assert sections[-1] == "tail"
+
+
+def _document(n_sections):
+    parts = ["<html><head><title>Generated</title></head><body>"]
+    for i in range(n_sections):
+        parts.append(f"<h2>Section {i}</h2><p>{'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 8}</p>")
+        parts.append(f"<ul><li>item {i}</li><li>item {i + 1}</li></ul>")
+        if i % 20 == 0:
+            parts.append("<table>" + "<tr><td>a</td><td>b</td></tr>" * 10 + "</table>")
+    return "".join(parts) + "</body></html>"
+
+
+def test_benchmark_multi_megabyte_documents():
+    timings = []
+    for n in (1000, 4000):
+        html = _document(n)
+        start = time.perf_counter()
+        sections, tables = _sections(html)
+        elapsed = time.perf_counter() - start
+        logging.info(f"{len(html) / 2 ** 20:.1f} MB of HTML: {len(sections)} sections, {len(tables)} tables in {elapsed:.2f}s")
+        assert len(tables) == n // 20
+        assert sections[0] == "Generated"
+        timings.append(elapsed)
+    assert len(html) > 2 ** 21
+    # One pass over the markup: four times the document takes about four times as long.
+    assert timings[1] < 8 * timings[0] + 0.5
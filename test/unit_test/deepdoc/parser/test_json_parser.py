@@ -0,0 +1,84 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+resource = pytest.importorskip("resource")
+
+from deepdoc.parser.json_parser import RAGFlowJsonParser  # noqa: E402
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../.."))
+
+# Runs in a fresh interpreter, so that ru_maxrss only covers this parse. Prints the peak RSS
+# growth in bytes, taken after the file is read, and the number of chunks.
+PARSE = """
+import resource, sys
+from deepdoc.parser.json_parser import RAGFlowJsonParser
+with open(sys.argv[1], "rb") as f:
+    binary = f.read()
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+chunks = RAGFlowJsonParser(512)(binary)
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print((after - before) * (1 if sys.platform == "darwin" else 1024), len(chunks))
+"""
+
+
+def _records(n):
+    for i in range(n):
+        yield {"id": i, "title": f"record {i}", "tags": ["a", "b", str(i % 7)],
+               "body": {"text": "lorem ipsum " * 8, "score": i / 3, "ok": i % 2 == 0}}
+
+
+def test_chunks_keep_paths():
+    doc = {"records": list(_records(50))}
+    chunks = [json.loads(c) for c in RAGFlowJsonParser(256)(json.dumps(doc).encode("utf-8"))]
+    assert len(chunks) > 1
+    assert all(len(json.dumps(c, ensure_ascii=False)) <= 2 * 256 for c in chunks)
+    merged = {}
+    for c in chunks:
+        for k, v in c["records"].items():
+            merged.setdefault(k, {}).update(v)
+    assert merged["49"]["title"] == "record 49"
+    assert merged["7"]["tags"] == {"0": "a", "1": "b", "2": "0"}
+
+
+def test_large_file_rss_is_bounded(tmp_path):
+    path = tmp_path / "large.json"
+    with open(path, "w") as f:
+        f.write('{"records": [')
+        for i, r in enumerate(_records(200000)):
+            f.write(("," if i else "") + json.dumps(r))
+        f.write("]}")
+    size = os.path.getsize(path)
+    assert size > 40 * 2 ** 20
+
+    out = subprocess.run([sys.executable, "-c", PARSE, str(path)], cwd=ROOT, capture_output=True, text=True,
+                         env=dict(os.environ, PYTHONPATH=ROOT), check=True).stdout.split()
+    growth, n_chunks = int(out[-2]), int(out[-1])
+    assert n_chunks > 1000
+    # The text of the file and the chunks made from it, but not a tree of Python objects, which
+    # json.loads would build at several times the size of the file.
+    assert growth < 4 * size, f"peak RSS grew by {growth / 2 ** 20:.0f} MB for a {size / 2 ** 20:.0f} MB file"
+
+
+@pytest.mark.parametrize("binary", [b'{"a":1', b'{"a":1,', b'{"a":', b'{"a"', b"{", b"[1,2", b'{"a":{"b":[1', b'{"a":1}\n{"b":'])
+def test_truncated_input_raises_decode_error(binary):
+    with pytest.raises(json.JSONDecodeError):
+        RAGFlowJsonParser(256)(binary)
@@ -0,0 +1,102 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import logging
+import time
+
+from deepdoc.parser.markdown_parser import RAGFlowMarkdownParser
+
+
+def _blocks(text):
+    return list(RAGFlowMarkdownParser().iter_blocks(text))
+
+
+def test_bordered_table():
+    text = "# Title\nintro\n| a | b |\n|---|:-:|\n| 1 | 2 |\n| 3 | 4 |\nafter"
+    assert _blocks(text) == [
+        ("text", "# Title"),
+        ("text", "intro"),
+        ("table", "| a | b |\n|---|:-:|\n| 1 | 2 |\n| 3 | 4 |\n"),
+        ("text", "after"),
+    ]
+
+
+def test_borderless_table():
+    text = "intro\na | b\n--- | ---\n1 | 2\n\nafter"
+    assert _blocks(text) == [
+        ("text", "intro"),
+        ("table", "a | b\n--- | ---\n1 | 2\n"),
+        ("text", ""),
+        ("text", "after"),
+    ]
+
+
+def test_pipes_without_delimiter_row_are_text():
+    text = "a | b\n1 | 2\n| x | y |\n| z | w |"
+    assert all(kind == "text" for kind, _ in _blocks(text))
+
+
+def test_html_table():
+    text = "before\n<table>\n<tr><td>a</td></tr>\n</table>\nafter"
+    assert _blocks(text) == [
+        ("text", "before"),
+        ("table", "<table>\n<tr><td>a</td></tr>\n</table>"),
+        ("text", "after"),
+    ]
+
+
+def test_html_table_wrapped_in_html_and_body():
+    table = "<html><body><table><tr><td>a</td><td>b</td></tr></table></body></html>"
+    assert _blocks(f"before\n{table}\nafter") == [("text", "before"), ("table", table), ("text", "after")]
+
+
+def test_html_table_followed_by_text_on_its_line():
+    # The table does not end a line: it is left in the text.
+    text = "<table><tr><td>a</td></tr></table> and more\nnext"
+    assert _blocks(text) == [("text", "<table><tr><td>a</td></tr></table> and more"), ("text", "next")]
+
+
+def test_extract_tables_and_remainder():
+    text = "intro\n| a | b |\n|---|---|\n| 1 | 2 |\n<table><tr><td>x</td></tr></table>\nend"
+    remainder, tables = RAGFlowMarkdownParser().extract_tables_and_remainder(text)
+    assert remainder == "intro\nend"
+    assert tables == ["| a | b |\n|---|---|\n| 1 | 2 |\n", "<table><tr><td>x</td></tr></table>"]
+
+
+def _document(n_sections):
+    lines = []
+    for i in range(n_sections):
+        lines.append(f"## Section {i}")
+        lines.append("Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 8)
+        lines.append("| id | name |\n|---|---|\n" + "".join(f"| {r} | row {r} |\n" for r in range(5)))
+        if i % 10 == 0:
+            lines.append("<table><tr><td>a</td><td>b</td></tr></table>")
+    return "\n".join(lines)
+
+
+def test_benchmark_multi_megabyte_documents():
+    timings = []
+    for n in (1500, 6000):
+        text = _document(n)
+        start = time.perf_counter()
+        blocks = _blocks(text)
+        elapsed = time.perf_counter() - start
+        n_tables = sum(kind == "table" for kind, _ in blocks)
+        logging.info(f"{len(text) / 2 ** 20:.1f} MB of Markdown: {len(blocks)} blocks, {n_tables} tables in {elapsed:.2f}s")
+        assert n_tables == n + n // 10
+        timings.append(elapsed)
+    assert len(text) > 2 ** 21
+    # One pass over the lines: four times the document takes about four times as long.
+    assert timings[1] < 8 * timings[0] + 0.5
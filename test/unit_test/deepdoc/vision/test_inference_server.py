@@ -0,0 +1,96 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import os
+import stat
+import threading
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("cv2")
+
+from deepdoc.vision import inference_server  # noqa: E402
+from deepdoc.vision.inference_client import InferenceClient, RemoteModel  # noqa: E402
+from deepdoc.vision.layout_recognizer import LayoutRecognizer4YOLOv10  # noqa: E402
+from deepdoc.vision.recognizer import Recognizer  # noqa: E402
+from deepdoc.vision.table_structure_recognizer import TableStructureRecognizer  # noqa: E402
+
+BOX = {"type": "table row", "score": 0.9, "bbox": [0, 0, 10, 5]}
+
+
+def _instance(cls, remote, **attrs):
+    # Skips the model loading of __init__: the models are replaced by fake_call below.
+    inst = cls.__new__(cls)
+    inst.label_list = cls.labels
+    inst.remote = remote
+    for k, v in attrs.items():
+        setattr(inst, k, v)
+    return inst
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    calls = []
+    base_call = Recognizer.__call__
+
+    def fake_call(self, image_list, thr=0.7, batch_size=16):
+        if self.remote:
+            return base_call(self, image_list, thr, batch_size)
+        calls.append((type(self), len(image_list), thr, batch_size))
+        return [[dict(BOX)] for _ in image_list]
+
+    monkeypatch.setattr(Recognizer, "__call__", fake_call)
+    address = str(tmp_path / "deepdoc.sock")
+    srv = inference_server.InferenceServer(address)
+    for cls, task_name, attrs in [(LayoutRecognizer4YOLOv10, "layout", {"garbage_layouts": [], "client": None}),
+                                  (TableStructureRecognizer, "tsr", {})]:
+        srv.recognizers[(cls.__module__, cls.__qualname__, task_name)] = _instance(cls, None, **attrs)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    for _ in range(100):
+        if os.path.exists(address):
+            break
+        time.sleep(0.05)
+    yield address, calls
+
+
+def _remote(client, cls, task_name):
+    return RemoteModel(client, "predict", cls.__module__, cls.__qualname__, task_name)
+
+
+def test_socket_is_private(server):
+    address, _ = server
+    assert stat.S_IMODE(os.stat(address).st_mode) & 0o077 == 0
+
+
+def test_layout_and_tsr_round_trip(server):
+    address, calls = server
+    client = InferenceClient(address)
+    images = [np.zeros((20, 20, 3), dtype=np.uint8) for _ in range(2)]
+
+    layout = _instance(LayoutRecognizer4YOLOv10, _remote(client, LayoutRecognizer4YOLOv10, "layout"),
+                       garbage_layouts=[], client=None)
+    ocr_res, page_layout = layout(images, [[], []], scale_factor=1, thr=0.3, batch_size=8)
+    assert len(ocr_res) == 0
+    assert [[lt["type"] for lt in lts] for lts in page_layout] == [["table row"], ["table row"]]
+
+    tsr = _instance(TableStructureRecognizer, _remote(client, TableStructureRecognizer, "tsr"))
+    tbls = tsr(images[:1], thr=0.25)
+    assert len(tbls) == 1
+    assert tbls[0][0]["label"] == "table row"
+
+    assert calls == [(LayoutRecognizer4YOLOv10, 2, 0.3, 8), (TableStructureRecognizer, 1, 0.25, 16)]
@@ -0,0 +1,114 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import copy
+import random
+
+import pytest
+
+from deepdoc.vision.recognizer import BoxIndex, Recognizer
+
+
+def _layouts_cleanup_linear(boxes, layouts, far=2, thr=0.7):
+    """Recognizer.layouts_cleanup as it was before BoxIndex, scanning every box."""
+    def notOverlapped(a, b):
+        return any([a["x1"] < b["x0"],
+                    a["x0"] > b["x1"],
+                    a["bottom"] < b["top"],
+                    a["top"] > b["bottom"]])
+
+    i = 0
+    while i + 1 < len(layouts):
+        j = i + 1
+        while j < min(i + far, len(layouts)) \
+                and (layouts[i].get("type", "") != layouts[j].get("type", "")
+                     or notOverlapped(layouts[i], layouts[j])):
+            j += 1
+        if j >= min(i + far, len(layouts)):
+            i += 1
+            continue
+        if Recognizer.overlapped_area(layouts[i], layouts[j]) < thr \
+                and Recognizer.overlapped_area(layouts[j], layouts[i]) < thr:
+            i += 1
+            continue
+
+        if layouts[i].get("score") and layouts[j].get("score"):
+            if layouts[i]["score"] > layouts[j]["score"]:
+                layouts.pop(j)
+            else:
+                layouts.pop(i)
+            continue
+
+        area_i, area_i_1 = 0, 0
+        for b in boxes:
+            if not notOverlapped(b, layouts[i]):
+                area_i += Recognizer.overlapped_area(b, layouts[i], False)
+            if not notOverlapped(b, layouts[j]):
+                area_i_1 += Recognizer.overlapped_area(b, layouts[j], False)
+
+        if area_i > area_i_1:
+            layouts.pop(j)
+        else:
+            layouts.pop(i)
+
+    return layouts
+
+
+def _box(rnd, height=(5, 20)):
+    """A random box, on integer coordinates half of the time so that boxes touch exactly, and
+    sometimes of zero width or height."""
+    if rnd.random() < 0.5:
+        x, y = rnd.randint(0, 60) * 10, rnd.randint(0, 80) * 10
+        w, h = rnd.choice([0, 10, 20, 40]), rnd.choice([0, height[0], height[1]])
+    else:
+        x, y = rnd.uniform(0, 600), rnd.uniform(0, 800)
+        w, h = rnd.uniform(0, 80), rnd.uniform(*height)
+        if rnd.random() < 0.05:
+            w = 0
+        if rnd.random() < 0.05:
+            h = 0
+    return {"x0": x, "x1": x + w, "top": y, "bottom": y + h}
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_indexed_searches_match_linear_scan(seed):
+    rnd = random.Random(seed)
+    for _ in range(20):
+        boxes = Recognizer.sort_Y_firstly([_box(rnd) for _ in range(rnd.choice([0, 1, 2, rnd.randint(3, 150)]))], 3)
+        index = BoxIndex(boxes)
+        for _ in range(30):
+            box = _box(rnd, height=(0, 12))
+            assert Recognizer.find_overlapped(box, boxes, index=index) == Recognizer.find_overlapped(box, boxes)
+            for thr in (0.0, 0.3, 0.7):
+                assert Recognizer.find_overlapped_with_threashold(box, boxes, thr, index=index) == \
+                    Recognizer.find_overlapped_with_threashold(box, boxes, thr)
+
+        layouts = Recognizer.sort_Y_firstly([dict(_box(rnd, height=(10, 200)), type=rnd.choice("ab"))
+                                             for _ in range(rnd.randint(0, 30))], 5)
+        for lt in layouts:
+            if rnd.random() < 0.3:
+                lt["score"] = rnd.random()
+        for far, thr in ((2, 0.7), (5, 0.3)):
+            assert Recognizer.layouts_cleanup(boxes, copy.deepcopy(layouts), far, thr) == \
+                _layouts_cleanup_linear(boxes, copy.deepcopy(layouts), far, thr)
+
+
+def test_candidates_of_empty_and_zero_size_boxes():
+    assert BoxIndex([]).candidates({"x0": 0, "x1": 10, "top": 0, "bottom": 10}) == []
+    flat = [{"x0": 0, "x1": 10, "top": 5, "bottom": 5}, {"x0": 0, "x1": 0, "top": 0, "bottom": 0}]
+    index = BoxIndex(flat)
+    assert index.cell == 10.
+    assert index.candidates({"x0": 0, "x1": 10, "top": 5, "bottom": 5}) == [0, 1]
+    assert index.candidates({"x0": 0, "x1": 10, "top": 40, "bottom": 50}) == []
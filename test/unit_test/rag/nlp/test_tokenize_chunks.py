@@ -0,0 +1,78 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import copy
+import json
+
+import pytest
+
+import rag.nlp
+from rag.nlp import tokenize_chunks, tokenize_chunks_docx, tokenize_table
+
+DOC = {
+    "docnm_kwd": "report.pdf",
+    "title_tks": "report",
+    "title_sm_tks": "report",
+    "important_kwd": ["finance", "2024"],
+    "meta": {"authors": ["a", "b"], "pages": 3},
+    "page": 7,
+    "flag": None,
+}
+CHUNKS = ["First chunk of text.", "  ", "第二个块，中文内容。", "Third @@1\t10.0\t20.0\t30.0\t40.0## chunk"]
+TABLES = [((None, ["r1: a", "r2: b", "r3: c"]), [(0, 1, 2, 3, 4)]),
+          ((None, "<table><tr><td>x</td></tr></table>"), [(1, 1, 2, 3, 4)]),
+          ((None, []), [])]
+
+
+class FakePdf:
+    def crop(self, ck, need_position=False):
+        return None, [(len(ck) % 5, 1.0, 2.0, 3.0, 4.0)]
+
+    def remove_tag(self, txt):
+        return txt.split("@@")[0]
+
+
+@pytest.fixture
+def deepcopied(monkeypatch):
+    """Runs the tokenize_* functions the way they were before doc_copier, with copy.deepcopy(doc)."""
+    def run(fn, *args):
+        with monkeypatch.context() as m:
+            m.setattr(rag.nlp, "doc_copier", lambda doc: lambda: copy.deepcopy(doc))
+            return fn(*args)
+    return run
+
+
+def _bytes(res):
+    return json.dumps(res, ensure_ascii=False).encode("utf-8")
+
+
+@pytest.mark.parametrize("eng", [True, False])
+def test_same_chunks_as_deepcopy(deepcopied, eng):
+    for fn, args in [(tokenize_chunks, (CHUNKS, DOC, eng)),
+                     (tokenize_chunks, (CHUNKS, DOC, eng, FakePdf())),
+                     (tokenize_chunks_docx, (CHUNKS, DOC, eng, [None] * len(CHUNKS))),
+                     (tokenize_table, (TABLES, DOC, eng, 2))]:
+        assert _bytes(fn(*args)) == _bytes(deepcopied(fn, *args))
+
+
+def test_chunks_do_not_share_containers():
+    doc = copy.deepcopy(DOC)
+    res = tokenize_chunks(CHUNKS, doc, True)
+    assert len(res) == 3
+    res[0]["important_kwd"].append("changed")
+    res[0]["meta"]["authors"].append("c")
+    assert res[1]["important_kwd"] == ["finance", "2024"]
+    assert res[1]["meta"] == {"authors": ["a", "b"], "pages": 3}
+    assert doc == DOC
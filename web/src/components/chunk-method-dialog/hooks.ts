@@ -66,8 +66,8 @@ const ParserListMap = new Map([
     ],
   ],
   [['md'], ['naive', 'qa', 'knowledge_graph']],
-  [['json'], ['naive', 'knowledge_graph']],
-  [['eml'], ['email']],
+  [['json', 'jsonl', 'ldjson'], ['naive', 'knowledge_graph']],
+  [['eml', 'mbox', 'mbx'], ['email']],
 ]);
 
 const getParserList = (
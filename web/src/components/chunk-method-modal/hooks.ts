@@ -82,8 +82,11 @@ const ParserListMap = new Map([
       DocumentParserType.KnowledgeGraph,
     ],
   ],
-  [['json'], [DocumentParserType.Naive, DocumentParserType.KnowledgeGraph]],
-  [['eml'], [DocumentParserType.Email]],
+  [
+    ['json', 'jsonl', 'ldjson'],
+    [DocumentParserType.Naive, DocumentParserType.KnowledgeGraph],
+  ],
+  [['eml', 'mbox', 'mbx'], [DocumentParserType.Email]],
 ]);
 
 const getParserList = (